@@ -26,12 +26,14 @@ class GovPmt():
     def __init__(self, plc_base_acres, arcco_base_acres, plc_yield,
                  estimated_county_yield, effective_ref_price,
                  natl_loan_rate, guar_rev_frac, cap_on_bmk_county_rev,
-                 sens_mya_price, benchmark_revenue=None):
+                 sens_mya_price, benchmark_revenue=None, paired=False):
         """
         All inputs are scalars, with the exceptions of estimated_county_yield
         and sens_mya_price, which may be either scalars or numpy arrays.
         If benchmark_revenue is not available, a zero value forces
         any ARC-CO payment to zero, though ARC-CO should not be permitted in this case.
+        If paired, the two arrays have equal length and their elements are taken
+        together, so the payments are array(n) rather than array(np, ny).
         """
         if benchmark_revenue is None:
             benchmark_revenue = 0
@@ -50,6 +52,7 @@ class GovPmt():
         # pre-sensitized mya price
         self.sens_mya_price = sens_mya_price
         self.benchmark_revenue = benchmark_revenue
+        self.paired = paired
 
     # Government Payment Totals
     # -------------------------
@@ -74,7 +77,7 @@ class GovPmt():
         scalar or array(np, ny)
         """
         return (self.plc_payment_rate() * self.net_payment_acres_plc() *
-                self.plc_yield if scal(self.plc_yield) else
+                self.plc_yield if scal(self.plc_yield) or self.paired else
                 np.outer(self.plc_payment_rate() * self.net_payment_acres_plc(),
                          self.plc_yield))
 
@@ -168,6 +171,9 @@ class GovPmt():
         if scal(self.sens_mya_price):
             return (max(self.sens_mya_price, self.natl_loan_rate) *
                     self.estimated_county_yield)
+        elif self.paired:
+            return (np.maximum(self.sens_mya_price, self.natl_loan_rate) *
+                    self.estimated_county_yield)
         else:
             return np.outer(np.maximum(self.sens_mya_price, self.natl_loan_rate),
                             self.estimated_county_yield)
@@ -17,9 +17,12 @@ class Indemnity():
 
     def __init__(self, appryield=165, projected_price=5.5, harvest_futures_price=5.25,
                  rma_cty_expected_yield=None, farm_expected_yield=210,
-                 cty_expected_yield=192):
+                 cty_expected_yield=192, paired=False):
         """
         Initialize the class, setting some useful attributes.
+        If paired, the harvest price and the yields are 1d arrays of equal length
+        whose elements are taken together, and the results have shape (np, 1, ...)
+        rather than (np, ny, ...).
         """
         # RMA Approved Yield (TA/YE adjusted APH yield)
         self.appryield = appryield
@@ -47,8 +50,11 @@ class Indemnity():
         self.indemnity_sco = None
         self.indemnity_eco = None
         self.scal = isinstance(self.farm_expected_yield, numbers.Number)
+        self.paired = paired
         self.np = 1 if self.scal else len(self.harvest_futures_price)
-        self.ny = 1 if self.scal else len(self.farm_expected_yield)
+        self.ny = 1 if self.scal or paired else len(self.farm_expected_yield)
+        # leading shape of yield-sensitized arrays
+        self.ylead = (self.np, 1) if paired else (1, self.ny)
 
     # -----------
     # MAIN METHOD
@@ -76,11 +82,11 @@ class Indemnity():
             harv_indem_per_acre = zeros((self.np, self.ny, 8, 3))
             harv_indem_per_acre[:] = self.revenue_loss()
             harv_indem_per_acre[..., 2] = (self.yield_shortfall() *
-                                           self.projected_price).reshape(1, self.ny, 8)
+                                           self.projected_price).reshape(*self.ylead, 8)
         return harv_indem_per_acre
 
     def yield_shortfall(self):
-        """YO  array(8) or array (ny, 8)
+        """YO  array(8) or array (ny, 8) or array(np, 8) if paired
         Government Crop Insurance L47: Yield-sensitized yield shortfall.
         """
         if self.scal:
@@ -89,7 +95,7 @@ class Indemnity():
         else:
             return np.maximum(
                 self.yield_trigger().reshape(1, 8) -
-                self.farm_expected_yield.reshape(self.ny, 1), 0)
+                self.farm_expected_yield.reshape(-1, 1), 0)
 
     def revenue_loss(self):
         """ array(8, 3) or array(np, ny, 8, 3)
@@ -142,7 +148,7 @@ class Indemnity():
         Government Crop Insurance J45: Sensitized actual revenue.
         """
         return (self.farm_expected_yield * self.ins_harvest_price() if self.scal else
-                np.outer(self.ins_harvest_price(), self.farm_expected_yield))
+                self.outer(self.ins_harvest_price(), self.farm_expected_yield))
 
     def yield_trigger(self):
         """ array(8)
@@ -224,11 +230,11 @@ class Indemnity():
         else:
             rev_yo = np.maximum(
                 (self.yield_trigger_area().reshape(1, 5) -
-                 self.cty_expected_yield.reshape(self.ny, 1)), 0)  # ny, 5
+                 self.cty_expected_yield.reshape(-1, 1)), 0)  # ny, 5
             rev = self.revenue_loss_area()  # np, ny, 5, 3
             pmt_factor = zeros((self.np, self.ny, 5, 3))
             pmt_factor[:] = rev
-            pmt_factor[..., 2] = rev_yo.reshape(1, self.ny, 5)
+            pmt_factor[..., 2] = rev_yo.reshape(*self.ylead, 5)
             pmt_factor /= self.maximum_loss_pmt_area().reshape(self.np, 1, 5, 3)
         return pmt_factor
 
@@ -330,7 +336,12 @@ class Indemnity():
         scalar or array(np, ny)
         """
         return (self.cty_expected_yield * self.ins_harvest_price() if self.scal else
-                np.outer(self.ins_harvest_price(), self.cty_expected_yield))
+                self.outer(self.ins_harvest_price(), self.cty_expected_yield))
+
+    def outer(self, prices, yields):
+        """ array(np, ny) of products, or array(np, 1) if paired """
+        return ((prices * yields).reshape(self.np, 1) if self.paired else
+                np.outer(prices, yields))
 
     def yield_trigger_area(self):
         """
@@ -444,7 +455,7 @@ class Indemnity():
             actual_rev_area[2] *= self.projected_price
         else:
             actual_rev_area = (ones((self.np, self.ny, 3)) *
-                               self.cty_expected_yield.reshape(1, self.ny, 1))
+                               self.cty_expected_yield.reshape(*self.ylead, 1))
             actual_rev_area[..., :2] *= self.ins_harvest_price().reshape(self.np, 1, 1)
             actual_rev_area[..., 2] *= self.projected_price
 
@@ -1,3 +1,4 @@
+import numpy as np
 from django.test import TestCase
 
 from core.models.gov_pmt import GovPmt
@@ -77,3 +78,18 @@ class GovPmtAllARCCOTestCase(TestCase):
         pmt = self.govpmt.prog_pmt_pre_sequest()
         expected = 0
         self.assertEqual(pmt, expected)
+
+
+class GovPmtPairedTestCase(TestCase):
+    def test_paired_matches_grid_diagonal(self):
+        prices = np.array([2.0, 3.2, 3.8, 4.8])
+        yields = np.array([150, 190, 120, 210])
+        args = dict(
+            plc_base_acres=2000, arcco_base_acres=2220, plc_yield=160,
+            estimated_county_yield=yields, effective_ref_price=3.70,
+            natl_loan_rate=2.20, guar_rev_frac=0.9, cap_on_bmk_county_rev=0.12,
+            sens_mya_price=prices, benchmark_revenue=801.09)
+        grid = GovPmt(**args).prog_pmt_pre_sequest()
+        paired = GovPmt(paired=True, **args).prog_pmt_pre_sequest()
+        diag = np.arange(len(prices))
+        self.assertTrue(np.allclose(grid[diag, diag], paired))
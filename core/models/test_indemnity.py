@@ -36,6 +36,20 @@ class IndemnityTestCase(TestCase):
         for idm, exp in zip(indem, expected):
             self.assertTrue(np.allclose(idm, exp))
 
+    def test_paired_matches_grid_diagonal(self):
+        prices = np.array([3.1, 4.6, 5.3475, 7.2, 12.5])
+        farm_yields = np.array([120, 230, 150, 210, 90])
+        cty_yields = np.array([140, 200, 170, 192.1, 100])
+        args = dict(appryield=164, projected_price=5.91,
+                    harvest_futures_price=prices, rma_cty_expected_yield=191.9,
+                    farm_expected_yield=farm_yields, cty_expected_yield=cty_yields)
+        grid = Indemnity(**args).compute_indems()
+        paired = Indemnity(paired=True, **args).compute_indems()
+        diag = np.arange(len(prices))
+        for grd, pr in zip(grid, paired):
+            self.assertEqual(pr.shape[:2], (len(prices), 1))
+            self.assertTrue(np.allclose(grd[diag, diag], pr[:, 0]))
+
     # def test_with_pf_0_7(self):
     #     indem = self.indemnity.compute_indems(pf=0.7)
     #     expected = (
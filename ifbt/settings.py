@@ -71,6 +71,8 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django_cprofile_middleware.middleware.ProfilerMiddleware',
     'construction.middleware.MaintenanceMiddleware',
+    'main.middleware.SpanViewMiddleware',
+    'main.middleware.QueryCountMiddleware',
 ]
 
 ROOT_URLCONF = 'ifbt.urls'
@@ -213,5 +215,92 @@ CKEDITOR_CONFIGS = {
 
 SILENCED_SYSTEM_CHECKS = ['ckeditor.W001']
 
+# Rendered PDFs and coalesced budget and sensitivity results are cached.  PDF jobs
+# are kept in the database, but a deployment with several web worker processes
+# sets a shared cache in settings_local so they share these results, e.g. a
+# FileBasedCache with a LOCATION writable by the web server.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Number of processes used to render PDFs in the background
+PDF_WORKERS = 2
+
+# Show the last stored detailed budget at once and refresh it in the page
+# when its inputs have changed, rather than computing it before responding.
+# The stale budget is recomputed in a background worker process.
+BUDGET_STALE_WHILE_REVALIDATE = True
+
+# Number of processes in each web worker used to recompute stale budgets
+BUDGET_REFRESH_WORKERS = 1
+
+# Pipeline stage timings (see main.models.spans) are logged as JSON lines if
+# the main.spans level is DEBUG
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'main.spans': {'handlers': ['console'], 'level': 'INFO',
+                       'propagate': False},
+        'main.queries': {'handlers': ['console'], 'level': 'WARNING',
+                         'propagate': False},
+    },
+}
+
+# Bearer token a Prometheus scraper sends to read the stage timing histograms
+# at /metrics/ (set it in settings_local).  Staff users can always read them.
+METRICS_TOKEN = ''
+
+# Probabilities of the sensitivity grid cells (see main.models.sens_outcomes).
+# Yield factors are 'normal' or 'lognormal' with a coefficient of variation by
+# farm crop type (corn, fs beans, winter wheat, spring wheat, dc beans).
+SENS_YIELD_DISTRIBUTION = 'normal'
+SENS_YIELD_CV = {1: .15, 2: .13, 3: .15, 4: .17, 5: .2}
+SENS_PRICE_YIELD_CORRELATION = 0
+
+# Monte Carlo simulation of farm cash flow (see main.models.montecarlo), which
+# uses the distributions above.  Correlations are between the harvest prices
+# of market crops, between their county yields and between a farm yield and
+# its county yield; county yields vary less than farm yields by the fraction.
+SIM_PRICE_CORRELATION = .6
+SIM_COUNTY_YIELD_CORRELATION = .5
+SIM_FARM_COUNTY_YIELD_CORRELATION = .7
+SIM_COUNTY_YIELD_CV_FRAC = .6
+
+# Acreage allocation search (see main.models.allocation).  Land acres are
+# divided in steps of ALLOC_STEP of the total, with the share of each farm crop
+# type (corn, fs beans, winter wheat, spring wheat) limited for rotation.
+ALLOC_STEP = .05
+ALLOC_MAX_SHARE = {1: .7, 2: .7, 3: .4, 4: .4}
+
+# Days a budget backtest (see main.models.backtest) served by the web view can
+# cover, so one request can't replay the budget for a whole crop year
+BACKTEST_MAX_DAYS = 92
+
+# Per-request query counting (see main.models.querycount).  A statement run
+# QUERY_REPEAT_THRESHOLD times in one request is logged as a likely N+1
+# pattern.  Views named in QUERY_BUDGETS log a warning when over budget, or
+# raise when QUERY_BUDGET_ENFORCE is set, as the tests do.
+QUERY_COUNT_ENABLED = True
+QUERY_REPEAT_THRESHOLD = 10
+QUERY_BUDGET_ENFORCE = False
+QUERY_BUDGETS = {
+    'farmyears': 10,
+    'dashboard': 15,
+    'farmyear_detail': 20,
+    'farmcrop_list': 40,
+    'marketcrop_list': 30,
+    'fsacrop_list': 20,
+    'detailedbudget': 150,
+    'ajaxbudget': 150,
+    'sensitivity': 200,
+    'sens_table': 200,
+}
+
 # Location-specific settings
 from .settings_local import *  # noqa
@@ -0,0 +1,71 @@
+import json
+import subprocess
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from main.models.benchmark import compare, run_benchmarks
+
+
+class Command(BaseCommand):
+    """
+    Sample usage:
+    mpy benchmark_engines
+    or
+    mpy benchmark_engines --repeat 20 --only Indemnity GovPmt
+
+    Results are appended to a JSON lines file with the current git commit and
+    compared with the last results in the file.  The fixture farm year is
+    created in a transaction which is rolled back.
+    """
+    help = "Times the core engines and budget and sensitivity computations."
+
+    def add_arguments(self, parser):
+        parser.add_argument('-r', '--repeat', type=int, default=5,
+                            help='timed runs per benchmark')
+        parser.add_argument('-o', '--output',
+                            default=str(settings.BASE_DIR / 'benchmarks.jsonl'),
+                            help='file of results to append to and compare with')
+        parser.add_argument('--only', nargs='+',
+                            help='run benchmarks whose names contain these')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            results = run_benchmarks(options['repeat'], options['only'])
+            transaction.set_rollback(True)
+        for name, m in results.items():
+            self.stdout.write(
+                f'{name:40} {1000 * m["median"]:9.2f} ms median '
+                f'{1000 * m["min"]:9.2f} ms min {m["queries"]:5} queries '
+                f'{m["peak_kb"]:9.0f} KB peak')
+        previous = self.last_results(options['output'])
+        if previous is not None:
+            self.stdout.write(f'\nCompared with {previous["commit"][:10]} '
+                              f'({previous["run_on"]}):')
+            for name, now, before, pct in compare(results, previous['results']):
+                style = (self.style.ERROR if pct > 10 else
+                         self.style.SUCCESS if pct < -10 else str)
+                self.stdout.write(style(
+                    f'{name:40} {1000 * before:9.2f} -> {1000 * now:9.2f} ms '
+                    f'({pct:+.1f}%)'))
+        with open(options['output'], 'a') as f:
+            f.write(json.dumps({'commit': self.get_commit(),
+                                'run_on': datetime.now().isoformat(' ', 'seconds'),
+                                'results': results}) + '\n')
+
+    def last_results(self, path):
+        try:
+            with open(path) as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return None
+        return json.loads(lines[-1]) if lines else None
+
+    def get_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return 'unknown'
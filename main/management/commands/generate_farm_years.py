@@ -0,0 +1,57 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from main.models.farm_year import get_current_year
+from main.models.synthetic import FarmYearGenerator, delete_population
+
+
+class Command(BaseCommand):
+    """
+    Sample usage:
+    mpy generate_farm_years 2000 --states 17 18 19 --seed 1
+    or, to remove a population
+    mpy generate_farm_years 0 --delete
+    """
+    help = "Creates synthetic farm years for scale and load testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int, help='number of farm years')
+        parser.add_argument('-y', '--year', type=int,
+                            help='crop year (default current)')
+        parser.add_argument('-s', '--states', nargs='+', type=int,
+                            default=[17, 18, 19],
+                            help='state ids to draw counties from')
+        parser.add_argument('--seed', type=int, help='random seed')
+        parser.add_argument('--prefix', default='synth',
+                            help='username prefix of the synthetic users (prefix-n)')
+        parser.add_argument('--acres', type=int, default=1500,
+                            help='typical total farm acres')
+        parser.add_argument('--delete', action='store_true',
+                            help='first delete the synthetic users with the prefix')
+
+    def handle(self, *args, **options):
+        if options['delete']:
+            deleted = delete_population(options['prefix'])
+            self.stdout.write(f'Deleted {deleted} rows')
+        if options['count'] == 0:
+            return
+        try:
+            generator = FarmYearGenerator(
+                options['year'] or get_current_year(), options['states'],
+                seed=options['seed'], prefix=options['prefix'],
+                mean_acres=options['acres'])
+        except ValueError as ex:
+            raise CommandError(str(ex))
+        start = perf_counter()
+        created, failures = 0, []
+        for farm_year_id, error in generator.generate(options['count']):
+            if error is None:
+                created += 1
+            else:
+                failures.append(error)
+        elapsed = perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {created} farm years in {len(generator.counties)} counties '
+            f'in {elapsed:.1f}s ({created / elapsed:.1f}/s)'))
+        for error in failures:
+            self.stderr.write(f'Failed: {error}')
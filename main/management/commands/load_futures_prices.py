@@ -0,0 +1,138 @@
+import csv
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, transaction
+from ext.models import FuturesContract, FuturesPrice
+from main.models.util import (
+    bump_data_version, dependent_materialized_views, refresh_materialized_view)
+
+COLUMNS = ['croptype', 'exchange', 'futures_month', 'ticker', 'price',
+           'priced_on', 'market_crop_type_id']
+REQUIRED = {'ticker', 'price', 'priced_on'}
+
+
+class Command(BaseCommand):
+    """
+    Sample usage:
+    mpy load_futures_prices prices_2026-10-16.csv prices_2026-10-19.csv
+
+    Each CSV file has a header row naming some of the columns
+    croptype, exchange, futures_month, ticker, price, priced_on and
+    market_crop_type_id; ticker, price and priced_on are required.
+    Missing values are taken from the futures contract with the same ticker.
+    Rows are copied into a staging table and upserted by (ticker, priced_on),
+    which needs a unique index on those columns of ext_futuresprice.
+    """
+    help = "Loads daily futures prices from CSV files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-refresh', action='store_true',
+                            help="don't refresh dependent materialized views")
+        parser.add_argument('files', nargs="+",
+                            help='CSV files of futures prices')
+
+    def handle(self, *args, **options):
+        start = perf_counter()
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                self.create_stage(cursor)
+                for path in options['files']:
+                    self.copy_file(cursor, path)
+                inserted, updated = self.merge(cursor)
+        except (OSError, ValueError, DatabaseError) as ex:
+            raise CommandError(str(ex))
+        self.stdout.write(
+            f'Inserted {inserted} and updated {updated} futures prices '
+            f'in {perf_counter() - start:.2f}s')
+        if inserted + updated == 0:
+            return
+        if not options['no_refresh']:
+            for name in dependent_materialized_views(FuturesPrice._meta.db_table):
+                seconds, concurrently = refresh_materialized_view(name)
+                self.stdout.write(
+                    f'Refreshed {name}{" concurrently" if concurrently else ""} '
+                    f'in {seconds:.2f}s')
+        # cached budgets and sensitivity tables are now stale
+        bump_data_version()
+        self.stdout.write(self.style.SUCCESS('Data version updated'))
+
+    def create_stage(self, cursor):
+        cursor.execute(
+            """CREATE TEMP TABLE futures_stage (
+                 croptype varchar(10), exchange varchar(6),
+                 futures_month varchar(8), ticker varchar(8) NOT NULL,
+                 price double precision NOT NULL, priced_on date NOT NULL,
+                 market_crop_type_id integer) ON COMMIT DROP""")
+
+    def copy_file(self, cursor, path):
+        with open(path, newline='') as f:
+            header = next(csv.reader([f.readline()]), [])
+            columns = [c.strip() for c in header]
+            unknown = set(columns) - set(COLUMNS)
+            if unknown or not REQUIRED <= set(columns):
+                raise ValueError(f'{path}: bad header {header}')
+            # the rest of the file is streamed to the server as is
+            cursor.copy_expert(
+                f'COPY futures_stage ({", ".join(columns)}) '
+                f'FROM STDIN WITH (FORMAT csv)', f)
+
+    def check_unique_index(self, cursor, table):
+        """ ON CONFLICT needs a unique index on (ticker, priced_on) to infer """
+        cursor.execute(
+            """SELECT EXISTS (SELECT 1 FROM pg_index i
+               WHERE i.indrelid = %s::regclass AND i.indisunique
+               AND i.indpred IS NULL AND i.indnatts = 2
+               AND (SELECT array_agg(a.attname::text ORDER BY a.attname)
+                    FROM pg_attribute a WHERE a.attrelid = i.indrelid
+                    AND a.attnum = ANY(i.indkey)) = ARRAY['priced_on', 'ticker'])""",
+            [table])
+        if not cursor.fetchone()[0]:
+            raise CommandError(
+                f'{table} has no unique index on (ticker, priced_on).  Create it '
+                f'with: CREATE UNIQUE INDEX futuresprice_ticker_priced_on '
+                f'ON {table} (ticker, priced_on)')
+
+    def has_id_default(self, cursor, table):
+        """ Whether the id column has a sequence default or is an identity """
+        cursor.execute(
+            """SELECT column_default IS NOT NULL OR is_identity = 'YES'
+               FROM information_schema.columns
+               WHERE table_name = %s AND column_name = 'id'""", [table])
+        row = cursor.fetchone()
+        return row is not None and row[0]
+
+    def merge(self, cursor):
+        """
+        Upsert the staged rows, the last staged row winning for duplicates.
+        Returns the numbers of inserted and updated rows.
+        """
+        table = FuturesPrice._meta.db_table
+        self.check_unique_index(cursor, table)
+        columns, ids = COLUMNS, ''
+        if not self.has_id_default(cursor, table):
+            # number new rows after the largest id, with concurrent loads waiting
+            cursor.execute(f'LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE')
+            columns = ['id'] + COLUMNS
+            ids = (f'(SELECT COALESCE(max(id), 0) FROM {table}) + '
+                   f'row_number() OVER (), ')
+        cursor.execute(
+            f"""INSERT INTO {table} ({", ".join(columns)})
+                SELECT {ids}d.* FROM (
+                  SELECT DISTINCT ON (s.ticker, s.priced_on)
+                    COALESCE(s.croptype, c.croptype) AS croptype,
+                    COALESCE(s.exchange, c.exchange) AS exchange,
+                    COALESCE(s.futures_month, c.futures_month) AS futures_month,
+                    s.ticker, s.price, s.priced_on,
+                    COALESCE(s.market_crop_type_id, c.market_crop_type_id)
+                      AS market_crop_type_id
+                  FROM (SELECT *, row_number() OVER () AS n FROM futures_stage) s
+                  LEFT JOIN {FuturesContract._meta.db_table} c
+                    ON c.ticker = s.ticker
+                  ORDER BY s.ticker, s.priced_on, s.n DESC) d
+                ON CONFLICT (ticker, priced_on) DO UPDATE
+                SET price = EXCLUDED.price
+                WHERE {table}.price IS DISTINCT FROM EXCLUDED.price
+                RETURNING (xmax = 0)""")
+        flags = [row[0] for row in cursor.fetchall()]
+        return sum(flags), len(flags) - sum(flags)
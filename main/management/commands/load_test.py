@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from main.models.farm_year import FarmYear
+from main.models.loadtest import SCRIPTS, ClientDriver, HttpDriver, LoadTest
+from main.models.synthetic import synthetic_users
+
+
+class Command(BaseCommand):
+    """
+    Sample usage, with farm years made by generate_farm_years:
+    mpy load_test --sessions 200 --concurrency 8 --prefix synth
+    or against a local gunicorn using the same database
+    mpy load_test --url http://127.0.0.1:8000 --concurrency 16
+    """
+    help = "Replays user sessions and reports latency per endpoint."
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--sessions', type=int, default=50)
+        parser.add_argument('-c', '--concurrency', type=int, default=4)
+        parser.add_argument('--prefix', default='synth',
+                            help='prefix of the synthetic users whose farm years '
+                            'are used')
+        parser.add_argument('--scripts', nargs='+', choices=list(SCRIPTS),
+                            help='session scripts to choose from (default all)')
+        parser.add_argument('--url', help='base url of a running server; '
+                            'by default requests are made in process')
+        parser.add_argument('--host', default='localhost',
+                            help='host header for in process requests')
+        parser.add_argument('--seed', type=int)
+
+    def handle(self, *args, **options):
+        farm_years = list(FarmYear.objects.select_related('user').filter(
+            user__in=synthetic_users(options['prefix']),
+            farm_crops__planted_acres__gt=0).distinct())
+        if len(farm_years) == 0:
+            raise CommandError(
+                f'No farm years for synthetic users {options["prefix"]}-*')
+        driver = (HttpDriver(options['url']) if options['url'] else
+                  ClientDriver(options['host']))
+        test = LoadTest(driver, farm_years, options['scripts'], options['seed'])
+        elapsed = test.run(options['sessions'], options['concurrency'])
+        rows = test.summary()
+        nreq = sum(row[1] for row in rows)
+        self.stdout.write(
+            f'{"endpoint":18} {"reqs":>6} {"errs":>5} {"p50":>8} {"p90":>8} '
+            f'{"p99":>8} {"max":>8} {"queries":>8}')
+        for name, count, errors, p50, p90, p99, pmax, queries in rows:
+            qstr = '' if queries is None else f'{queries:8.1f}'
+            self.stdout.write(
+                f'{name:18} {count:6} {errors:5} {p50:8.1f} {p90:8.1f} '
+                f'{p99:8.1f} {pmax:8.1f} {qstr}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{nreq} requests in {elapsed:.1f}s ({nreq / elapsed:.1f}/s) with '
+            f'concurrency {options["concurrency"]}; times in ms'))
@@ -0,0 +1,50 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from main.models.batch import get_active_farm_year_ids, recompute_farm_years
+
+
+class Command(BaseCommand):
+    """
+    Sample usage (e.g. nightly from cron after prices are updated):
+    mpy recompute_farm_years
+    or
+    mpy recompute_farm_years --year 2025 --workers 8
+    or
+    mpy recompute_farm_years 101 102 130
+    """
+    help = "Recomputes and stores budgets and sensitivity data for farm years."
+
+    def add_arguments(self, parser):
+        parser.add_argument('-y', '--year', type=int,
+                            help='crop year of the farm years (default current)')
+        parser.add_argument('-w', '--workers', type=int, default=4,
+                            help='number of worker processes')
+        parser.add_argument('farm_year_ids', nargs="*", type=int,
+                            help='ids of farm years (default all active)')
+
+    def handle(self, *args, **options):
+        ids = (options['farm_year_ids'] or
+               get_active_farm_year_ids(options['year']))
+        if options['workers'] < 1:
+            raise CommandError('At least one worker is needed')
+        start = perf_counter()
+        failures = []
+        slowest = (None, 0)
+        for farm_year_id, seconds, error in recompute_farm_years(
+                ids, options['workers']):
+            if error is not None:
+                failures.append((farm_year_id, error))
+            if seconds > slowest[1]:
+                slowest = (farm_year_id, seconds)
+        elapsed = perf_counter() - start
+        rate = len(ids) / elapsed if elapsed > 0 else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Recomputed {len(ids) - len(failures)} of {len(ids)} farm years '
+                f'in {elapsed:.1f}s ({rate:.2f}/s with {options["workers"]} '
+                f'workers).  Slowest: {slowest[0]} ({slowest[1]:.2f}s)'))
+        for farm_year_id, error in failures:
+            self.stderr.write(f'Farm year {farm_year_id} failed: {error}')
+        if failures:
+            raise CommandError(f'{len(failures)} farm years failed')
@@ -0,0 +1,47 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, IntegrityError, connection
+from ext.models import InsurableCropsForCty, PracticeAvail, SubcountyAvail
+from main.models.util import refresh_materialized_view
+
+# in dependency order
+VIEWS = [PracticeAvail, SubcountyAvail, InsurableCropsForCty]
+
+
+class Command(BaseCommand):
+    """
+    Sample usage (e.g. after the annual RMA data load):
+    mpy refresh_insurance_views
+    """
+    help = "Refreshes the insurance availability materialized views."
+
+    def handle(self, *args, **options):
+        start = perf_counter()
+        try:
+            for model in VIEWS:
+                name = model._meta.db_table
+                self.ensure_unique_index(name, model._meta.pk.column)
+                seconds, concurrently = refresh_materialized_view(name)
+                self.stdout.write(
+                    f'Refreshed {name}{" concurrently" if concurrently else ""} '
+                    f'in {seconds:.2f}s')
+        except DatabaseError as ex:
+            raise CommandError(str(ex))
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed {len(VIEWS)} views in {perf_counter() - start:.2f}s'))
+
+    def ensure_unique_index(self, name, column):
+        """
+        A concurrent refresh needs a unique index on the view, which the
+        models' primary key provides.  Building it blocks reads only once.
+        """
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'CREATE UNIQUE INDEX IF NOT EXISTS {name}_{column}_uniq '
+                    f'ON {name} ({column})')
+        except IntegrityError as ex:
+            raise CommandError(
+                f'{name} has duplicate {column} values, so its primary key '
+                f'is not unique; fix the view definition ({ex})')
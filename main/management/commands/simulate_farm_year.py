@@ -0,0 +1,56 @@
+import json
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from main.models.farm_year import FarmYear
+from main.models.montecarlo import CHUNK, SOURCES, FarmSimulation
+
+
+class Command(BaseCommand):
+    """
+    Sample usage:
+    mpy simulate_farm_year 101
+    or
+    mpy simulate_farm_year 101 -n 100000 --seed 1 --source rma --json
+    """
+    help = "Simulates the distribution of a farm year's pre-tax cash flow."
+
+    def add_arguments(self, parser):
+        parser.add_argument('farm_year_id', type=int)
+        parser.add_argument('-n', '--draws', type=int, default=10000,
+                            help='number of draws')
+        parser.add_argument('--chunk', type=int, default=CHUNK,
+                            help='draws evaluated together')
+        parser.add_argument('--seed', type=int, help='random seed')
+        parser.add_argument('--source', choices=SOURCES, default='copula',
+                            help='where the standard normal draws come from')
+        parser.add_argument('--json', action='store_true',
+                            help='print the full summary with histograms')
+
+    def handle(self, *args, **options):
+        try:
+            farm_year = FarmYear.objects.get(pk=options['farm_year_id'])
+        except FarmYear.DoesNotExist:
+            raise CommandError(f'No farm year {options["farm_year_id"]}')
+        if options['draws'] < 1 or options['chunk'] < 1:
+            raise CommandError('Draws and chunk must be positive')
+        start = perf_counter()
+        try:
+            simulation = FarmSimulation(farm_year, seed=options['seed'],
+                                        source=options['source'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        result = simulation.run(options['draws'], options['chunk'])
+        elapsed = perf_counter() - start
+        if options['json']:
+            self.stdout.write(json.dumps(result, indent=2))
+            return
+        self.stdout.write(f'{farm_year}: {options["draws"]} draws in '
+                          f'{elapsed:.1f}s')
+        names = ['mean', 'std', 'q01', 'q05', 'q10', 'q50', 'shortfall',
+                 'prob_loss']
+        self.stdout.write(f'{"":>16}' + ''.join(f'{n:>12}' for n in names))
+        rows = list(result['farm'].items()) + list(result['crops'].items())
+        for label, stats in rows:
+            self.stdout.write(f'{label[:16]:>16}' +
+                              ''.join(f'{stats[n]:>12,.2f}' for n in names))
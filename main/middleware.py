@@ -0,0 +1,57 @@
+import logging
+
+from django.conf import settings
+from django.db import connection
+
+from .models.querycount import QueryBudgetExceeded, QueryCounter, get_budget
+from .models.spans import current_view
+
+logger = logging.getLogger('main.queries')
+
+
+class SpanViewMiddleware:
+    """ Labels the timing spans of a request with the url name of its view """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = current_view.set('')
+        try:
+            return self.get_response(request)
+        finally:
+            current_view.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        current_view.set((match.url_name or '') if match else '')
+
+
+class QueryCountMiddleware:
+    """
+    Counts the queries of a request, logging statements repeated enough times
+    to suggest an N+1 pattern and views over their query budget.  With
+    QUERY_BUDGET_ENFORCE (set in tests) a view over budget raises.  The count
+    is sent in an X-Query-Count header only in DEBUG or when enforcing.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_COUNT_ENABLED:
+            return self.get_response(request)
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        match = request.resolver_match
+        view = (match.url_name or '') if match else ''
+        if settings.DEBUG or settings.QUERY_BUDGET_ENFORCE:
+            response['X-Query-Count'] = counter.total
+        for fp, count in counter.repeats():
+            logger.warning('%s: statement run %d times: %s', view, count, fp)
+        budget = get_budget(view)
+        if budget is not None and counter.total > budget:
+            message = f'{view}: {counter.total} queries, budget {budget}'
+            if settings.QUERY_BUDGET_ENFORCE:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
@@ -0,0 +1,74 @@
+# Generated by Django 6.1 on 2026-10-19 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+ARTIFACT_KINDS = ['sensitivity_data', 'sensitivity_diff', 'sensitivity_text',
+                  'current_budget_data', 'baseline_budget_data', 'budget_text']
+
+
+def copy_artifacts(apps, schema_editor):
+    FarmYear = apps.get_model('main', 'FarmYear')
+    FarmYearArtifact = apps.get_model('main', 'FarmYearArtifact')
+    for kind in ARTIFACT_KINDS:
+        rows = (FarmYear.objects.filter(**{f'{kind}__isnull': False})
+                .values_list('id', kind).iterator())
+        FarmYearArtifact.objects.bulk_create(
+            (FarmYearArtifact(farm_year_id=fyid, kind=kind, data=data)
+             for fyid, data in rows), batch_size=100)
+
+
+def restore_artifacts(apps, schema_editor):
+    FarmYear = apps.get_model('main', 'FarmYear')
+    FarmYearArtifact = apps.get_model('main', 'FarmYearArtifact')
+    for art in FarmYearArtifact.objects.iterator():
+        FarmYear.objects.filter(pk=art.farm_year_id).update(**{art.kind: art.data})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FarmYearArtifact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('sensitivity_data', 'sensitivity data'), ('sensitivity_diff', 'sensitivity diff'), ('sensitivity_text', 'sensitivity text'), ('current_budget_data', 'current budget data'), ('baseline_budget_data', 'baseline budget data'), ('budget_text', 'budget text')], max_length=24)),
+                ('data', models.JSONField(blank=True, null=True)),
+                ('updated_on', models.DateTimeField(auto_now=True)),
+                ('farm_year', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='artifacts', to='main.farmyear')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('farm_year', 'kind'), name='artifact_kind_unique_for_farm_year')],
+            },
+        ),
+        migrations.RunPython(copy_artifacts, restore_artifacts),
+        migrations.RemoveField(
+            model_name='farmyear',
+            name='sensitivity_data',
+        ),
+        migrations.RemoveField(
+            model_name='farmyear',
+            name='sensitivity_diff',
+        ),
+        migrations.RemoveField(
+            model_name='farmyear',
+            name='sensitivity_text',
+        ),
+        migrations.RemoveField(
+            model_name='farmyear',
+            name='current_budget_data',
+        ),
+        migrations.RemoveField(
+            model_name='farmyear',
+            name='baseline_budget_data',
+        ),
+        migrations.RemoveField(
+            model_name='farmyear',
+            name='budget_text',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.1 on 2026-10-19 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0002_farmyearartifact'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='farmyearartifact',
+            name='kind',
+            field=models.CharField(choices=[('sensitivity_data', 'sensitivity data'), ('sensitivity_diff', 'sensitivity diff'), ('sensitivity_text', 'sensitivity text'), ('sensitivity_history', 'sensitivity history'), ('current_budget_data', 'current budget data'), ('baseline_budget_data', 'baseline budget data'), ('budget_text', 'budget text')], max_length=24),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.1 on 2026-10-19 13:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_alter_farmyearartifact_kind'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='farmyear',
+            name='inputs_updated_on',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
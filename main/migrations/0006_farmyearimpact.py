@@ -0,0 +1,48 @@
+# Generated by Django 6.1 on 2026-10-19 15:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def index_farm_crops(apps, schema_editor):
+    FarmCrop = apps.get_model('main', 'FarmCrop')
+    FarmYearImpact = apps.get_model('main', 'FarmYearImpact')
+    rows = (FarmCrop.objects
+            .values_list('farm_year_id', 'farm_year__crop_year',
+                         'farm_year__state_id', 'farm_year__county_code',
+                         'farm_crop_type__ins_crop_id',
+                         'market_crop__market_crop_type_id',
+                         'market_crop__fsa_crop__fsa_crop_type_id')
+            .iterator())
+    FarmYearImpact.objects.bulk_create(
+        (FarmYearImpact(farm_year_id=fyid, crop_year=year, state_id=state,
+                        county_code=county, ins_crop_id=crop,
+                        market_crop_type_id=mct, fsa_crop_type_id=fct)
+         for fyid, year, state, county, crop, mct, fct in rows), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_alter_farmyearartifact_kind'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FarmYearImpact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('crop_year', models.SmallIntegerField()),
+                ('state_id', models.SmallIntegerField()),
+                ('county_code', models.SmallIntegerField()),
+                ('ins_crop_id', models.SmallIntegerField()),
+                ('market_crop_type_id', models.SmallIntegerField()),
+                ('fsa_crop_type_id', models.SmallIntegerField()),
+                ('farm_year', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='impacts', to='main.farmyear')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['crop_year', 'state_id', 'county_code', 'ins_crop_id'], name='impact_county_crop'), models.Index(fields=['crop_year', 'market_crop_type_id'], name='impact_market_crop_type'), models.Index(fields=['crop_year', 'fsa_crop_type_id'], name='impact_fsa_crop_type')],
+            },
+        ),
+        migrations.RunPython(index_farm_crops, migrations.RunPython.noop),
+    ]
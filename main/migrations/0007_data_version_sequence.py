@@ -0,0 +1,15 @@
+# Generated by Django 6.1 on 2026-10-19 17:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_farmyearimpact'),
+    ]
+
+    operations = [
+        migrations.RunSQL('CREATE SEQUENCE main_data_version',
+                          'DROP SEQUENCE main_data_version'),
+    ]
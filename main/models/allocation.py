@@ -0,0 +1,209 @@
+"""
+Module allocation
+
+Searches allocations of a farm year's planted acres among its farm crops for
+the efficient frontier of expected cash flow against downside cash flow (the
+mean over the worst alpha fraction of the sensitivity grid).
+
+Over the sensitivity grid, a crop's revenue beyond its contracts, its
+indemnities, its ARC/PLC payment and its costs other than premium are
+proportional to its acres, so each crop has a per acre cash flow array computed
+once with the vectorized engine.  Contract revenue and other farm income and
+expense don't depend on the allocation.  Premiums per acre depend on acres
+through the enterprise discount size class (Premium.sizeidx), so they are
+computed once for each class.  A batch of candidate allocations is then
+evaluated with a matrix product, without rebuilding any budget.
+
+Candidates divide the land acres (those of crops other than double crops) in
+steps of a fraction of the total, with each crop type's share limited for
+rotation as configured in settings.  A double crop keeps its current ratio to
+the acres of the crop it follows.
+"""
+from itertools import combinations
+
+import numpy as np
+from django.conf import settings
+
+from .sens_outcomes import GridWeights
+from .sens_table import SensTableGroup
+from .util import lower_tail_mean
+
+BATCH = 256
+# lower acre bounds of the Premium.sizeidx classes after the first
+SIZE_BOUNDS = [50, 100, 200, 400, 800]
+SIZE_ACRES = [25, 75, 150, 300, 600, 1000]
+# double crop farm crop types and the types they follow
+FOLLOWS = {5: 3}
+
+
+def compositions(total, parts):
+    """ Every list of parts nonnegative integers summing to total """
+    for bars in combinations(range(total + parts - 1), parts - 1):
+        edges = (-1,) + bars + (total + parts - 1,)
+        yield [b - a - 1 for a, b in zip(edges[:-1], edges[1:])]
+
+
+def total_premium(fc):
+    """ The selected premium in $/acre from the farm crop's premium arrays """
+    if fc.crop_ins_prems is None:
+        return 0
+    return fc.get_total_premiums(fc.get_selected_ins_items(
+        {key: np.array(v) for key, v in fc.crop_ins_prems.items()}))
+
+
+def size_class(acres):
+    """ The Premium.sizeidx class of acres, array-wise """
+    return np.searchsorted(SIZE_BOUNDS, acres, side='right')
+
+
+class AcreageOptimizer(object):
+    """
+    Evaluates acre allocations for the farm crops of a sensitivity table group.
+    The grid cells are weighted uniformly or, if weighted, by their
+    probabilities for the farm (see sens_outcomes).
+    """
+    def __init__(self, farm_year, weighted=False, step=None):
+        self.farm_year = farm_year
+        self.grp = SensTableGroup(farm_year)
+        self.farm_crops = self.grp.farm_crops
+        self.pfrange, self.yfrange = self.grp.pfrange, self.grp.yfrange
+        self.step = settings.ALLOC_STEP if step is None else step
+        self.fac = np.array([fc.is_fac() for fc in self.farm_crops], dtype=bool)
+        self.acres = np.array([fc.planted_acres for fc in self.farm_crops])
+        self.total_acres = self.acres[~self.fac].sum()
+        ncells = len(self.pfrange) * len(self.yfrange)
+        self.weights = (GridWeights(self.grp).for_crops(self.farm_crops).ravel()
+                        if weighted else np.full(ncells, 1 / ncells))
+        self.premiums = np.array([self.get_premiums(fc) for fc in self.farm_crops])
+        self.per_acre = None
+        self.prem_factors = None
+        self.fixed = None
+        if len(self.farm_crops) > 0:
+            self.set_outcomes()
+
+    @staticmethod
+    def get_premiums(fc):
+        """
+        The selected premium in $/acre for each size class, the current class
+        using the current acres.  Premiums stored for past crop years are used
+        for every class.
+        """
+        if fc.old_farm_year():
+            return [total_premium(fc)] * len(SIZE_ACRES)
+        acres, prems = fc.planted_acres, fc.crop_ins_prems
+        current = size_class(acres)
+        result = []
+        try:
+            for k, class_acres in enumerate(SIZE_ACRES):
+                fc.planted_acres = acres if k == current else class_acres
+                fc.set_prems()
+                result.append(total_premium(fc))
+        finally:
+            fc.planted_acres, fc.crop_ins_prems = acres, prems
+        return result
+
+    def set_outcomes(self):
+        """
+        Set the per acre cash flow without premiums and the cost factor scaling
+        premiums, each array(nfc, ncells), and the part of the farm cash flow
+        not proportional to acres, array(ncells), all in dollars
+        """
+        pf, yf = self.pfrange, self.yfrange
+        title = self.farm_year.calc_gov_pmt(
+            is_per_acre=True, mya_prices=self.grp.mya_prices,
+            cty_yields=self.grp.cty_yields)
+        per_acre, factors = [], []
+        for fc, prems in zip(self.farm_crops, self.premiums):
+            fbc = fc.farmbudgetcrop
+            yields = fc.sens_farm_expected_yield(yf)
+            revenue = (np.outer(fc.sens_harvest_price(pf), yields) +
+                       yields * fc.assumed_basis_for_new() +
+                       fbc.other_gov_pmts + fbc.other_revenue)
+            factor = np.ones((len(pf), 1)) * (1 + fc.yield_adj_to_nonland_costs(yf))
+            cost = (fc.total_cost(pf=pf, yf=yf) -
+                    prems[size_class(fc.planted_acres)] * factor)
+            per_acre.append(revenue + fc.get_total_indemnities(pf=pf, yf=yf) +
+                            (0 if fc.is_fac() else title) - cost)
+            factors.append(factor)
+        self.per_acre = np.array(per_acre).reshape(len(self.farm_crops), -1)
+        self.prem_factors = np.array(factors).reshape(len(self.farm_crops), -1)
+        cashflow = np.array(self.grp.compute_current_data()[4])[self.grp.nfcs]
+        if cashflow.ndim == 3:
+            cashflow = cashflow[..., self.grp.nst]
+        self.fixed = (cashflow.ravel() * 1000 -
+                      self.variable_cashflows(self.acres[np.newaxis])[0])
+
+    def variable_cashflows(self, allocations):
+        """
+        The parts of farm cash flows proportional to acres within premium size
+        classes, array(n, ncells) for allocations array(n, nfc)
+        """
+        premiums = self.premiums[np.arange(len(self.farm_crops)),
+                                 size_class(allocations)]
+        return (allocations @ self.per_acre -
+                (allocations * premiums) @ self.prem_factors)
+
+    def cashflows(self, allocations):
+        """ Farm cash flows array(n, ncells) for allocations array(n, nfc) """
+        return self.fixed + self.variable_cashflows(allocations)
+
+    def get_candidates(self):
+        """ Allocations array(n, nfc) meeting the rotation constraints """
+        land = np.flatnonzero(~self.fac)
+        units = max(int(round(1 / self.step)), 1)
+        shares = np.array(list(compositions(units, len(land)))) / units
+        limits = np.array([settings.ALLOC_MAX_SHARE.get(
+            self.farm_crops[i].farm_crop_type_id, 1) for i in land])
+        shares = shares[(shares <= limits + 1e-9).all(axis=1)]
+        allocations = np.zeros((len(shares), len(self.farm_crops)))
+        allocations[:, land] = shares * self.total_acres
+        types = [fc.farm_crop_type_id for fc in self.farm_crops]
+        for i in np.flatnonzero(self.fac):
+            follows = FOLLOWS.get(types[i])
+            if follows in types:
+                j = types.index(follows)
+                ratio = (0 if self.acres[j] == 0 else
+                         min(self.acres[i] / self.acres[j], 1))
+                allocations[:, i] = ratio * allocations[:, j]
+            else:
+                allocations[:, i] = self.acres[i]
+        return allocations
+
+    def get_stats(self, allocations, alpha):
+        """ Expected, downside and worst cash flows, each array(n) """
+        expected, downside, worst = [], [], []
+        for start in range(0, len(allocations), BATCH):
+            cashflows = self.cashflows(allocations[start:start + BATCH])
+            expected.append(cashflows @ self.weights)
+            downside.append(lower_tail_mean(cashflows.T, self.weights, alpha))
+            worst.append(cashflows.min(axis=1))
+        return [np.concatenate(stat) for stat in (expected, downside, worst)]
+
+    def optimize(self, alpha=.2):
+        """
+        The current allocation and the efficient frontier, each allocation with
+        its acres by crop and its statistics, from highest expected cash flow
+        to highest downside cash flow
+        """
+        if len(self.farm_crops) == 0 or self.total_acres == 0:
+            return {'total_acres': 0, 'evaluated': 0, 'current': None,
+                    'frontier': []}
+        candidates = self.get_candidates()
+        expected, downside, worst = self.get_stats(candidates, alpha)
+        frontier, best = [], -np.inf
+        for j in np.lexsort((-downside, -expected)):
+            if downside[j] > best:
+                frontier.append(j)
+                best = downside[j]
+        current = self.get_stats(self.acres[np.newaxis], alpha)
+        return {'total_acres': round(self.total_acres),
+                'evaluated': len(candidates),
+                'current': self.describe(self.acres, *(s[0] for s in current)),
+                'frontier': [self.describe(candidates[j], expected[j], downside[j],
+                                           worst[j]) for j in frontier]}
+
+    def describe(self, acres, expected, downside, worst):
+        return {'acres': {str(fc): round(ac) for fc, ac in
+                          zip(self.farm_crops, acres)},
+                'expected': round(expected), 'downside': round(downside),
+                'worst': round(worst)}
@@ -0,0 +1,226 @@
+"""
+Module backtest
+
+Replays a farm year's budget at each trading day from its first date to today,
+as if each day were the model run date, giving a time series of the key budget
+lines so growers can see how their projected cash flow evolved.
+
+The farm crops with their reference data, the contract dates and the harvest
+futures prices of the whole period are loaded once.  Each day only the
+components whose inputs changed since the day before are recomputed: contract
+statistics when a contract date is passed, premiums when the projected price
+or price volatility changes and the ARC/PLC payment when an MYA price estimate
+or county yield changes.  Revenue, indemnities and costs follow cheaply from
+these and are rebuilt daily by BudgetTable.  Nothing is saved; the model run
+date is set on the farm year in memory only.
+"""
+from bisect import bisect_right
+from collections import Counter
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from core.models.util import get_postgres_rows
+from ext.models import FuturesPrice
+from .budget_table import BudgetTable
+from .farm_crop import FarmCrop
+from .fsa_crop import cty_expected_yield_helper
+from .market_crop import Contract, get_contract_stats
+
+LINES = ['crop_revenue', 'gov_pmt', 'crop_ins_indems', 'gross_revenue',
+         'crop_ins_prems', 'total_cost', 'cash_flow']
+
+TICKERS = """
+    SELECT ticker, contract_end_date, last_contract_end_date
+    FROM ext_tickers_for_crop_location
+    WHERE crop_year=%s and state_id=%s and county_code=%s
+    and market_crop_type_id=%s
+    ORDER BY contract_end_date
+    """
+
+
+def as_date(dt):
+    return dt.date() if hasattr(dt, 'date') else dt
+
+
+class FuturesPriceHistory(object):
+    """
+    Harvest futures prices of a market crop type for a farm year's location by
+    date, with the contract chosen as in MarketCrop.harvest_futures_price_info
+    """
+    def __init__(self, farm_year, market_crop_type_id, end):
+        self.contracts = get_postgres_rows(
+            TICKERS, farm_year.crop_year, farm_year.state_id,
+            farm_year.county_code, market_crop_type_id)
+        self.prices = {}
+        for ticker, priced_on, price in (
+                FuturesPrice.objects
+                .filter(ticker__in=[row[0] for row in self.contracts],
+                        priced_on__lte=end)
+                .order_by('priced_on').values_list('ticker', 'priced_on', 'price')):
+            dates, prices = self.prices.setdefault(ticker, ([], []))
+            dates.append(priced_on)
+            prices.append(price)
+
+    def ticker(self, date):
+        return next((ticker for ticker, end, last in self.contracts
+                     if date <= end or end == last), None)
+
+    def price(self, date):
+        """ The last price on or before the date, or None """
+        dates, prices = self.prices.get(self.ticker(date), ([], []))
+        i = bisect_right(dates, date)
+        return None if i == 0 else prices[i - 1]
+
+    def trading_days(self, start, end):
+        return {date for dates, prices in self.prices.values() for date in dates
+                if start <= date <= end}
+
+
+class BudgetBacktest(object):
+    """
+    Evaluates the budget of a farm year's planted farm crops with budgets for
+    each trading day from start (default the first date) to end (default today),
+    covering at most max_days days before the end if given.
+    Acts as the budget manager of the BudgetTable it builds each day.
+    """
+    def __init__(self, farm_year, start=None, end=None, max_days=None):
+        self.farm_year = farm_year
+        today = datetime.today().date()
+        first = as_date(farm_year.first_date)
+        self.start = first if start is None else max(start, first)
+        self.end = today if end is None else min(end, today)
+        if max_days is not None:
+            self.start = max(self.start, self.end - timedelta(days=max_days))
+        self.farm_crops = [fc for fc in
+                           farm_year.farm_crops.select_related(
+                               'farm_crop_type', 'market_crop')
+                           if fc.has_budget() and fc.planted_acres > 0]
+        FarmCrop.prefetch_reference_data(farm_year, self.farm_crops)
+        self.market_crops = [fc.market_crop for fc in self.farm_crops]
+        self.histories = {
+            mct: FuturesPriceHistory(farm_year, mct, self.end)
+            for mct in {mc.market_crop_type_id for mc in self.market_crops}}
+        self.contract_dates = sorted(set(
+            Contract.objects.filter(market_crop__in=[mc.pk for mc in
+                                                     self.market_crops])
+            .values_list('contract_date', flat=True)))
+        self.fsa_crops = list(farm_year.fsa_crops.all())
+        # read by BudgetTable
+        self.total_premiums = None
+        self.keys = {}
+        self.values = {}
+        self.computed = Counter()
+
+    def trading_days(self):
+        return sorted(set().union(*(h.trading_days(self.start, self.end)
+                                    for h in self.histories.values())))
+
+    def reuse(self, component, key, compute):
+        """ The component's value, computed only if its inputs have changed """
+        if component not in self.values or self.keys[component] != key:
+            self.keys[component] = key
+            self.values[component] = compute()
+            self.computed[component[0] if isinstance(component, tuple) else
+                          component] += 1
+        return self.values[component]
+
+    def set_date(self, date):
+        """
+        Make the date the model run date, clearing the date dependent memos and
+        setting the harvest prices from the history.  False if a price is missing.
+        """
+        self.farm_year.is_model_run_date_manual = True
+        self.farm_year.manual_model_run_date = date
+        for fc in self.farm_crops:
+            fc.indem_price_yield_data_scal_mem = None
+            fc.indem_price_yield_data_vec_mem = None
+            fc.sens_cty_expected_yield_mem = None
+            mc = fc.market_crop
+            mc.harvest_futures_price_info_mem = (
+                self.histories[mc.market_crop_type_id].price(date))
+            if mc.harvest_futures_price_info_mem is None:
+                return False
+        stats = self.reuse('contracts', bisect_right(self.contract_dates, date),
+                           lambda: get_contract_stats(self.farm_year,
+                                                      self.market_crops))
+        for mc in self.market_crops:
+            mc.contract_stats_mem = stats[mc.pk]
+        return True
+
+    @staticmethod
+    def get_total_premium(fc):
+        """ Premium in $/acre as in FarmCrop.get_crop_ins_prems, without saving """
+        if not fc.old_farm_year():
+            fc.set_prems()
+        prems = (None if fc.crop_ins_prems is None else
+                 {k: np.array(v) for k, v in fc.crop_ins_prems.items()})
+        return fc.get_total_premiums({'base': 0, 'sco': 0, 'eco': 0}
+                                     if prems is None else
+                                     fc.get_selected_ins_items(prems))
+
+    def cty_expected_yield(self, fsa):
+        """ As FsaCrop.cty_expected_yield, from the farm crops on the date """
+        crops = [fc for fc in self.farm_crops
+                 if fc.market_crop.fsa_crop_id == fsa.pk]
+        return cty_expected_yield_helper(
+            [fc.sens_cty_expected_yield() for fc in crops],
+            [fc.planted_acres for fc in crops], 1)[0]
+
+    def get_title(self):
+        """
+        The capped ARC/PLC payment per farm acre.  The MYA prices and county
+        yields on the date are passed in, as by SensTableGroup, since
+        calc_gov_pmt would otherwise load the fsa crops' farm crops afresh.
+        """
+        mya_prices = np.array([[fsa.sens_mya_price()] for fsa in self.fsa_crops])
+        cty_yields = np.array([[self.cty_expected_yield(fsa)]
+                               for fsa in self.fsa_crops])
+        key = (tuple(mya_prices.ravel()), tuple(cty_yields.ravel()))
+        # array(1), or a scalar without fsa crops
+        return self.reuse('title', key, lambda: self.farm_year.calc_gov_pmt(
+            is_per_acre=True, mya_prices=mya_prices, cty_yields=cty_yields).sum())
+
+    def evaluate(self, date):
+        """
+        A dict with the totals of the key budget lines in dollars, the cash flow
+        of each crop and the harvest futures prices on the date, or None if
+        prices are missing
+        """
+        if not self.set_date(date):
+            return None
+        premiums = []
+        for fc in self.farm_crops:
+            data = fc.indem_price_yield_data()
+            key = (data['pp'][0], int(round(data['pv'][0] * 100)))
+            premiums.append(self.reuse(('premium', fc.pk), key,
+                                       lambda fc=fc: self.get_total_premium(fc)))
+        self.total_premiums = premiums
+        bt = BudgetTable(self.farm_year, self)
+        # set by get_tables, which also formats the tables
+        bt.farmyear_gov_pmt = self.get_title()
+        bt.set_data()
+        result = {'date': date.isoformat()}
+        result.update({line: round(sum(bt.data[line])) for line in LINES})
+        result['crops'] = {str(fc): round(cf) for fc, cf in
+                           zip(self.farm_crops, bt.data['cash_flow'])}
+        result['prices'] = {str(mc): mc.harvest_futures_price_info_mem
+                            for mc in self.market_crops}
+        return result
+
+    def run(self):
+        """
+        The time series as a list of dicts by date, with the farm year's model
+        run date restored afterwards
+        """
+        saved = (self.farm_year.is_model_run_date_manual,
+                 self.farm_year.manual_model_run_date)
+        try:
+            if len(self.farm_crops) == 0:
+                return []
+            return [row for row in (self.evaluate(date)
+                                    for date in self.trading_days())
+                    if row is not None]
+        finally:
+            (self.farm_year.is_model_run_date_manual,
+             self.farm_year.manual_model_run_date) = saved
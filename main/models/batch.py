@@ -0,0 +1,74 @@
+"""
+Module batch
+
+Recomputes and stores the budget and sensitivity artifacts of many farm years,
+partitioned across worker processes.  Each worker sets up Django and opens its
+own database connection, so nothing is shared with the parent process but the
+farm year ids and the results.  The worker tasks are in main.workers, which
+spawned workers can import before Django is set up.  Stale current budgets shown
+by the detailed budget page are recomputed the same way, in a small pool kept by
+each web worker process.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.db import connection
+
+from main.workers import init_worker, recompute_budget, recompute_farm_year
+from .farm_year import FarmYear, get_current_year
+
+
+def get_active_farm_year_ids(crop_year=None):
+    """ Ids of the farm years for the crop year that have planted crops """
+    return list(FarmYear.objects
+                .filter(crop_year=crop_year or get_current_year(),
+                        farm_crops__planted_acres__gt=0)
+                .distinct().order_by('pk').values_list('pk', flat=True))
+
+
+refresh_executor = None
+# futures of the budget refreshes submitted by this process, by farm year id
+refreshes = {}
+
+
+def get_init_args():
+    return (os.environ.get('DJANGO_SETTINGS_MODULE', 'ifbt.settings'),
+            connection.settings_dict['NAME'])
+
+
+def submit_budget_refresh(farm_year_id):
+    """
+    Recompute a farm year's current budget in a background worker process,
+    unless this process already has a refresh of it under way.  The pool is
+    created on first use in each web worker process.
+    """
+    global refresh_executor
+    future = refreshes.get(farm_year_id)
+    if future is not None and not future.done():
+        return future
+    if refresh_executor is None:
+        refresh_executor = ProcessPoolExecutor(
+            max_workers=getattr(settings, 'BUDGET_REFRESH_WORKERS', 1),
+            mp_context=get_context('spawn'), initializer=init_worker,
+            initargs=get_init_args())
+    future = refresh_executor.submit(recompute_budget, farm_year_id)
+    refreshes[farm_year_id] = future
+    future.add_done_callback(lambda f: refreshes.pop(farm_year_id, None))
+    return future
+
+
+def recompute_farm_years(farm_year_ids, workers=4, chunksize=8):
+    """
+    Yield the result of recompute_farm_year for each id in order, as the
+    workers complete them.
+    """
+    initargs = get_init_args()
+    # the parent's connection must not be shared with the workers
+    connection.close()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'),
+                             initializer=init_worker,
+                             initargs=initargs) as executor:
+        yield from executor.map(recompute_farm_year, farm_year_ids,
+                                chunksize=chunksize)
@@ -0,0 +1,141 @@
+"""
+Module benchmark
+
+Times the core actuarial engines and the budget and sensitivity computations
+on fixed inputs, recording wall times, database query counts and peak traced
+memory, so results can be compared between commits.  The farm year fixture is
+created in the database, so run_benchmarks should be called in a transaction
+which is rolled back.  Premium lookups need the prem_data function loaded.
+"""
+import statistics
+import tracemalloc
+from datetime import datetime
+from time import perf_counter
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from core.models.gov_pmt import GovPmt
+from core.models.indemnity import Indemnity
+from core.models.premium import Premium
+from .budget_table import BudgetManager
+from .farm_crop import FarmCrop
+from .farm_year import FarmYear
+from .sens_table import SensTableGroup
+
+PFRANGE = np.array([.5, .6, .7, .8, .9, .95, 1, 1.05,
+                    1.1, 1.2, 1.3, 1.4, 1.5, 1.6, 1.7])
+YFRANGE = np.array([.5, .6, .7, .8, .9, .95, 1, 1.05, 1.1])
+
+
+def measure(func, repeat=5):
+    """
+    Call func repeat times for wall times, then once more counting queries
+    and the peak memory traced by tracemalloc.
+    """
+    times = []
+    for i in range(repeat):
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+    with CaptureQueriesContext(connection) as ctx:
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {'min': min(times), 'median': statistics.median(times),
+            'queries': len(ctx.captured_queries), 'peak_kb': peak / 1024}
+
+
+def make_farm_year():
+    """ A four crop farm year in Madison County, IL with budgets and contracts """
+    dt = datetime(2026, 7, 9)
+    user = User.objects.create(username='benchmark', password='benchmark')
+    farm_year = FarmYear.objects.create(
+        user=user, farm_name='Benchmark Farm', state_id=17, county_code=119,
+        crop_year=2026)
+    FarmYear.objects.filter(pk=farm_year.pk).update(
+        cropland_acres_owned=2400, cash_rented_acres=2000,
+        var_rent_cap_floor_frac=.1, annual_land_int_expense=150000,
+        annual_land_principal_pmt=500000, property_taxes=250000,
+        land_repairs=100000, eligible_persons_for_cap=2,
+        other_nongrain_expense=140000, other_nongrain_income=150000,
+        is_model_run_date_manual=True, manual_model_run_date=dt,
+        variable_rented_acres=1000)
+    farm_year = FarmYear.objects.get(pk=farm_year.pk)
+    for fct, acres, aph, budget in ((1, 2500, 195, 69), (2, 2500, 69, 71),
+                                    (3, 400, 82, 73), (5, 400, 50, 74)):
+        farm_year.farm_crops.filter(farm_crop_type_id=fct).update(
+            planted_acres=acres, appr_yield=aph, adj_yield=aph, rate_yield=aph,
+            ye=True, ta=True, coverage_type=1, product_type=0,
+            base_coverage_level=.8)
+        fc = farm_year.farm_crops.get(farm_crop_type_id=fct)
+        FarmCrop.add_farm_budget_crop(fc.pk, budget)
+    for mct, price in ((1, 3.5), (2, 13.2), (3, 7.1)):
+        mc = farm_year.market_crops.get(market_crop_type_id=mct)
+        mc.assumed_basis_for_new = .1
+        mc.save()
+        mc.contracts.create(contract_date=dt, bushels=40000, futures_price=price)
+        mc.contracts.create(contract_date=dt, bushels=20000, basis_price=.1)
+    for fsact, plc, arc, plcy in ((1, 1250, 1250, 180), (2, 1000, 2250, 58),
+                                  (3, 500, 0, 65)):
+        farm_year.fsa_crops.filter(fsa_crop_type_id=fsact).update(
+            plc_base_acres=plc, arcco_base_acres=arc, plc_yield=plcy)
+    return FarmYear.objects.get(pk=farm_year.pk)
+
+
+def get_benchmarks(farm_year):
+    """ (name, function) pairs; each function runs one engine call """
+    def gov_pmt(mya_price, cty_yield):
+        return GovPmt(
+            plc_base_acres=1250, arcco_base_acres=1250, plc_yield=180,
+            estimated_county_yield=cty_yield, effective_ref_price=4.10,
+            natl_loan_rate=2.20, guar_rev_frac=0.9, cap_on_bmk_county_rev=0.12,
+            sens_mya_price=mya_price, benchmark_revenue=801.09)
+
+    def indemnity(harvest_price, farm_yield, cty_yield):
+        return Indemnity(
+            appryield=195, projected_price=4.66, harvest_futures_price=harvest_price,
+            rma_cty_expected_yield=191.9, farm_expected_yield=farm_yield,
+            cty_expected_yield=cty_yield)
+
+    return [
+        ('Premium.compute_prems', lambda: Premium().compute_prems(
+            rateyield=195, adjyield=195, appryield=205, acres=2500, ta=True,
+            ye=True, state=17, county=119, crop=41, croptype=16, practice=3)),
+        ('Indemnity.compute_indems scalar',
+         lambda: indemnity(4.2, 210, 192).compute_indems()),
+        ('Indemnity.compute_indems 15x9',
+         lambda: indemnity(4.66 * PFRANGE, 210 * YFRANGE,
+                           192 * YFRANGE).compute_indems()),
+        ('GovPmt.prog_pmt_pre_sequest scalar',
+         lambda: gov_pmt(3.8, 190).prog_pmt_pre_sequest()),
+        ('GovPmt.prog_pmt_pre_sequest 15x9',
+         lambda: gov_pmt(4.2 * PFRANGE, 190 * YFRANGE).prog_pmt_pre_sequest()),
+        ('SensTableGroup.compute_current_data',
+         lambda: SensTableGroup(farm_year).compute_current_data()),
+        # calc_current_budget shares results for unchanged inputs, so time the
+        # computation it wraps
+        ('BudgetManager.calc_current_budget',
+         lambda: BudgetManager(farm_year).compute_current_budget()),
+    ]
+
+
+def run_benchmarks(repeat=5, names=None):
+    """
+    Return a dict mapping benchmark names to their measurements.
+    names optionally restricts the benchmarks to those containing a substring.
+    """
+    farm_year = make_farm_year()
+    return {name: measure(func, repeat) for name, func in get_benchmarks(farm_year)
+            if names is None or any(n in name for n in names)}
+
+
+def compare(current, previous):
+    """ (name, median, previous median, percent change) for common benchmarks """
+    return [(name, m['median'], previous[name]['median'],
+             100 * (m['median'] / previous[name]['median'] - 1))
+            for name, m in current.items()
+            if name in previous and previous[name]['median'] > 0]
@@ -1,5 +1,6 @@
 import io
 from datetime import datetime
+from types import SimpleNamespace
 
 from reportlab.pdfgen import canvas
 from reportlab.lib import colors
@@ -470,6 +471,16 @@ class BudgetPdf(object):
                      rowHeights=self.get_bt_rowheights())
 
 
+def render_budget_pdf(farm_name, crop_year, budget_text, budget_type):
+    """
+    Render a budget from plain data, so it can run in a worker process
+    without Django.  Returns the PDF bytes.
+    """
+    farm_year = SimpleNamespace(farm_name=farm_name, crop_year=crop_year,
+                                budget_text=budget_text)
+    return BudgetPdf(farm_year, budget_type).create().getvalue()
+
+
 class BudgetDocTemplate(BaseDocTemplate):
     """A document template for the Detailed budget and friends.
     """
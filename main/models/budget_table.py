@@ -1,3 +1,9 @@
+from .farm_crop import FarmCrop
+from .market_crop import MarketCrop
+from .spans import span
+from .util import single_flight
+
+
 class BudgetManager(object):
     """
     1. Manages caching and retrieval of numerical data for baseline budget.
@@ -15,12 +21,19 @@ class BudgetManager(object):
     """
     def __init__(self, farm_year):
         self.farm_year = farm_year
+        self.farm_year.prefetch_artifacts('current_budget_data',
+                                          'baseline_budget_data')
         self.budget_table = None
         self.key_data = None
 
         # data common to at least two of budget, revenue, keydata
-        self.farm_crops = [fc for fc in self.farm_year.farm_crops.all()
+        self.farm_crops = [fc for fc in
+                           self.farm_year.farm_crops.select_related(
+                               'farm_crop_type', 'market_crop')
                            if fc.has_budget() and fc.planted_acres > 0]
+        FarmCrop.prefetch_reference_data(self.farm_year, self.farm_crops)
+        MarketCrop.prefetch_contract_stats(
+            self.farm_year, [fc.market_crop for fc in self.farm_crops])
         self.ci_info = [fc.get_selected_premiums() for fc in self.farm_crops]
         self.total_premiums = [fc.get_total_premiums(sel) for sel, fc in
                                zip(self.ci_info, self.farm_crops)]
@@ -29,19 +42,31 @@ class BudgetManager(object):
         """
         Main non-AJAX method.  Generates and stores data for current budget.
         Generates and stores the current budget into budget text.
-        Returns the current budget.
+        Returns the current budget.  Concurrent calls for a farm year with the
+        same inputs compute it once.
+        """
+        budget = single_flight('budget', self.farm_year, self.compute_current_budget)
+        if budget['tables'] is not None:
+            self.farm_year.budget_text = budget
+        return budget
+
+    def compute_current_budget(self):
+        """
+        The uncoordinated body of calc_current_budget, which stores the result
+        into budget text
         """
         cur_budget = self.build_current_budget()
         if cur_budget['tables'] is None:
             return cur_budget
         valid_baseline = self.has_valid_baseline()
         cur_budget['info']['has_valid_baseline'] = valid_baseline
-        self.farm_year.budget_text = (None if cur_budget['tables'] is None
-                                      else cur_budget)
-        if not valid_baseline:
+        if not valid_baseline and self.farm_year.baseline_budget_data is not None:
             self.farm_year.baseline_budget_data = None
-        self.farm_year.save()
-        return self.farm_year.budget_text
+        # lets a later request tell whether it can serve this budget unchanged
+        cur_budget['info']['version'] = self.farm_year.version_token(
+            'baseline_budget_data')
+        self.farm_year.current_budget_text = cur_budget
+        return cur_budget
 
     def get_current_budget(self):
         """
@@ -52,7 +77,6 @@ class BudgetManager(object):
         cur_budget['info']['has_valid_baseline'] = self.has_valid_baseline()
         self.farm_year.budget_text = (None if cur_budget['tables'] is None
                                       else cur_budget)
-        self.farm_year.save()
         return self.farm_year.budget_text
 
     def get_baseline_budget(self):
@@ -66,7 +90,6 @@ class BudgetManager(object):
                                           else bl_budget)
         else:
             self.farm_year.budget_text = None
-        self.farm_year.save()
         return self.farm_year.budget_text
 
     def get_variance_budget(self):
@@ -81,7 +104,6 @@ class BudgetManager(object):
                 var_budget)
         else:
             self.farm_year.budget_text = None
-        self.farm_year.save()
         return self.farm_year.budget_text
 
     def has_valid_baseline(self):
@@ -324,10 +346,11 @@ class BudgetTable(object):
         self.farmyear_gov_pmt = self.farm_year.calc_gov_pmt(is_per_acre=True)
         if self.data is None:
             self.set_data()
-        results = {'kd': self.make_thousands(),
-                   'pa': self.make_peracre(),
-                   'pb': self.make_perbushel(), }
-        wheatdc = self.make_wheatdc()
+        with span('table_format'):
+            results = {'kd': self.make_thousands(),
+                       'pa': self.make_peracre(),
+                       'pb': self.make_perbushel(), }
+            wheatdc = self.make_wheatdc()
         if wheatdc is not None:
             results['wheatdc'] = wheatdc
         return results
@@ -766,6 +789,7 @@ class KeyData(object):
         self.farm_crops = mgr.farm_crops
         self.ci_info = mgr.ci_info
         self.market_crops_all = [mc for mc in self.farm_year.market_crops.all()]
+        MarketCrop.prefetch_contract_stats(self.farm_year, self.market_crops_all)
         self.market_crops = [mc for mc in self.market_crops_all if mc.pk in
                              [fc.market_crop_id for fc in self.farm_crops]]
         self.fsa_crops = [fsc for fsc in self.farm_year.fsa_crops.all()]
@@ -1,13 +1,17 @@
 import io
-from itertools import chain, zip_longest
+from itertools import chain, groupby
 from datetime import datetime
 
 from reportlab.lib import colors
 from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.platypus.doctemplate import SimpleDocTemplate
 from reportlab.platypus.flowables import Spacer, KeepTogether
 from reportlab.platypus.tables import Table
 
+from .market_crop import (
+    MarketCrop, get_planted_market_crops, get_farm_year_contracts)
+
 # Global constants
 FS = 9             # regular fontsize
 HFS = 11           # header fontsize
@@ -24,10 +28,7 @@ UL = 0.25          # border width for grid
 BK = colors.black
 FONT = 'Helvetica'
 FONTBOLD = 'Helvetica-Bold'
-
-
-def mergeTwo(l1, l2):
-    return [x for x in chain(*zip_longest(l1, l2)) if x is not None]
+CHUNK = 40         # contract rows per table chunk
 
 
 def fmtdate(date):
@@ -67,21 +68,28 @@ def basisbushels(bu, basisprice):
 class ContractPdf(object):
     def __init__(self, farm_year):
         self.farm_year = farm_year
-        self.market_crops = [mc for mc in farm_year.market_crops.all()
-                             if mc.planted_acres() > 0]
-        self.contracts = [(i, [c for c in mc.get_contracts()
-                               if c.futures_price is not None
-                               or c.basis_price is not None])
+        self.market_crops = list(
+            get_planted_market_crops(farm_year).select_related('market_crop_type'))
+        for mc in self.market_crops:
+            mc.planted_acres_mem = mc.acres
+        MarketCrop.prefetch_contract_stats(farm_year, self.market_crops)
+        priced = (c for c in get_farm_year_contracts(farm_year).iterator(
+                  chunk_size=2000)
+                  if c.futures_price is not None or c.basis_price is not None)
+        by_crop = {mcid: list(cts) for mcid, cts in
+                   groupby(priced, key=lambda c: c.market_crop_id)}
+        self.contracts = [(i, by_crop.get(mc.pk, []))
                           for i, mc in enumerate(self.market_crops)]
         self.tables = []
 
     def create(self):
         buffer = io.BytesIO()
         self.get_tables()
-        objects_to_draw = (
-            [Spacer(1*inch, 1*inch)] +
-            mergeTwo([KeepTogether([t]) for t in self.tables],
-                     [Spacer(.25*inch, .25*inch)]*(len(self.tables)-1)))
+        objects_to_draw = [Spacer(1*inch, 1*inch)]
+        for i, chunks in enumerate(self.tables):
+            if i > 0:
+                objects_to_draw.append(Spacer(.25*inch, .25*inch))
+            objects_to_draw += [KeepTogether(chunks)] if len(chunks) == 1 else chunks
         doc_template = SimpleDocTemplate(
             buffer, pagesize=(11*inch, 8.5*inch),
             leftMargin=0.25*inch, rightMargin=0.25*inch,
@@ -98,7 +106,9 @@ class ContractPdf(object):
 
     def get_table(self, mcidx, contracts):
         """ Given a marketcrop index and a list of contract objects,
-            construct a formatted table
+            construct a formatted table as a list of tables of at most CHUNK
+            contract rows.  Laying out many small tables is much cheaper for
+            reportlab than splitting one long table across pages.
         """
         mc = self.market_crops[mcidx]
         expected_total_bu = mc.expected_total_bushels()
@@ -112,10 +122,11 @@ class ContractPdf(object):
         avg_basis_price = mc.avg_basis_contract_price()
         crop = str(mc)
         title = f'{crop} Contracts'
-        rows = [[title, '', '', '', '', '', '', '', ''],
+        head = [[title, '', '', '', '', '', '', '', ''],
                 ['Contract Date', 'Futures Bushels', 'Futures Price',
                  'Basis Bushels', 'Basis Price', 'Terminal', 'Contract #',
                  'Delivery Start', 'Delivery End']]
+        rows = []
         for ct in contracts:
             rows.append(
                 [fmtdate(ct.contract_date),
@@ -125,54 +136,75 @@ class ContractPdf(object):
                  fmtprice(ct.basis_price),
                  ct.terminal, ct.contract_number,
                  fmtdate(ct.delivery_start_date), fmtdate(ct.delivery_end_date)])
-        rows.append(['Totals', fmttotbushels(futures_total_bu),
+        foot = []
+        foot.append(['Totals', fmttotbushels(futures_total_bu),
                      fmttotprice(avg_futures_price), fmttotbushels(basis_total_bu),
                      fmttotprice(avg_basis_price), '', '', '', ''])
-        rows.append(['' , '' , '' , '' , '' , '' , '' , '' , ''])
-        rows.append(['Total Estimated Bu.', f'{expected_total_bu:,.0f}',
+        foot.append(['' , '' , '' , '' , '' , '' , '' , '' , ''])
+        foot.append(['Total Estimated Bu.', f'{expected_total_bu:,.0f}',
                      '', f'{expected_total_bu:,.0f}', '', '', '', '', ''])
-        rows.append(['% Contracted', f'{futures_pct_of_expected:.0%}',
+        foot.append(['% Contracted', f'{futures_pct_of_expected:.0%}',
                      '', f'{basis_pct_of_expected:.0%}', '', '', '', '', ''])
-        rows.append(['Remaining Bu.', f'{remaining_futures_bu:,.0f}',
+        foot.append(['Remaining Bu.', f'{remaining_futures_bu:,.0f}',
                      '', f'{remaining_basis_bu:,.0f}', '', '', '', '', ''])
 
-        return Table(rows, hAlign='CENTER', style=self.get_styles(),
-                     rowHeights=self.get_rowheights(len(rows)))
-
-    def get_styles(self):
+        colwidths = self.get_colwidths(head[1:], rows + foot)
+        chunks = [rows[i:i+CHUNK] for i in range(0, len(rows), CHUNK)] or [[]]
+        chunks[0] = head + chunks[0]
+        chunks[-1] = chunks[-1] + foot
+        return [Table(chunk, hAlign='CENTER', colWidths=colwidths,
+                      style=self.get_styles(i == 0, i == len(chunks)-1),
+                      rowHeights=self.get_rowheights(len(chunk)))
+                for i, chunk in enumerate(chunks)]
+
+    def get_colwidths(self, headrows, rows):
+        """ Widths fitting the widest cell in each column, shared by all chunks """
+        return [max(chain((stringWidth(r[j], FONTBOLD, FS) for r in headrows),
+                          (stringWidth(r[j], FONT, FS) for r in rows))) + 2*HP
+                for j in range(len(headrows[0]))]
+
+    def get_styles(self, first=True, last=True):
         """
-        Get all styles for table
+        Get all styles for table, or for the first and/or last chunk of a table
         """
         styles = [
-            # Table title
-            ('FONT', (0, 0), (-1, 0), FONTBOLD, FS, FS),
-            ('SPAN', (0, 0), (-1, 0)),
-            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-            # Column headers
-            ('FONT', (0, 1), (-1, 1), FONTBOLD, FS, FS),
-            ('ALIGN', (0, 1), (-1, 1), 'CENTER'),
             # Data
-            ('FONT', (0, 2), (-1, -1), FONT, FS, FS),
+            ('FONT', (0, 2 if first else 0), (-1, -1), FONT, FS, FS),
             ('RIGHTPADDING', (0, 0), (-1, -1), HP),
             ('LEFTPADDING', (0, 0), (-1, -1), HP),
             # Contract Date
-            ('ALIGN', (0, 2), (0, -1), 'LEFT'),
+            ('ALIGN', (0, 2 if first else 0), (0, -1), 'LEFT'),
             # Bushels, Price
-            ('ALIGN', (1, 2), (4, -1), 'RIGHT'),
+            ('ALIGN', (1, 2 if first else 0), (4, -1), 'RIGHT'),
             # Terminal, Contract #, Delivery Start, Delivery End
-            ('ALIGN', (5, 2), (-1, -1), 'LEFT'),
-            # borders above and below column headers
-            ('LINEABOVE', (0, 1), (-1, 1), UL, BK),
-            ('LINEBELOW', (0, 1), (-1, 1), UL, BK),
-            # border above totals
-            ('LINEABOVE', (1, -5), (4, -5), UL, BK),
-            ('LINEABOVE', (0, -3), (-1, -3), UL, BK),
+            ('ALIGN', (5, 2 if first else 0), (-1, -1), 'LEFT'),
             # Table border
-            ('LINEABOVE', (0, 0), (-1, 0), BORD, BK),
-            ('LINEBELOW', (0, -1), (-1, -1), BORD, BK),
             ('LINEBEFORE', (0, 0), (0, -1), BORD, BK),
             ('LINEAFTER', (-1, 0), (-1, -1), BORD, BK),
         ]
+        if first:
+            styles += [
+                # Table title
+                ('FONT', (0, 0), (-1, 0), FONTBOLD, FS, FS),
+                ('SPAN', (0, 0), (-1, 0)),
+                ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+                # Column headers
+                ('FONT', (0, 1), (-1, 1), FONTBOLD, FS, FS),
+                ('ALIGN', (0, 1), (-1, 1), 'CENTER'),
+                # borders above and below column headers
+                ('LINEABOVE', (0, 1), (-1, 1), UL, BK),
+                ('LINEBELOW', (0, 1), (-1, 1), UL, BK),
+                # Table border
+                ('LINEABOVE', (0, 0), (-1, 0), BORD, BK),
+            ]
+        if last:
+            styles += [
+                # border above totals
+                ('LINEABOVE', (1, -5), (4, -5), UL, BK),
+                ('LINEABOVE', (0, -3), (-1, -3), UL, BK),
+                # Table border
+                ('LINEBELOW', (0, -1), (-1, -1), BORD, BK),
+            ]
         return styles
 
     def get_rowheights(self, nrows):
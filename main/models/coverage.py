@@ -0,0 +1,201 @@
+"""
+Module coverage
+
+Ranks every allowed crop insurance selection (coverage type, product type, base
+coverage level, SCO use and ECO level) for the farm crops over the sensitivity
+grid.  The premium and indemnity engines give full (level x product) arrays for
+enterprise, area, SCO and ECO coverage, which are indexed here for all the
+combinations at once, so nothing is recomputed per selection.
+
+A selection changes a crop's cash flow by its indemnity less its premium; the
+premium is a nonland cost, so it scales with the yield adjustment to costs.
+FS and DC beans must share a selection, so they are ranked together.
+"""
+import numpy as np
+
+from .farm_crop import FarmCrop
+from .sens_outcomes import GridWeights
+from .sens_table import SensTableGroup
+from .util import lower_tail_mean
+
+FARM_LEVELS = [.5, .55, .6, .65, .7, .75, .8, .85]
+COUNTY_LEVELS = [.7, .75, .8, .85, .9]
+ECO_LEVELS = [None, .9, .95]
+RANKINGS = ['expected', 'downside']
+
+
+def get_combinations():
+    """
+    Every (coverage type, product type, base coverage level, sco use, eco level)
+    selection.  SCO requires farm (enterprise) coverage and an ECO level must be
+    above the base coverage level.
+    """
+    return [(ct, pt, level, sco, eco)
+            for ct, levels in ((FarmCrop.FARM, FARM_LEVELS),
+                               (FarmCrop.COUNTY, COUNTY_LEVELS))
+            for pt, name in FarmCrop.PRODUCT_TYPES
+            for level in levels
+            for sco in ((False, True) if ct == FarmCrop.FARM else (False,))
+            for eco in ECO_LEVELS
+            if eco is None or eco > level]
+
+
+COMBINATIONS = get_combinations()
+IS_FARM = np.array([c[0] == FarmCrop.FARM for c in COMBINATIONS])
+PRODUCT = np.array([c[1] for c in COMBINATIONS])
+SCO_USE = np.array([c[3] for c in COMBINATIONS])
+HAS_ECO = np.array([c[4] is not None for c in COMBINATIONS])
+# indices into the level axes of the engine arrays
+BASE_IDX = np.array([round((c[2] - (.5 if c[0] == FarmCrop.FARM else .7)) / .05)
+                     for c in COMBINATIONS])
+SCO_IDX = np.array([round((c[2] - .5) / .05) for c in COMBINATIONS])
+ECO_IDX = np.array([0 if c[4] is None else round((c[4] - .9) / .05)
+                    for c in COMBINATIONS])
+
+
+def available(ar):
+    """ Insurance items can't be computed for some crops and types """
+    return ar is not None and np.ndim(ar) >= 2
+
+
+def combine(items, prot_factor):
+    """
+    Sum the base, SCO and ECO items (premiums array(lvl, pt) or indemnities
+    array(np, ny, lvl, pt) by insurance type) for every combination, giving
+    array(ncombos) or array(np, ny, ncombos).  Combinations needing an item
+    which is unavailable are nan.
+    """
+    shape = next(ar for ar in items.values() if available(ar)).shape[:-2]
+    total = np.full(shape + (len(COMBINATIONS),), np.nan)
+    for key, mask, factor in (('Farm', IS_FARM, 1),
+                              ('County', ~IS_FARM, prot_factor)):
+        if available(items[key]):
+            total[..., mask] = items[key][..., BASE_IDX[mask], PRODUCT[mask]] * factor
+    for key, mask, idx in (('SCO', SCO_USE, SCO_IDX), ('ECO', HAS_ECO, ECO_IDX)):
+        total[..., mask] += (items[key][..., idx[mask], PRODUCT[mask]]
+                             if available(items[key]) else np.nan)
+    return total
+
+
+class CoverageOptimizer(object):
+    """
+    Evaluates the insurance combinations for the farm crops of a sensitivity
+    table group.  The (price factor, yield factor) cells are weighted uniformly
+    or, if weighted, by their probabilities for the crops (see sens_outcomes).
+    """
+    def __init__(self, farm_year, weighted=False):
+        self.farm_year = farm_year
+        self.grp = SensTableGroup(farm_year)
+        self.pfrange, self.yfrange = self.grp.pfrange, self.grp.yfrange
+        self.grid_weights = GridWeights(self.grp) if weighted else None
+
+    def get_weights(self, crops):
+        if self.grid_weights is not None:
+            return self.grid_weights.for_crops(crops)
+        return np.full((len(self.pfrange), len(self.yfrange)),
+                       1 / (len(self.pfrange) * len(self.yfrange)))
+
+    def get_groups(self):
+        """ Lists of farm crops which share an insurance selection """
+        groups = {}
+        for fc in self.grp.farm_crops:
+            groups.setdefault('beans' if fc.is_beans() else fc.pk, []).append(fc)
+        return list(groups.values())
+
+    def get_crop_cashflows(self):
+        """ array(nfc, np, ny) crop cash flows in dollars with no basis change """
+        cashflow = np.array(self.grp.compute_current_data()[4])[:self.grp.nfcs]
+        if cashflow.ndim == 4:
+            cashflow = cashflow[..., self.grp.nst]
+        return cashflow * 1000
+
+    def get_crop_effects(self, fc):
+        """
+        The change in the crop's cash flow in $/acre due to insurance for every
+        combination, array(np, ny, ncombos), with nan for combinations not
+        allowed for the crop, and for the current selection, array(np, ny).
+        Returns (None, None) if premiums can't be computed.
+        """
+        prems = fc.get_crop_ins_prems()
+        if prems is None or not any(available(ar) for ar in prems.values()):
+            return None, None
+        indems = fc.get_indemnities(pf=self.pfrange, yf=self.yfrange)
+        cost_factor = (1 + fc.yield_adj_to_nonland_costs(self.yfrange)).reshape(1, -1)
+        prem = combine(prems, fc.prot_factor)
+        prem[~np.isfinite(prem)] = np.nan
+        effects = (combine(indems, fc.prot_factor) -
+                   prem * cost_factor.reshape(1, -1, 1))
+        if 4 not in fc.area_plans():
+            effects[..., ~IS_FARM] = np.nan
+        if (fc.farm_year.crop_year < 2026 and
+                fc.market_crop.fsa_crop.arcco_base_acres > 0):
+            effects[..., SCO_USE] = np.nan
+        current = (sum(fc.get_selected_ins_items(indems).values()) -
+                   fc.get_total_premiums(fc.get_selected_ins_items(prems)) *
+                   cost_factor)
+        return effects, current
+
+    @staticmethod
+    def get_stats(effects, cashflows, weights, alpha):
+        """
+        The expected net benefit, the mean cash flow over the worst alpha
+        fraction of the grid and the worst cash flow, each array(n), for
+        effects and cashflows array(np, ny, n) in dollars
+        """
+        weights = weights.ravel()
+        n = effects.shape[-1]
+        cashflows = cashflows.reshape(-1, n)
+        return (weights @ effects.reshape(-1, n),
+                lower_tail_mean(cashflows, weights, alpha),
+                cashflows.min(axis=0))
+
+    def rank(self, by='expected', alpha=.2, top=None):
+        """
+        A dict for each group of crops, with the statistics of the current
+        selection and of the top allowed combinations, best first by expected
+        net benefit or by downside cash flow.
+        """
+        if by not in RANKINGS:
+            raise ValueError(f'Unexpected ranking {by}')
+        cashflows = self.get_crop_cashflows()
+        result = []
+        for crops in self.get_groups():
+            effects = [self.get_crop_effects(fc) for fc in crops]
+            if any(eff is None for eff, cur in effects):
+                continue
+            acres = [fc.planted_acres for fc in crops]
+            combined = sum(eff * ac for (eff, cur), ac in zip(effects, acres))
+            current = sum(cur * ac for (eff, cur), ac in zip(effects, acres))
+            base = sum(cashflows[self.grp.farm_crops.index(fc)] for fc in crops)
+            base = (base - current).reshape(len(self.pfrange), -1, 1)
+            allowed = ~np.isnan(combined).any(axis=(0, 1))
+            weights = self.get_weights(crops)
+            expected, downside, worst = self.get_stats(
+                combined, base + combined, weights, alpha)
+            cur_stats = self.get_stats(current[..., np.newaxis],
+                                       base + current[..., np.newaxis], weights,
+                                       alpha)
+            key = expected if by == 'expected' else downside
+            order = [j for j in np.argsort(-key) if allowed[j]][:top]
+            fc = crops[0]
+            selected = (fc.coverage_type, fc.product_type, fc.base_coverage_level,
+                        fc.sco_use, fc.eco_level)
+            result.append({
+                'crops': [str(fc) for fc in crops],
+                'acres': sum(acres),
+                'current': {'expected': round(cur_stats[0][0]),
+                            'downside': round(cur_stats[1][0]),
+                            'worst': round(cur_stats[2][0])},
+                'options': [self.describe(j, expected, downside, worst, selected)
+                            for j in order]})
+        return result
+
+    @staticmethod
+    def describe(j, expected, downside, worst, selected):
+        ct, pt, level, sco, eco = COMBINATIONS[j]
+        return {'coverage_type': dict(FarmCrop.COVERAGE_TYPES)[ct],
+                'product_type': dict(FarmCrop.PRODUCT_TYPES)[pt],
+                'base_coverage_level': level, 'sco_use': sco, 'eco_level': eco,
+                'expected': round(expected[j]), 'downside': round(downside[j]),
+                'worst': round(worst[j]),
+                'selected': COMBINATIONS[j] == selected}
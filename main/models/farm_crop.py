@@ -1,3 +1,4 @@
+from collections import defaultdict
 from datetime import datetime
 import numpy as np
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
@@ -12,12 +13,13 @@ from ext.models import (Subcounty, SubcountyAvail, FarmCropType, InsCropType,
                         HarvDiscoveryPrices)
 from core.models.premium import Premium
 from core.models.indemnity import Indemnity
-from .farm_year import FarmYear
+from .farm_year import FarmYear, FarmYearInputMixin
 from .market_crop import MarketCrop
-from .util import any_changed, scal, one_like, zero_like
+from .spans import span
+from .util import ChangeTrackingMixin, any_changed, scal, one_like, zero_like
 
 
-class FarmCrop(models.Model):
+class FarmCrop(ChangeTrackingMixin, FarmYearInputMixin, models.Model):
     """
     Farm crop-specific data.  A column in the operator input sheet.
     It holds references to the associated market_crop and farm_year models
@@ -31,6 +33,8 @@ class FarmCrop(models.Model):
         (.5, '50%'), (.55, '55%'), (.6, '60%'), (.65, '65%'),
         (.7, '70%'), (.75, '75%'), (.8, '80%'), (.85, '85%'), (.9, '90%'), ]
     COVERAGE_LEVELS_ECO = [(.9, '90%'), (.95, '95%'), ]
+    # premiums saved by get_crop_ins_prems don't change the inputs
+    derived_fields = ('crop_ins_prems', 'prems_computed_for')
 
     @staticmethod
     def add_farm_budget_crop(farm_crop_id, budget_crop_id):
@@ -51,6 +55,31 @@ class FarmCrop(models.Model):
         FarmBudgetCrop.objects.filter(
             farm_crop=farm_crop_id)[0].delete()
 
+    @staticmethod
+    def prefetch_reference_data(farm_year, farm_crops):
+        """
+        Load the PriceYield and AreaRate rows needed by the farm crops of a farm year
+        with one query each and hand them to the farm crops, so premium, indemnity
+        and county yield computations do no per-crop lookups.
+        """
+        price_yields = {
+            (py.crop_id, py.crop_type_id, py.practice): py
+            for py in PriceYield.objects.filter(
+                crop_year=farm_year.crop_year, state_id=farm_year.state_id,
+                county_code=farm_year.county_code)}
+        area_plans = defaultdict(set)
+        for crop_id, crop_type_id, practice, plan_id in (
+                AreaRate.objects.filter(state_id=farm_year.state_id,
+                                        county_code=farm_year.county_code)
+                .values_list('crop_id', 'crop_type_id', 'practice',
+                             'insurance_plan_id')):
+            area_plans[(crop_id, crop_type_id, practice)].add(plan_id)
+        for fc in farm_crops:
+            key = (fc.farm_crop_type.ins_crop_id, fc.ins_crop_type_id, fc.ins_practice)
+            # a missing row falls through to the single lookup, which raises
+            fc.price_yield_mem = price_yields.get(key)
+            fc.area_plans_mem = area_plans[key]
+
     planted_acres = models.FloatField(
         default=0, validators=[MinVal(0), MaxVal(99999)],)
     appr_yield = models.FloatField(
@@ -138,6 +167,8 @@ class FarmCrop(models.Model):
         so we must cache vector and scalar results separately.
         """
         self.has_budget_mem = None
+        self.price_yield_mem = None
+        self.area_plans_mem = None
         self.indem_price_yield_data_scal_mem = None
         self.indem_price_yield_data_vec_mem = None
         self.sens_cty_expected_yield_mem = None
@@ -174,17 +205,34 @@ class FarmCrop(models.Model):
     # ------------------------
     def allowed_coverage_types(self):
         covtypes = ([(1, 'Farm (enterprise)')]
-                    if AreaRate.objects.filter(
-                        state_id=self.farm_year.state_id,
-                        county_code=self.farm_year.county_code,
-                        crop_id=self.farm_crop_type.ins_crop_id,
-                        crop_type_id=self.ins_crop_type_id,
-                        practice=self.ins_practice,
-                        insurance_plan_id=4).count() == 0
+                    if 4 not in self.area_plans()
                     else FarmCrop.COVERAGE_TYPES[:])
         covtypes.insert(0, ('', '-'*9))
         return covtypes
 
+    def area_plans(self):
+        """ set of insurance plan ids with area rates for the crop/type/practice """
+        if self.area_plans_mem is None:
+            self.area_plans_mem = set(AreaRate.objects.filter(
+                state_id=self.farm_year.state_id,
+                county_code=self.farm_year.county_code,
+                crop_id=self.farm_crop_type.ins_crop_id,
+                crop_type_id=self.ins_crop_type_id,
+                practice=self.ins_practice).values_list('insurance_plan_id', flat=True))
+        return self.area_plans_mem
+
+    def price_yield(self):
+        """ RMA price and yield data for the crop/type/practice """
+        if self.price_yield_mem is None:
+            self.price_yield_mem = PriceYield.objects.get(
+                crop_year=self.farm_year.crop_year,
+                state_id=self.farm_year.state_id,
+                county_code=self.farm_year.county_code,
+                crop_id=self.farm_crop_type.ins_crop_id,
+                crop_type_id=self.ins_crop_type_id,
+                practice=self.ins_practice)
+        return self.price_yield_mem
+
     def coverage_type_name(self):
         return (None if self.coverage_type is None else
                 dict(FarmCrop.COVERAGE_TYPES)[self.coverage_type])
@@ -275,6 +323,7 @@ class FarmCrop(models.Model):
         return (None if self.crop_ins_prems is None else
                 {k: np.array(v) for k, v in self.crop_ins_prems.items()})
 
+    @span('premium')
     def set_prems(self):
         """
         Note: price_volatility factor and projected_price are ignored
@@ -316,6 +365,7 @@ class FarmCrop(models.Model):
     # Crop Ins Indemnity-related methods
     # values in $/acre
     # ----------------------------------
+    @span('price_lookup')
     def indem_price_yield_data(self, pf=None, yf=None):
         """
         Returns a dict where some values may be scalar or array(np, ny)
@@ -332,13 +382,8 @@ class FarmCrop(models.Model):
             crop_year = self.farm_year.crop_year
             state_id = self.farm_year.state_id
             county_code = self.farm_year.county_code
-            crop_id = self.farm_crop_type.ins_crop_id
-            crop_type_id = self.ins_crop_type_id
-            practice = self.ins_practice
             market_crop_type_id = self.market_crop.market_crop_type_id
-            py = PriceYield.objects.get(
-                crop_year=crop_year, state_id=state_id, county_code=county_code,
-                crop_id=crop_id, crop_type_id=crop_type_id, practice=practice)
+            py = self.price_yield()
             mrd = self.farm_year.get_model_run_date()
             # projected price discovery
             pre_proj_discov = mrd <= self.proj_price_disc_start
@@ -395,6 +440,7 @@ class FarmCrop(models.Model):
                 self.indem_price_yield_data_vec_mem = result
         return result
 
+    @span('indemnity')
     def get_indemnities(self, pf=None, yf=None):
         """ scalar or 2d array """
         data = self.indem_price_yield_data(pf=pf, yf=yf)
@@ -466,13 +512,7 @@ class FarmCrop(models.Model):
                 ctyyield = self.farmbudgetcrop.county_yield
                 result = ctyyield * (one_like(yf) if yieldfinal else yf)
                 if self.farm_year.get_model_run_date() > self.cty_yield_final:
-                    py = PriceYield.objects.get(
-                        crop_year=self.farm_year.crop_year,
-                        state_id=self.farm_year.state_id,
-                        county_code=self.farm_year.county_code,
-                        crop_id=self.farm_crop_type.ins_crop_id,
-                        crop_type_id=self.ins_crop_type_id,
-                        practice=self.ins_practice)
+                    py = self.price_yield()
                     if py.final_yield is not None:
                         result = py.final_yield * one_like(yf)
                         is_rma_final = True
@@ -516,15 +556,20 @@ class FarmCrop(models.Model):
     # -----------------------------------------------
     # Revenue methods (return values in $ by default)
     # -----------------------------------------------
-    def gross_rev_no_title_indem(self, pf=None, yf=None, bf=None):
-        """ array(np, ny, nb) or array(np, ny) used only by sensitivity """
+    def gross_rev_no_title_indem(self, pf=None, yf=None, bf=None, paired=False):
+        """
+        array(np, ny, nb) or array(np, ny) used by sensitivity, or array(np) if
+        paired, i.e. the price and yield factors are taken together (simulation)
+        """
         acres = self.planted_acres
         if not self.has_budget() or acres == 0:
-            if bf is None:
+            if paired:
+                return np.zeros(len(pf))
+            elif bf is None:
                 return np.zeros((len(pf), len(yf)))
             else:
                 return np.zeros((len(pf), len(yf), len(bf)))
-        return (self.grain_revenue(pf=pf, yf=yf, bf=bf) +
+        return (self.grain_revenue(pf=pf, yf=yf, bf=bf, paired=paired) +
                 (self.farmbudgetcrop.other_gov_pmts +
                  self.farmbudgetcrop.other_revenue) * acres)
 
@@ -534,9 +579,9 @@ class FarmCrop(models.Model):
     def contract_basis_revenue(self, yf=None):
         return self.basis_contracted_bu(yf) * self.avg_basis_contract_price()
 
-    def noncontract_fut_revenue(self, pf=None, yf=None):
-        """ 2d array or scalar """
-        if scal(pf):
+    def noncontract_fut_revenue(self, pf=None, yf=None, paired=False):
+        """ 2d array or scalar, or 1d array if paired """
+        if scal(pf) or paired:
             result = self.sens_fut_uncontracted_bu(yf) * self.sens_harvest_price(pf)
         else:
             result = np.outer(self.sens_harvest_price(pf),
@@ -551,15 +596,15 @@ class FarmCrop(models.Model):
             return np.outer(self.sens_basis_uncontracted_bu(yf),
                             self.assumed_basis_for_new(bf))
 
-    def frac_rev_excess(self, pf=None, yf=None):
+    def frac_rev_excess(self, pf=None, yf=None, paired=False):
         """
         scalar or array(np, ny) fraction revenue excess or (shortfall)
-        used by both budget and sensitivity.
+        used by both budget and sensitivity, or array(np) if paired.
         """
         data = self.indem_price_yield_data(pf=pf, yf=yf)
         base_rev = (self.planted_acres *
                     self.farmbudgetcrop.baseline_yield_for_var_rent * data['pp'][0])
-        if scal(pf):
+        if scal(pf) or paired:
             sens_rev = (self.planted_acres * self.sens_farm_expected_yield(yf=yf) *
                         data['hp'][0])
         else:
@@ -568,12 +613,15 @@ class FarmCrop(models.Model):
         result = (0 if base_rev == 0 else (sens_rev - base_rev) / base_rev)
         return result
 
-    def grain_revenue(self, pf=None, yf=None, bf=None):
-        """ scalar or array(pf, yf) or array(pf, yf, bf) used by sensitivity, others """
-        if scal(pf):
+    def grain_revenue(self, pf=None, yf=None, bf=None, paired=False):
+        """
+        scalar or array(pf, yf) or array(pf, yf, bf) used by sensitivity, others,
+        or array(pf) if paired
+        """
+        if scal(pf) or paired:
             return (self.contract_fut_revenue(yf=yf) +
                     self.contract_basis_revenue(yf=yf) +
-                    self.noncontract_fut_revenue(pf=pf, yf=yf) +
+                    self.noncontract_fut_revenue(pf=pf, yf=yf, paired=paired) +
                     self.noncontract_basis_revenue(yf=yf))
         elif bf is None:
             return ((self.contract_fut_revenue(yf=yf) +
@@ -629,25 +677,27 @@ class FarmCrop(models.Model):
             return (np.zeros_like(yf) if costfinal else
                     fbc.yield_variability * (eff_yf - 1))
 
-    def revenue_based_adj_to_land_rent(self, pf=None, yf=None):
+    def revenue_based_adj_to_land_rent(self, pf=None, yf=None, paired=False):
         """
-        a fraction or array(np, ny) of fractions
+        a fraction or array(np, ny) of fractions, or array(np) if paired
         used by both budget table and sensitivity
         """
         if not self.has_budget():
-            return (0 if scal(pf) else np.zeros((len(pf), len(yf))))
+            return (0 if scal(pf) else np.zeros(len(pf)) if paired else
+                    np.zeros((len(pf), len(yf))))
         cf = self.farm_year.var_rent_cap_floor_frac
         fv = self.farm_year.frac_var_rent()
-        fre = self.frac_rev_excess(pf, yf)
+        fre = self.frac_rev_excess(pf, yf, paired)
         if scal(pf):
             result = fv * (np.copysign(cf, fre) if abs(fre) > cf else fre)
         else:
             result = fv * (np.where(abs(fre) > cf, np.copysign(cf, fre), fre))
         return result
 
-    def rented_land_costs(self, pf=None, yf=None):
+    def rented_land_costs(self, pf=None, yf=None, paired=False):
         """
-        Scalar or array(np, ny) used by sensitivity table and listview.
+        Scalar or array(np, ny), or array(np) if paired,
+        used by sensitivity table and listview.
         Rent cost in dollars per planted acre.
         Land cost = 0 for dc soybeans in std. budgets.
         """
@@ -659,7 +709,7 @@ class FarmCrop(models.Model):
                               self.farmbudgetcrop.rented_land_costs *
                               self.farm_year.total_rented_acres() / tot_acres)
         return (rented_costperacre *
-                (1 + self.revenue_based_adj_to_land_rent(pf, yf)))
+                (1 + self.revenue_based_adj_to_land_rent(pf, yf, paired)))
 
     def owned_land_costs(self):
         """ scalar used only by sensitivity table """
@@ -667,18 +717,19 @@ class FarmCrop(models.Model):
         return (0 if self.is_fac() or tot_acres == 0 else
                 (self.farm_year.total_owned_land_expense() / tot_acres))
 
-    def land_costs(self, pf=None, yf=None):
-        """ array(np, ny) used only by sensitivity table """
-        return (self.rented_land_costs(pf, yf) + self.owned_land_costs())
+    def land_costs(self, pf=None, yf=None, paired=False):
+        """ array(np, ny), or array(np) if paired, used by sensitivity table """
+        return (self.rented_land_costs(pf, yf, paired) + self.owned_land_costs())
 
-    def total_cost(self, pf=None, yf=None):
-        """ array(np, ny) used only by sensitivity table """
+    def total_cost(self, pf=None, yf=None, paired=False):
+        """ array(np, ny), or array(np) if paired, used by sensitivity table """
         if not self.has_budget():
-            return (0 if scal(pf) else np.zeros((len(pf), len(yf))))
-        tot_nonland_cost = self.total_nonland_costs()
-        return ((tot_nonland_cost *
-                 (1 + self.yield_adj_to_nonland_costs(yf))).reshape(1, len(yf)) +
-                self.land_costs(pf, yf))
+            return (0 if scal(pf) else np.zeros(len(pf)) if paired else
+                    np.zeros((len(pf), len(yf))))
+        nonland_cost = (self.total_nonland_costs() *
+                        (1 + self.yield_adj_to_nonland_costs(yf)))
+        return ((nonland_cost if paired else nonland_cost.reshape(1, len(yf))) +
+                self.land_costs(pf, yf, paired))
 
     # -------------
     # Price methods
@@ -753,7 +804,7 @@ class FarmCrop(models.Model):
         ordering = ['farm_crop_type_id']
 
 
-class FarmBudgetCrop(models.Model):
+class FarmBudgetCrop(FarmYearInputMixin, models.Model):
     """
     A possibly user-modfied copy of a budget column named by its budget_crop_type name.
     Cost items are in dollars per acre.  One or two (rotated/non-rotated) budget crops
@@ -1,3 +1,4 @@
+import hashlib
 import numpy as np
 from datetime import datetime, timedelta
 from django.contrib.auth.models import User
@@ -5,11 +6,14 @@ from django.core.exceptions import ValidationError
 from django.core.validators import (
     MinValueValidator as MinVal, MaxValueValidator as MaxVal)
 from django.db import models
+from django.db.models import Max
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from ext.models import (
     State, County, InsurableCropsForCty, FarmCropType, MarketCropType, FsaCropType,
-    InsuranceDates, ReferencePrices)
+    InsuranceDates, ReferencePrices, FuturesContract)
 from . import util
+from .spans import span
 
 # 
 def get_current_year():
@@ -27,6 +31,12 @@ def default_start_date():
     return datetime(year, 1, 1)
 
 
+def artifact_property(kind):
+    """ A farm year attribute backed by a row of the artifact table """
+    return property(lambda self: self.get_artifact(kind),
+                    lambda self, data: self.set_artifact(kind, data))
+
+
 class FarmYear(models.Model):
     """
     Holds non-crop-specific values for a crop year for a farm
@@ -101,9 +111,6 @@ class FarmYear(models.Model):
         default=0.1, validators=[MinVal(0), MaxVal(0.5)],
         help_text=_('increment to noncontract basis for basis sensitivity<br>' +
                     'Set to zero to turn off basis sensitivity.'))
-    sensitivity_data = models.JSONField(null=True, blank=True)
-    sensitivity_diff = models.JSONField(null=True, blank=True)
-    sensitivity_text = models.JSONField(null=True, blank=True)
     # NOTE: the hard-coded default value may change from year to year.
     est_sequest_frac = models.FloatField(
         default=0.057, validators=[
@@ -111,16 +118,80 @@ class FarmYear(models.Model):
             MaxVal(0.1, message="Ensure this value is less than or equal to 10")],
         verbose_name='estimated sequestration percent',
         help_text='Estimated reduction to computed total pre-cap title payment')
+
+    # Cached outputs are stored in FarmYearArtifact, one row per kind, so that
+    # storing a table or budget doesn't rewrite the farm year row.
+    sensitivity_data = artifact_property('sensitivity_data')
+    sensitivity_diff = artifact_property('sensitivity_diff')
+    sensitivity_text = artifact_property('sensitivity_text')
+    # Older sensitivity data snapshots, see SensHistory
+    sensitivity_history = artifact_property('sensitivity_history')
     # Dict of numerical data For computing variance or displaying benchmark budget.
-    current_budget_data = models.JSONField(null=True, blank=True)
+    current_budget_data = artifact_property('current_budget_data')
     # If the user sets or updates the benchmark, we copy current budget data here.
-    baseline_budget_data = models.JSONField(null=True, blank=True)
+    baseline_budget_data = artifact_property('baseline_budget_data')
     # Dict of dicts with text and styles info.  Keys are 'cur', 'base' and 'var'
-    budget_text = models.JSONField(null=True, blank=True)
+    budget_text = artifact_property('budget_text')
+    # The text of the last computed current budget, tagged with its version token
+    current_budget_text = artifact_property('current_budget_text')
+    # Bumped whenever the farm year or any of its crops or contracts is saved
+    inputs_updated_on = models.DateTimeField(default=timezone.now)
 
     def __init__(self, *args, **kwargs):
+        self.artifacts_mem = {}
         super().__init__(*args, **kwargs)
 
+    def prefetch_artifacts(self, *kinds):
+        """ Load several artifacts with a single query """
+        kinds = [k for k in kinds if k not in self.artifacts_mem]
+        if not kinds:
+            return
+        found = dict(self.artifacts.filter(kind__in=kinds)
+                     .values_list('kind', 'data'))
+        for kind in kinds:
+            self.artifacts_mem[kind] = found.get(kind)
+
+    def get_artifact(self, kind):
+        if kind not in self.artifacts_mem:
+            self.prefetch_artifacts(kind)
+        return self.artifacts_mem[kind]
+
+    def set_artifact(self, kind, data):
+        """
+        Upsert the single artifact row.  Nothing else in the farm year
+        or its other artifacts is written.
+        """
+        with span('artifact_save'):
+            FarmYearArtifact.objects.bulk_create(
+                [FarmYearArtifact(farm_year=self, kind=kind, data=data)],
+                update_conflicts=True, unique_fields=['farm_year', 'kind'],
+                update_fields=['data', 'updated_on'])
+        self.artifacts_mem[kind] = data
+
+    def has_artifact(self, kind):
+        if kind in self.artifacts_mem:
+            return self.artifacts_mem[kind] is not None
+        return self.artifacts.filter(kind=kind, data__isnull=False).exists()
+
+    @staticmethod
+    def touch(farm_year_id):
+        """ Record an input change without rewriting the rest of the row """
+        FarmYear.objects.filter(pk=farm_year_id).update(
+            inputs_updated_on=timezone.now())
+
+    def version_token(self, *kinds):
+        """
+        A token which changes whenever the farm year's inputs, its model run date,
+        the loaded reference data and prices or any of the listed artifacts
+        change.  Suitable for use as an ETag.
+        """
+        artifacts_on = (self.artifacts.filter(kind__in=kinds)
+                        .aggregate(on=Max('updated_on'))['on'] if kinds else None)
+        key = (f'{self.pk}:{self.inputs_updated_on.isoformat()}:'
+               f'{self.get_model_run_date()}:{util.get_data_version()}:'
+               f'{artifacts_on.isoformat() if artifacts_on else ""}')
+        return hashlib.sha1(key.encode()).hexdigest()
+
     def get_model_run_date(self):
         mmrd = self.manual_model_run_date
         if not self.is_model_run_date_manual:
@@ -128,10 +199,22 @@ class FarmYear(models.Model):
         return mmrd.date() if hasattr(mmrd, 'date') else mmrd
 
     def has_budget(self):
-        return self.current_budget_data is not None
+        return self.has_artifact('current_budget_data')
 
     def has_baseline_budget(self):
-        return self.baseline_budget_data is not None
+        return self.has_artifact('baseline_budget_data')
+
+    def get_stored_current_budget(self):
+        """
+        Return the last computed current budget and whether it is up to date
+        with the farm year's inputs, without computing anything.
+        Returns (None, False) if no current budget has been stored.
+        """
+        budget = self.current_budget_text
+        if budget is None:
+            return None, False
+        token = self.version_token('baseline_budget_data')
+        return budget, budget['info'].get('version') == token
 
     def update_baseline(self):
         """
@@ -139,7 +222,7 @@ class FarmYear(models.Model):
         Update the budget_text dict setting 'base' to 'cur'.
         """
         self.baseline_budget_data = self.current_budget_data
-        self.save()
+        FarmYear.touch(self.pk)
 
     def wasde_first_mya_release_on(self):
         return datetime(self.crop_year, 5, 11).date()
@@ -188,6 +271,10 @@ class FarmYear(models.Model):
         from .farm_crop import FarmCrop
         fsas = {}
         mkts = {}
+        insdts = {insdt.market_crop_type_id: insdt for insdt in
+                  InsuranceDates.objects.filter(
+                      state_id=self.state_id, county_code=self.county_code,
+                      crop_year=self.crop_year)}
         for row in (InsurableCropsForCty.objects
                     .filter(state_id=self.state_id, county_code=self.county_code)
                     .order_by('id')):
@@ -214,9 +301,10 @@ class FarmYear(models.Model):
                     farm_year=self, market_crop_type=mktct, fsa_crop=fsa)
                 mkts[mktct.id] = mkt
 
-            insdt = InsuranceDates.objects.get(
-                state_id=self.state_id, county_code=self.county_code,
-                market_crop_type_id=mktct.id, crop_year=self.crop_year)
+            insdt = insdts.get(mktct.id)
+            if insdt is None:
+                raise InsuranceDates.DoesNotExist(
+                    f'No insurance dates for {mktct} in {self.crop_year}')
             cty_yield_final = datetime(self.crop_year+1,
                                        (4 if mktct.id in (3, 4) else 6), 16).date()
             practices = [p for p in row.practices if self.IRR_PRACTICE[p] == 'Non-Irrigated']
@@ -229,16 +317,45 @@ class FarmYear(models.Model):
                 harv_price_disc_start=insdt.harv_price_disc_mth_start,
                 harv_price_disc_end=insdt.harv_price_disc_mth_end,
                 cty_yield_final=cty_yield_final)
+        self.index_impacts()
 
-    def calc_gov_pmt(self, is_per_acre=False, mya_prices=None, cty_yields=None):
+    def impact_keys(self):
         """
-        Compute the total, capped government payment.
+        The (ins_crop_id, market_crop_type_id, fsa_crop_type_id) of each farm crop
+        """
+        return list(self.farm_crops.order_by('id').values_list(
+            'farm_crop_type__ins_crop_id', 'market_crop__market_crop_type_id',
+            'market_crop__fsa_crop__fsa_crop_type_id'))
+
+    def index_impacts(self):
+        """
+        Rebuild the farm year's FarmYearImpact rows from its location and farm crops
+        """
+        FarmYearImpact.objects.filter(farm_year=self).delete()
+        FarmYearImpact.objects.bulk_create(
+            FarmYearImpact(
+                farm_year=self, crop_year=self.crop_year, state_id=self.state_id,
+                county_code=self.county_code, ins_crop_id=ins_crop_id,
+                market_crop_type_id=market_crop_type_id,
+                fsa_crop_type_id=fsa_crop_type_id)
+            for ins_crop_id, market_crop_type_id, fsa_crop_type_id
+            in self.impact_keys())
+        self.indexed_location = self.location_keys()
+
+    def location_keys(self):
+        return (self.crop_year, self.state_id, self.county_code)
+
+    def calc_gov_pmt(self, is_per_acre=False, mya_prices=None, cty_yields=None,
+                     paired=False):
+        """
+        Compute the total, capped government payment.  If paired, the rows of
+        mya_prices and cty_yields are taken together elementwise (see GovPmt).
         """
         if cty_yields is None:
             total = sum((fc.gov_payment() for fc in self.fsa_crops.all()))
         else:
             total = sum((fc.gov_payment(sens_mya_price=mya_prices[i, :],
-                                        cty_yield=cty_yields[i, :])
+                                        cty_yield=cty_yields[i, :], paired=paired)
                          for i, fc in enumerate(self.fsa_crops.all())))
         total_pmt = np.minimum(self.fsa_pmt_cap_per_principal() *
                                self.eligible_persons_for_cap,
@@ -281,11 +398,23 @@ class FarmYear(models.Model):
             raise ValidationError({'farm_name': _(
                 'A user can have at most 10 farms for a crop year')})
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        location = {'crop_year', 'state_id', 'county_code'}
+        if not location & instance.get_deferred_fields():
+            instance.indexed_location = instance.location_keys()
+        return instance
+
     def save(self, *args, **kwargs):
+        self.inputs_updated_on = timezone.now()
         super().save(*args, **kwargs)
         if self.farm_crops.count() == 0:
             self.add_insurable_farm_crops()
             self.save()
+        elif getattr(self, 'indexed_location',
+                     self.location_keys()) != self.location_keys():
+            self.index_impacts()
 
     class Meta:
         constraints = [
@@ -293,3 +422,104 @@ class FarmYear(models.Model):
                                     name='farm_name_unique_for_user_crop_year'), ]
         ordering = ['-crop_year', 'farm_name']
 
+
+class FarmYearInputMixin:
+    """
+    Mixin for models holding farm year inputs.  Saving or deleting an instance
+    bumps the farm year's inputs_updated_on, invalidating its version token,
+    unless the save updates only fields derived from the inputs.
+    """
+    # fields caching values computed from the inputs
+    derived_fields = ()
+
+    def get_input_farm_year_id(self):
+        return self.farm_year_id
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        super().save(*args, **kwargs)
+        if (update_fields is None or
+                not set(update_fields) <= set(self.derived_fields)):
+            FarmYear.touch(self.get_input_farm_year_id())
+
+    def delete(self, *args, **kwargs):
+        farm_year_id = self.get_input_farm_year_id()
+        result = super().delete(*args, **kwargs)
+        FarmYear.touch(farm_year_id)
+        return result
+
+
+class FarmYearArtifact(models.Model):
+    """
+    Cached numerical data and text for a farm year's budget and sensitivity
+    tables.  There is at most one row per farm year and kind.
+    """
+    KINDS = [(k, k.replace('_', ' ')) for k in (
+        'sensitivity_data', 'sensitivity_diff', 'sensitivity_text',
+        'sensitivity_history', 'current_budget_data', 'baseline_budget_data',
+        'budget_text', 'current_budget_text')]
+
+    farm_year = models.ForeignKey(FarmYear, on_delete=models.CASCADE,
+                                  related_name='artifacts')
+    kind = models.CharField(max_length=24, choices=KINDS)
+    data = models.JSONField(null=True, blank=True)
+    updated_on = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.farm_year}: {self.kind}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['farm_year', 'kind'],
+                                    name='artifact_kind_unique_for_farm_year'), ]
+
+
+class FarmYearImpact(models.Model):
+    """
+    An index of each farm crop of a farm year by the keys of the reference data
+    and prices its budget and sensitivity data depend on, so the farm years
+    affected by an update can be found without scanning all farm years.
+    Rows are built by FarmYear.index_impacts when the farm crops are added or the
+    location changes, and by the SQL from Replicate.
+    """
+    farm_year = models.ForeignKey(FarmYear, on_delete=models.CASCADE,
+                                  related_name='impacts')
+    crop_year = models.SmallIntegerField()
+    state_id = models.SmallIntegerField()
+    county_code = models.SmallIntegerField()
+    ins_crop_id = models.SmallIntegerField()
+    market_crop_type_id = models.SmallIntegerField()
+    fsa_crop_type_id = models.SmallIntegerField()
+
+    @staticmethod
+    def affected(crop_year=None, state_id=None, county_code=None, ins_crop_id=None,
+                 market_crop_type_id=None, fsa_crop_type_id=None, ticker=None):
+        """
+        Return the sorted ids of farm years matching all the given keys, e.g.
+        (crop_year, state_id, county_code, ins_crop_id) for new PriceYield rows,
+        (crop_year, ticker) for new FuturesPrice rows or (crop_year) for MyaPost.
+        """
+        keys = {k: v for k, v in (
+            ('crop_year', crop_year), ('state_id', state_id),
+            ('county_code', county_code), ('ins_crop_id', ins_crop_id),
+            ('market_crop_type_id', market_crop_type_id),
+            ('fsa_crop_type_id', fsa_crop_type_id)) if v is not None}
+        if ticker is not None:
+            keys['market_crop_type_id__in'] = (FuturesContract.objects
+                                               .filter(ticker=ticker)
+                                               .values('market_crop_type_id'))
+        return list(FarmYearImpact.objects.filter(**keys).order_by('farm_year_id')
+                    .values_list('farm_year_id', flat=True).distinct())
+
+    def __str__(self):
+        return (f'{self.farm_year_id}: {self.crop_year} {self.state_id} '
+                f'{self.county_code} {self.market_crop_type_id}')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['crop_year', 'state_id', 'county_code',
+                                 'ins_crop_id'], name='impact_county_crop'),
+            models.Index(fields=['crop_year', 'market_crop_type_id'],
+                         name='impact_market_crop_type'),
+            models.Index(fields=['crop_year', 'fsa_crop_type_id'],
+                         name='impact_fsa_crop_type'), ]
@@ -7,7 +7,8 @@ from django.utils.translation import gettext_lazy as _
 from ext.models import (FsaCropType, MyaPreEstimate, MyaPost,
                         BenchmarkRevenue)
 from core.models.gov_pmt import GovPmt
-from .farm_year import FarmYear
+from .farm_year import FarmYear, FarmYearInputMixin
+from .spans import span
 from .util import scal, zero_like, one_like
 
 
@@ -44,7 +45,7 @@ def cty_expected_yield_helper(yield_info, acres, yf):
     return zero_like(yf) if totacres == 0 else sum(weight) / totacres, is_rma_final
 
 
-class FsaCrop(models.Model):
+class FsaCrop(FarmYearInputMixin, models.Model):
     """
     Priced crop-specific operator input data.  A FsaCrop has many FarmCrops so we
     should be able to get totals pretty easily.
@@ -128,6 +129,7 @@ class FsaCrop(models.Model):
         except IndexError:
             return None
 
+    @span('price_lookup')
     def sens_mya_price(self, pf=None):
         mrd = self.farm_year.get_model_run_date()
         if pf is None:
@@ -138,9 +140,11 @@ class FsaCrop(models.Model):
             else MyaPost.get_mya_post_estimate(
                 self.farm_year.crop_year, mrd, self.fsa_crop_type_id, pf=pf))
 
-    def gov_payment(self, sens_mya_price=None, cty_yield=None):
+    @span('gov_payment')
+    def gov_payment(self, sens_mya_price=None, cty_yield=None, paired=False):
         """
-        sens_mya_price is array(np), cty_yield is array(ny)
+        sens_mya_price is array(np), cty_yield is array(ny), or if paired arrays
+        of equal length taken together
         """
         if sens_mya_price is None:
             sens_mya_price = self.sens_mya_price()
@@ -154,7 +158,8 @@ class FsaCrop(models.Model):
                     guar_rev_frac=self.guar_rev_frac(),
                     cap_on_bmk_county_rev=self.cap_on_bmk_county_rev(),
                     sens_mya_price=sens_mya_price,
-                    benchmark_revenue=self.benchmark_revenue(revenue_only=True))
+                    benchmark_revenue=self.benchmark_revenue(revenue_only=True),
+                    paired=paired)
         return gp.prog_pmt_pre_sequest()
 
     def clean(self):
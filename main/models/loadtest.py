@@ -0,0 +1,194 @@
+"""
+Module loadtest
+
+Replays scripted user sessions against the site's URLs at a given concurrency
+and summarizes latency percentiles per endpoint.  Sessions are driven either
+in process by the Django test client, which also counts database queries per
+request, or over HTTP against a running server (e.g. a local gunicorn) sharing
+the database, in which case sessions and CSRF tokens are made up front.
+"""
+import random
+import statistics
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+import numpy as np
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from main.forms import FarmCropUpdateForm
+from .farm_crop import FarmCrop
+
+
+# Each step is (url name, method, function of the farm year giving the
+# reverse args, the query string and the POST data).  Steps within a session
+# run in order, as a user clicking through the pages would.
+def farm_year_step(name, query=''):
+    return (name, 'GET', lambda fy: ([fy.pk], query, None))
+
+
+def crop_update_step():
+    def args(fy):
+        fc = (FarmCrop.objects.filter(farm_year=fy, planted_acres__gt=0)
+              .order_by('pk').first())
+        return [fc.pk], '', crop_form_data(fc)
+    return ('farmcrop_update', 'POST', args)
+
+
+SCRIPTS = {
+    'budget': [
+        farm_year_step('dashboard'),
+        farm_year_step('detailedbudget'),
+        farm_year_step('ajaxbudget', 'bdgtype=cur'),
+        farm_year_step('ajaxbudget', 'bdgtype=base'),
+        farm_year_step('downloadbudget', 'b=0'),
+    ],
+    'sensitivity': [
+        farm_year_step('dashboard'),
+        farm_year_step('sensitivity'),
+        farm_year_step('sens_table', 'tbltype=revenue&crop=farm'),
+        farm_year_step('sens_table', 'tbltype=cashflow&crop=farm&isdiff=true'),
+        farm_year_step('downloadsens', 'tbltype=cashflow&crop=farm'),
+    ],
+    'crop_update': [
+        farm_year_step('farmcrop_list'),
+        crop_update_step(),
+        farm_year_step('detailedbudget'),
+        farm_year_step('sensitivity'),
+    ],
+}
+
+
+def crop_form_data(farm_crop):
+    """ POST data resubmitting a farm crop's update form unchanged """
+    form = FarmCropUpdateForm(instance=farm_crop)
+    data = {}
+    for name in form.fields:
+        value = form[name].value()
+        if value is True:
+            data[name] = 'on'
+        elif value not in (False, None):
+            data[name] = value
+    return data
+
+
+class ClientDriver(object):
+    """
+    Runs requests in process with the test client, counting queries.
+    host must be in ALLOWED_HOSTS.
+    """
+    def __init__(self, host='localhost'):
+        self.host = host
+        self.local = threading.local()
+
+    def login(self, user):
+        self.local.client = Client(HTTP_HOST=self.host)
+        self.local.client.force_login(user)
+
+    def request(self, method, url, data):
+        with CaptureQueriesContext(connection) as ctx:
+            if method == 'POST':
+                response = self.local.client.post(url, data)
+            else:
+                response = self.local.client.get(url)
+            if response.streaming:
+                b''.join(response)
+        return response.status_code, len(ctx.captured_queries)
+
+    def close(self):
+        connection.close()
+
+
+class HttpDriver(object):
+    """ Runs requests against a server, e.g. http://127.0.0.1:8000 """
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.local = threading.local()
+
+    def login(self, user):
+        # a session made here is valid for a server using the same database
+        client = Client()
+        client.force_login(user)
+        self.local.csrf = get_random_string(32)
+        self.local.cookies = (f'sessionid={client.cookies["sessionid"].value}; '
+                              f'csrftoken={self.local.csrf}')
+
+    def request(self, method, url, data):
+        body = None
+        if method == 'POST':
+            body = urlencode(dict(data, csrfmiddlewaretoken=self.local.csrf),
+                             doseq=True).encode()
+        req = Request(self.base_url + url, data=body, method=method,
+                      headers={'Cookie': self.local.cookies,
+                               'Referer': self.base_url + url})
+        try:
+            with urlopen(req) as response:
+                response.read()
+                return response.status, None
+        except HTTPError as ex:
+            return ex.code, None
+
+    def close(self):
+        connection.close()
+
+
+class LoadTest(object):
+    """
+    Runs sessions, each a randomly chosen script for a randomly chosen farm
+    year, on concurrency threads.  Results are kept per url name.
+    """
+    def __init__(self, driver, farm_years, scripts=None, seed=None):
+        self.driver = driver
+        self.farm_years = farm_years
+        self.scripts = scripts or list(SCRIPTS)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.results = defaultdict(list)  # url name -> [(secs, status, queries)]
+
+    def run(self, sessions, concurrency):
+        picks = [(self.random.choice(self.scripts),
+                  self.random.choice(self.farm_years)) for i in range(sessions)]
+        start = perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(self.run_sessions, [picks[i] for i in chunk])
+                       for chunk in np.array_split(np.arange(sessions), concurrency)]
+        for future in futures:
+            future.result()
+        return perf_counter() - start
+
+    def run_sessions(self, picks):
+        try:
+            for script, farm_year in picks:
+                self.driver.login(farm_year.user)
+                for name, method, get_args in SCRIPTS[script]:
+                    args, query, data = get_args(farm_year)
+                    url = reverse(name, args=args) + (f'?{query}' if query else '')
+                    start = perf_counter()
+                    status, queries = self.driver.request(method, url, data)
+                    with self.lock:
+                        self.results[name].append(
+                            (perf_counter() - start, status, queries))
+        finally:
+            self.driver.close()
+
+    def summary(self):
+        """
+        (url name, requests, errors, p50, p90, p99, max in ms, mean queries)
+        Responses with status 400 and over are errors.
+        """
+        rows = []
+        for name, results in sorted(self.results.items()):
+            ms = 1000 * np.array([r[0] for r in results])
+            queries = [r[2] for r in results if r[2] is not None]
+            rows.append((name, len(results), sum(r[1] >= 400 for r in results),
+                         *np.percentile(ms, [50, 90, 99]), ms.max(),
+                         statistics.mean(queries) if queries else None))
+        return rows
@@ -4,13 +4,15 @@ from django.core.exceptions import ValidationError
 from django.core.validators import (
     MinValueValidator as MinVal, MaxValueValidator as MaxVal)
 from django.db import models
+from django.db.models import F, Q, Sum
 from ext.models import FuturesPrice, MarketCropType
-from .farm_year import FarmYear
+from .farm_year import FarmYear, FarmYearInputMixin
 from .fsa_crop import FsaCrop
+from .spans import span
 from .util import scal
 
 
-class MarketCrop(models.Model):
+class MarketCrop(FarmYearInputMixin, models.Model):
     """
     A crop which can be marketed and which has a unique set of futures prices
     for a given county.
@@ -30,11 +32,18 @@ class MarketCrop(models.Model):
         verbose_name='price sensititivity factor',
         help_text=('Percent of current futures price, reflected in detailed budget'))
 
+    @staticmethod
+    def prefetch_contract_stats(farm_year, market_crops):
+        """
+        Compute the contract statistics for the given market crops of a farm year
+        with a single aggregate query and hand them to the market crops.
+        """
+        stats = get_contract_stats(farm_year, market_crops)
+        for mc in market_crops:
+            mc.contract_stats_mem = stats[mc.pk]
+
     def __init__(self, *args, **kwargs):
-        self.futures_contracted_bu_mem = None
-        self.basis_contracted_bu_mem = None
-        self.avg_futures_contract_price_mem = None
-        self.avg_basis_contract_price_mem = None
+        self.contract_stats_mem = None
         self.planted_acres_mem = None
         self.harvest_futures_price_info_mem = None
         self.planted_acres_mem = None
@@ -46,37 +55,28 @@ class MarketCrop(models.Model):
     def __str__(self):
         return f'{self.market_crop_type}'
 
+    def contract_stats(self):
+        """
+        dict with contracted bushels and average contract prices for futures and
+        basis, for contracts up to the model run date and for planned contracts
+        (keys prefixed with 'planned_').
+        """
+        if self.contract_stats_mem is None:
+            stats = get_contract_stats(self.farm_year, [self])
+            self.contract_stats_mem = stats[self.pk]
+        return self.contract_stats_mem
+
     def futures_contracted_bu(self):
-        if self.futures_contracted_bu_mem is None:
-            self.futures_contracted_bu_mem = sum(
-                c.bushels for c in self.get_contracts()
-                if c.futures_price is not None)
-        return self.futures_contracted_bu_mem
+        return self.contract_stats()['futures_bu']
 
     def basis_contracted_bu(self):
-        if self.basis_contracted_bu_mem is None:
-            self.basis_contracted_bu_mem = sum(
-                c.bushels for c in self.get_contracts()
-                if c.basis_price is not None)
-        return self.basis_contracted_bu_mem
+        return self.contract_stats()['basis_bu']
 
     def avg_futures_contract_price(self):
-        if self.avg_futures_contract_price_mem is None:
-            amounts = [c.futures_price*c.bushels for c in self.get_contracts()
-                       if c.futures_price is not None]
-            tot_bu = self.futures_contracted_bu()
-            self.avg_futures_contract_price_mem = (sum(amounts) / tot_bu
-                                                   if tot_bu > 0 else 0)
-        return self.avg_futures_contract_price_mem
+        return self.contract_stats()['avg_futures_price']
 
     def avg_basis_contract_price(self):
-        if self.avg_basis_contract_price_mem is None:
-            amounts = [c.basis_price*c.bushels for c in self.get_contracts()
-                       if c.basis_price is not None]
-            tot_bu = self.basis_contracted_bu()
-            self.avg_basis_contract_price_mem = (sum(amounts) / tot_bu
-                                                 if tot_bu > 0 else 0)
-        return self.avg_basis_contract_price_mem
+        return self.contract_stats()['avg_basis_price']
 
     def get_contracts(self):
         model_run_date = self.farm_year.get_model_run_date()
@@ -95,6 +95,7 @@ class MarketCrop(models.Model):
             pf = self.price_factor
         return self.harvest_futures_price_info(price_only=True) * pf
 
+    @span('price_lookup')
     def harvest_futures_price_info(self, priced_on=None, price_only=False):
         """
         Get the harvest price for the given date from the correct exchange for the
@@ -176,7 +177,7 @@ class MarketCrop(models.Model):
         ordering = ['market_crop_type_id']
 
 
-class Contract(models.Model):
+class Contract(FarmYearInputMixin, models.Model):
     """
     Represents a futures / basis contract
     If a manual model_run_date is set, we should warn the user that contracts with
@@ -208,6 +209,9 @@ class Contract(models.Model):
     class Meta:
         ordering = ['contract_date']
 
+    def get_input_farm_year_id(self):
+        return self.market_crop.farm_year_id
+
     def clean(self):
         if self.futures_price is not None and self.futures_price < 1:
             raise ValidationError(
@@ -221,3 +225,55 @@ class Contract(models.Model):
         if self.basis_price is not None and self.basis_price > 2:
             raise ValidationError(
                 {'basis_price': 'Basis price must be less than $2.00'})
+
+
+def get_contract_stats(farm_year, market_crops):
+    """
+    Aggregate contracted bushels and bushel-weighted average prices for futures and
+    basis contracts of each market crop in the database.  Contracts dated after the
+    model run date are aggregated separately as planned contracts.
+    Returns a dict of dicts keyed by market crop id.
+    """
+    mrd = farm_year.get_model_run_date()
+    aggs = {}
+    for prefix, dated in (('', Q(contract_date__lte=mrd)),
+                          ('planned_', Q(contract_date__gt=mrd))):
+        for kind in ('futures', 'basis'):
+            priced = dated & Q(**{f'{kind}_price__isnull': False})
+            aggs[f'{prefix}{kind}_bu'] = Sum('bushels', filter=priced, default=0)
+            aggs[f'{prefix}{kind}_amt'] = Sum(F('bushels') * F(f'{kind}_price'),
+                                              filter=priced, default=0)
+    rows = {row['market_crop']: row for row in
+            Contract.objects.filter(market_crop__in=[mc.pk for mc in market_crops])
+            .values('market_crop').order_by().annotate(**aggs)}
+    stats = {}
+    for mc in market_crops:
+        row = rows.get(mc.pk, {k: 0 for k in aggs})
+        stats[mc.pk] = {}
+        for prefix in ('', 'planned_'):
+            for kind in ('futures', 'basis'):
+                tot_bu = row[f'{prefix}{kind}_bu']
+                stats[mc.pk][f'{prefix}{kind}_bu'] = tot_bu
+                stats[mc.pk][f'{prefix}avg_{kind}_price'] = (
+                    row[f'{prefix}{kind}_amt'] / tot_bu if tot_bu > 0 else 0)
+    return stats
+
+
+def get_planted_market_crops(farm_year):
+    """ The farm year's market crops with planted acres, annotated with acres """
+    return (MarketCrop.objects.filter(farm_year=farm_year)
+            .annotate(acres=Sum('farm_crops__planted_acres'))
+            .filter(acres__gt=0).order_by('market_crop_type_id'))
+
+
+def get_farm_year_contracts(farm_year):
+    """
+    Contracts up to the model run date for the market crops with planted acres,
+    ordered by crop and contract date, in one query with the market crop and
+    its type joined.  Use iterator() to keep memory flat for large books.
+    """
+    return (Contract.objects
+            .filter(market_crop__in=get_planted_market_crops(farm_year).values('id'),
+                    contract_date__lte=farm_year.get_model_run_date())
+            .select_related('market_crop__market_crop_type')
+            .order_by('market_crop__market_crop_type_id', 'contract_date'))
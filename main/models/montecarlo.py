@@ -0,0 +1,339 @@
+"""
+Module montecarlo
+
+Simulates a farm year's pre-tax cash flow over many states of the world, each
+a draw of the harvest price and county yield of every market crop and of the
+farm yield of every farm crop.  Unlike the sensitivity grid, farm and county
+yields vary separately, so the interaction of crop insurance and title
+payments with farm results shows.
+
+Each chunk of draws is evaluated with the FarmCrop revenue and cost methods
+(including the yield adjustment to nonland costs and variable rent), the
+Indemnity engine and FarmYear.calc_gov_pmt (ARC-CO and PLC with the payment
+cap).  For the sensitivity tables these evaluate the outer product of price and
+yield arrays; here they are called with paired=True, so the price and yield
+factors of each draw are taken together elementwise.  Results are accumulated in
+streaming summaries, so memory is bounded by the chunk size however many draws
+are made.
+
+Standard normal draws come from a Gaussian copula with the correlations set
+in settings, or from the RMA draw matrix of each crop (as used in premium
+rating), one row for all crops per draw.  The marginal distributions are those
+of sens_outcomes.
+"""
+import numpy as np
+from django.conf import settings
+
+from core.models.indemnity import Indemnity
+from core.models.premium import get_crop_ins_data
+from .farm_crop import FarmCrop
+from .market_crop import MarketCrop
+from .sens_outcomes import get_crop_params, price_factors, yield_factors
+from .util import lower_tail_mean
+
+CHUNK = 1000
+NBINS = 200
+SOURCES = ['copula', 'rma']
+QUANTILES = [.01, .05, .1, .25, .5, .75, .9, .95, .99]
+NAMES = ['cashflow', 'revenue', 'title', 'indem', 'cost']
+
+
+def nearest_correlation(corr):
+    """ Clip negative eigenvalues so a correlation matrix can be factored """
+    values, vectors = np.linalg.eigh(corr)
+    corr = (vectors * np.maximum(values, 1e-8)) @ vectors.T
+    scale = np.sqrt(np.diag(corr))
+    return corr / np.outer(scale, scale)
+
+
+class StreamingSummary(object):
+    """
+    Running moments, extremes and a histogram of a stream of values.  The
+    histogram has a fixed number of bins, whose width doubles whenever values
+    fall outside its range, so quantiles are accurate to about a bin width.
+    """
+    def __init__(self, nbins=NBINS):
+        self.nbins = nbins
+        self.counts = np.zeros(nbins, dtype=np.int64)
+        self.lo = None
+        self.width = None
+        self.n = 0
+        self.mean = 0
+        self.m2 = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.negative = 0
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        n = len(values)
+        if n == 0:
+            return
+        mean = values.mean()
+        delta = mean - self.mean
+        total = self.n + n
+        self.m2 += ((values - mean)**2).sum() + delta**2 * self.n * n / total
+        self.mean += delta * n / total
+        self.n = total
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.negative += int((values < 0).sum())
+        if self.lo is None:
+            span = values.max() - values.min()
+            self.lo = values.min()
+            self.width = (span if span > 0 else max(abs(self.lo), 1)) / self.nbins
+        while values.min() < self.lo:
+            self.expand(left=True)
+        while values.max() > self.lo + self.nbins * self.width:
+            self.expand(left=False)
+        idx = np.minimum(((values - self.lo) / self.width).astype(int),
+                         self.nbins - 1)
+        self.counts += np.bincount(idx, minlength=self.nbins)
+
+    def expand(self, left):
+        """ Double the bin width, keeping the current range in one half """
+        merged = self.counts.reshape(-1, 2).sum(axis=1)
+        pad = np.zeros(self.nbins // 2, dtype=np.int64)
+        if left:
+            self.counts = np.concatenate([pad, merged])
+            self.lo -= self.nbins * self.width
+        else:
+            self.counts = np.concatenate([merged, pad])
+        self.width *= 2
+
+    def quantiles(self, quantiles):
+        """ Quantiles interpolated within the histogram bins """
+        cumulative = np.cumsum(self.counts)
+        result = []
+        for q in quantiles:
+            target = q * self.n
+            i = min(np.searchsorted(cumulative, target), self.nbins - 1)
+            count = self.counts[i]
+            frac = 0 if count == 0 else (target - cumulative[i] + count) / count
+            value = self.lo + (i + frac) * self.width
+            result.append(min(max(value, self.min), self.max))
+        return result
+
+    def summary(self, alpha=.1):
+        """ A dict of the statistics, the histogram and its range """
+        mids = np.clip(self.lo + (np.arange(self.nbins) + .5) * self.width,
+                       self.min, self.max)
+        shortfall = lower_tail_mean(mids[:, np.newaxis], self.counts / self.n,
+                                    alpha)[0]
+        result = {'n': self.n, 'mean': self.mean,
+                  'std': np.sqrt(self.m2 / self.n), 'min': self.min,
+                  'max': self.max, 'shortfall': shortfall,
+                  'prob_loss': self.negative / self.n}
+        result.update({f'q{round(100 * q):02d}': value
+                       for q, value in zip(QUANTILES, self.quantiles(QUANTILES))})
+        result = {k: round(float(v), 2) for k, v in result.items()}
+        result['histogram'] = {'lo': float(self.lo), 'width': float(self.width),
+                               'counts': self.counts.tolist()}
+        return result
+
+
+class FarmSimulation(object):
+    """
+    Simulates the cash flow of a farm year's planted farm crops with budgets.
+    dispersion scales all volatilities and yield variations; zero gives the
+    budgeted outcome for every draw.
+    """
+    def __init__(self, farm_year, seed=None, source='copula', dispersion=1):
+        if source not in SOURCES:
+            raise ValueError(f'Unexpected source {source}')
+        self.farm_year = farm_year
+        self.source = source
+        self.rng = np.random.default_rng(seed)
+        self.farm_crops = [fc for fc in
+                           farm_year.farm_crops.select_related(
+                               'farm_crop_type', 'market_crop')
+                           if fc.planted_acres > 0 and fc.has_budget()]
+        if len(self.farm_crops) == 0:
+            raise ValueError('No planted farm crops with budgets')
+        FarmCrop.prefetch_reference_data(farm_year, self.farm_crops)
+        MarketCrop.prefetch_contract_stats(
+            farm_year, [fc.market_crop for fc in self.farm_crops])
+        # the first farm crop of each market crop gives its price and county
+        # yield distributions
+        self.primary = {}
+        for fc in self.farm_crops:
+            self.primary.setdefault(fc.market_crop_id, fc)
+        self.mkt_ids = list(self.primary)
+        params = {fc.pk: get_crop_params(fc) for fc in self.farm_crops}
+        self.price_vol = {m: dispersion * params[fc.pk][0]
+                          for m, fc in self.primary.items()}
+        self.cty_cv = {m: dispersion * settings.SIM_COUNTY_YIELD_CV_FRAC *
+                       params[fc.pk][1] for m, fc in self.primary.items()}
+        self.farm_cv = {fc.pk: dispersion * params[fc.pk][1]
+                        for fc in self.farm_crops}
+        self.distribution = settings.SENS_YIELD_DISTRIBUTION
+        self.set_fsa_crops()
+        if source == 'rma':
+            self.draws = {fc.pk: self.get_rma_draws(fc) for fc in self.farm_crops}
+        else:
+            self.chol = np.linalg.cholesky(self.get_correlation())
+        self.summaries = None
+        self.crop_summaries = None
+
+    def set_fsa_crops(self):
+        """
+        MYA prices and county yields for ARC/PLC are affine in the price and
+        yield factors, so find their coefficients once.  FSA crops with no
+        planted market crop are not sensitized.
+        """
+        self.fsa_crops = list(self.farm_year.fsa_crops.all())
+        factors = np.array([0., 1.])
+        self.fsa_mkt_ids, self.mya_coefs, self.cty_coefs = [], [], []
+        for fsa in self.fsa_crops:
+            mya = fsa.sens_mya_price(pf=factors) * np.ones(2)
+            cty = fsa.cty_expected_yield(factors)[0] * np.ones(2)
+            self.fsa_mkt_ids.append(next(
+                (m for m, fc in self.primary.items()
+                 if fc.market_crop.fsa_crop_id == fsa.pk), None))
+            self.mya_coefs.append((mya[0], mya[1] - mya[0]))
+            self.cty_coefs.append((cty[0], cty[1] - cty[0]))
+
+    def get_correlation(self):
+        """
+        Correlation of the (price, county yield) normals of the market crops.
+        A market crop's price and county yield have the price/yield correlation;
+        a price and another crop's county yield have that times the county
+        yield correlation.
+        """
+        n = len(self.mkt_ids)
+        rp = settings.SIM_PRICE_CORRELATION
+        rc = settings.SIM_COUNTY_YIELD_CORRELATION
+        rpy = settings.SENS_PRICE_YIELD_CORRELATION
+        eye = np.eye(n)
+        prices = eye + rp * (1 - eye)
+        counties = eye + rc * (1 - eye)
+        cross = rpy * (eye + rc * (1 - eye))
+        return nearest_correlation(np.block([[prices, cross], [cross.T, counties]]))
+
+    def get_rma_draws(self, fc):
+        """ The (yield, price) normal draws RMA uses in rating the farm crop """
+        pv = fc.indem_price_yield_data()['pv'][0]
+        data = dict(get_crop_ins_data(
+            self.farm_year.state_id, self.farm_year.county_code,
+            fc.farm_crop_type.ins_crop_id, fc.ins_crop_type_id, fc.ins_practice,
+            int(round(pv * 100)), None if fc.subcounty == '' else fc.subcounty))
+        if data['draw'] is None:
+            raise ValueError(f'No RMA draws for {fc}')
+        return data['draw']
+
+    def get_normals(self, k):
+        """
+        Standard normal arrays(k) for the price and county yield of each market
+        crop and the farm yield of each farm crop, as three dicts
+        """
+        rfc = settings.SIM_FARM_COUNTY_YIELD_CORRELATION
+        n = len(self.mkt_ids)
+        if self.source == 'rma':
+            nrows = min(len(draws) for draws in self.draws.values())
+            rows = self.rng.integers(nrows, size=k)
+            zfarm = {fc.pk: self.draws[fc.pk][rows, 0] for fc in self.farm_crops}
+            zprice = {m: self.draws[fc.pk][rows, 1] for m, fc in self.primary.items()}
+            zcty = {m: rfc * zfarm[fc.pk] +
+                    np.sqrt(1 - rfc**2) * self.rng.standard_normal(k)
+                    for m, fc in self.primary.items()}
+        else:
+            z = self.chol @ self.rng.standard_normal((2 * n, k))
+            zprice = dict(zip(self.mkt_ids, z[:n]))
+            zcty = dict(zip(self.mkt_ids, z[n:]))
+            zfarm = {fc.pk: rfc * zcty[fc.market_crop_id] +
+                     np.sqrt(1 - rfc**2) * self.rng.standard_normal(k)
+                     for fc in self.farm_crops}
+        return zprice, zcty, zfarm
+
+    def get_factors(self, k):
+        """ Price, county yield and farm yield factors for k draws """
+        zprice, zcty, zfarm = self.get_normals(k)
+        return ({m: price_factors(z, self.price_vol[m]) for m, z in zprice.items()},
+                {m: yield_factors(z, self.cty_cv[m], self.distribution)
+                 for m, z in zcty.items()},
+                {f: yield_factors(z, self.farm_cv[f], self.distribution)
+                 for f, z in zfarm.items()})
+
+    def reset(self):
+        """ Clear memoized vector results, which don't depend on the factors """
+        for fc in self.farm_crops:
+            fc.indem_price_yield_data_vec_mem = None
+            fc.sens_cty_expected_yield_mem = None
+            fc.market_crop.expected_total_bushels_mem = None
+
+    def get_indemnity(self, fc, pf, cf, ff):
+        """
+        Selected indemnities in $/acre, array(k), with the harvest price and
+        county yield from the price and county factors, as in get_indemnities,
+        but the farm yield from the farm factors
+        """
+        data = fc.indem_price_yield_data(pf=pf, yf=cf)
+        indem = Indemnity(
+            appryield=fc.appr_yield, projected_price=data['pp'][0],
+            harvest_futures_price=data['hp'][0],
+            rma_cty_expected_yield=data['ey'][0],
+            farm_expected_yield=fc.sens_farm_expected_yield(ff),
+            cty_expected_yield=data['cy'][0], paired=True)
+        items = {key: ar[:, 0] for key, ar in
+                 zip(['Farm', 'County', 'SCO', 'ECO'], indem.compute_indems())}
+        return sum(fc.get_selected_ins_items(items).values())
+
+    def get_title(self, pf, cf, k):
+        """ The capped ARC/PLC payment per farm acre, array(k) """
+        ones = np.ones(k)
+        mya_prices = np.array([
+            a + b * (ones if m is None else pf[m])
+            for m, (a, b) in zip(self.fsa_mkt_ids, self.mya_coefs)])
+        cty_yields = np.array([
+            a + b * (ones if m is None else cf[m])
+            for m, (a, b) in zip(self.fsa_mkt_ids, self.cty_coefs)])
+        return self.farm_year.calc_gov_pmt(
+            is_per_acre=True, mya_prices=mya_prices, cty_yields=cty_yields,
+            paired=True)
+
+    def evaluate(self, pf, cf, ff):
+        """ Dollar values for the draws, each array(nfc, k) """
+        k = len(next(iter(ff.values())))
+        self.reset()
+        revenue, cost = [], []
+        for fc in self.farm_crops:
+            p, y = pf[fc.market_crop_id], ff[fc.pk]
+            revenue.append(fc.gross_rev_no_title_indem(pf=p, yf=y, paired=True))
+            cost.append(fc.total_cost(pf=p, yf=y, paired=True) * fc.planted_acres)
+        self.reset()
+        indem = [self.get_indemnity(fc, pf[fc.market_crop_id], cf[fc.market_crop_id],
+                                    ff[fc.pk]) * fc.planted_acres
+                 for fc in self.farm_crops]
+        title_per_acre = self.get_title(pf, cf, k)
+        title = [np.zeros(k) if fc.is_fac() else title_per_acre * fc.planted_acres
+                 for fc in self.farm_crops]
+        values = {'revenue': np.array(revenue), 'title': np.array(title),
+                  'indem': np.array(indem), 'cost': np.array(cost)}
+        values['cashflow'] = (values['revenue'] + values['title'] +
+                              values['indem'] - values['cost'])
+        return values
+
+    def run(self, ndraws, chunk=CHUNK):
+        """
+        Simulate ndraws draws in chunks, returning the summaries for the farm
+        by value name and of each crop's cash flow.
+        """
+        self.summaries = {name: StreamingSummary() for name in NAMES}
+        self.crop_summaries = [StreamingSummary() for fc in self.farm_crops]
+        other = {'revenue': self.farm_year.other_nongrain_income,
+                 'cost': self.farm_year.other_nongrain_expense}
+        other['cashflow'] = other['revenue'] - other['cost']
+        for start in range(0, ndraws, chunk):
+            values = self.evaluate(*self.get_factors(min(chunk, ndraws - start)))
+            for name, summary in self.summaries.items():
+                summary.add(values[name].sum(axis=0) + other.get(name, 0))
+            for summary, cashflow in zip(self.crop_summaries, values['cashflow']):
+                summary.add(cashflow)
+        return self.get_summary()
+
+    def get_summary(self, alpha=.1):
+        return {'farm': {name: summary.summary(alpha)
+                         for name, summary in self.summaries.items()},
+                'crops': {str(fc): summary.summary(alpha)
+                          for fc, summary in zip(self.farm_crops,
+                                                 self.crop_summaries)}}
@@ -0,0 +1,201 @@
+"""
+Module pdf_jobs
+
+Renders budget and sensitivity table PDFs in a process pool so that CPU-bound
+reportlab work doesn't tie up a web worker.  Job status and the rendered bytes
+are kept in the database, so a poll answered by any web worker process finds
+them.  Rendered bytes are also cached, keyed by a hash of the text they are
+rendered from, so repeated downloads of an unchanged budget or table are served
+without rendering.
+"""
+import hashlib
+import json
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from functools import partial
+from itertools import repeat
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.utils import timezone
+
+from .budget_pdf import render_budget_pdf
+from .budget_table import BudgetManager
+from .sens_pdf import render_sens_pdf, render_sens_bundle_pdf
+from .sens_table import SensTableGroup
+
+TIMEOUT = 60*60*24
+
+executor = None
+
+
+def get_executor():
+    """ The pool is created on first use in each web worker process """
+    global executor
+    if executor is None:
+        executor = ProcessPoolExecutor(
+            max_workers=getattr(settings, 'PDF_WORKERS', 2),
+            mp_context=get_context('spawn'))
+    return executor
+
+
+def get_render_args(kind, farm_year, option):
+    """
+    kind is 'budget' (option is the budget type 'cur', 'base' or 'var') or 'sens'
+    (option is the selections (tbltype, crop, tblnum, isdiff, base)).  The text
+    is generated for the selections rather than read from the text stored by
+    the last table request, which a 304 response skips.
+    Returns the render function and its arguments, which are plain data.
+    """
+    if kind == 'budget':
+        bm = BudgetManager(farm_year)
+        text = (bm.get_baseline_budget() if option == 'base' else
+                bm.get_variance_budget() if option == 'var' else
+                bm.get_current_budget())
+        return render_budget_pdf, (farm_year.farm_name, farm_year.crop_year,
+                                   text, option)
+    text = SensTableGroup(farm_year).get_selected_text(*option)
+    return render_sens_pdf, (farm_year.farm_name, farm_year.crop_year,
+                             text, option[3])
+
+
+def get_pdf_key(func, args):
+    """ The print date is in the page footer, so it's part of the key """
+    blob = json.dumps([func.__name__, date.today().isoformat(), args],
+                      sort_keys=True)
+    return f'pdf:{hashlib.sha256(blob.encode()).hexdigest()}'
+
+
+def get_pdf(kind, farm_year, option):
+    """ Return the PDF bytes, rendering in this process if they aren't cached """
+    return get_cached_pdf(*get_render_args(kind, farm_year, option))
+
+
+def get_sens_bundle(farm_year, tables):
+    """ As get_pdf for a multi-page PDF of (sensitivity_text, isdiff) pairs """
+    return get_cached_pdf(render_sens_bundle_pdf,
+                          (farm_year.farm_name, farm_year.crop_year, tables))
+
+
+def get_cached_pdf(func, args):
+    key = get_pdf_key(func, args)
+    pdf = cache.get(key)
+    if pdf is None:
+        pdf = func(*args)
+        cache.set(key, pdf, TIMEOUT)
+    return pdf
+
+
+def submit_pdf(kind, farm_year, option, filename):
+    """
+    Start rendering in the process pool unless the bytes are already cached.
+    Returns a job id for get_job.
+    """
+    func, args = get_render_args(kind, farm_year, option)
+    return submit_job(func, args, farm_year.user_id, filename)
+
+
+def submit_sens_bundle(farm_year, tables, filename):
+    """
+    Start rendering a multi-page PDF of the given (sensitivity_text, isdiff)
+    pairs in the process pool.  A reportlab document can't be split across
+    processes, so one worker renders the whole bundle.  Returns a job id.
+    """
+    return submit_job(render_sens_bundle_pdf,
+                      (farm_year.farm_name, farm_year.crop_year, tables),
+                      farm_year.user_id, filename)
+
+
+def submit_job(func, args, user_id, filename):
+    PdfJob.objects.filter(
+        user_id=user_id,
+        created_on__lt=timezone.now() - timedelta(seconds=TIMEOUT)).delete()
+    key = get_pdf_key(func, args)
+    pdf = cache.get(key)
+    job = PdfJob.objects.create(user_id=user_id, filename=filename, pdf=pdf,
+                                status='pending' if pdf is None else 'done')
+    if pdf is None:
+        future = get_executor().submit(func, *args)
+        future.add_done_callback(partial(finish_job, job.pk, key))
+    return job.pk.hex
+
+
+def finish_job(job_id, key, future):
+    try:
+        pdf = future.result()
+    except Exception:
+        PdfJob.objects.filter(pk=job_id).update(status='failed')
+    else:
+        cache.set(key, pdf, TIMEOUT)
+        PdfJob.objects.filter(pk=job_id).update(status='done', pdf=pdf)
+
+
+def get_job(job_id):
+    """ The PdfJob, without its bytes, or None if there is no such job """
+    try:
+        return PdfJob.objects.defer('pdf').filter(pk=job_id).first()
+    except ValidationError:
+        return None
+
+
+def get_job_pdf(job):
+    pdf = PdfJob.objects.filter(pk=job.pk).values_list('pdf', flat=True).first()
+    return None if pdf is None else bytes(pdf)
+
+
+class PdfJob(models.Model):
+    """
+    A PDF rendered in the background for a user, with status 'pending', 'done' or
+    'failed'.  Jobs are deleted a day after they are submitted.
+    """
+    STATUSES = [(s, s) for s in ('pending', 'done', 'failed')]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    status = models.CharField(max_length=8, choices=STATUSES, default='pending')
+    filename = models.CharField(max_length=200)
+    pdf = models.BinaryField(null=True)
+    created_on = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.filename}: {self.status}'
+
+
+def stream_sens_zip(farm_year, tables):
+    """
+    Render the given (filename, sensitivity_text, isdiff) triples in parallel in
+    the process pool, yielding a zip archive in chunks as the PDFs complete.
+    """
+    filenames, texts, isdiffs = zip(*tables) if tables else ((), (), ())
+    pdfs = get_executor().map(render_sens_pdf, repeat(farm_year.farm_name),
+                              repeat(farm_year.crop_year), texts, isdiffs)
+    buffer = ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        for filename, pdf in zip(filenames, pdfs):
+            zf.writestr(filename, pdf)
+            yield buffer.pop()
+    yield buffer.pop()
+
+
+class ChunkBuffer(object):
+    """ A write-only, unseekable file for ZipFile, emptied as chunks are sent """
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
@@ -0,0 +1,69 @@
+"""
+Module querycount
+
+Counts and fingerprints the SQL statements run while serving a request, so
+lazy queries issued from inside loops (e.g. FarmCrop.has_budget or
+MarketCrop.planted_acres called per crop) show up as a statement repeated
+many times.  A fingerprint is the statement with its literals and IN lists
+collapsed, so statements differing only in their parameters match.  Views can
+be given query budgets; tests enforce them by raising QueryBudgetExceeded.
+"""
+import re
+from collections import Counter
+
+from django.conf import settings
+
+LITERALS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def fingerprint(sql):
+    """ The statement with literals, placeholders and IN lists collapsed """
+    for pattern, repl in LITERALS:
+        sql = pattern.sub(repl, sql)
+    return sql.strip()
+
+
+class QueryCounter(object):
+    """
+    An execute wrapper (see connection.execute_wrapper) counting statements.
+    Raw statements are counted as run; fingerprinting is left to the end,
+    since the same statement text recurs.
+    """
+    def __init__(self):
+        self.counts = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        self.counts[sql] += 1
+        return execute(sql, params, many, context)
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def fingerprints(self):
+        result = Counter()
+        for sql, count in self.counts.items():
+            result[fingerprint(sql)] += count
+        return result
+
+    def repeats(self, threshold=None):
+        """ (fingerprint, count) for statements run at least threshold times """
+        if threshold is None:
+            threshold = settings.QUERY_REPEAT_THRESHOLD
+        return [(fp, count) for fp, count in self.fingerprints().most_common()
+                if count >= threshold]
+
+
+def get_budget(view):
+    """ The query budget of a view by url name, or None if it has none """
+    return settings.QUERY_BUDGETS.get(view)
@@ -55,7 +55,7 @@ insertedfarmyear (
   land_repairs, eligible_persons_for_cap, state_id, user_id,
   is_model_run_date_manual, other_nongrain_expense,
   other_nongrain_income, manual_model_run_date,
-  basis_increment, est_sequest_frac, first_date)
+  basis_increment, est_sequest_frac, first_date, inputs_updated_on)
   SELECT
   farm_name, county_code, crop_year, cropland_acres_owned,
   variable_rented_acres, cash_rented_acres, var_rent_cap_floor_frac,
@@ -63,7 +63,7 @@ insertedfarmyear (
   land_repairs, eligible_persons_for_cap, state_id, user_id,
   is_model_run_date_manual, other_nongrain_expense,
   other_nongrain_income, manual_model_run_date,
-  basis_increment, est_sequest_frac, first_date
+  basis_increment, est_sequest_frac, first_date, now()
   FROM newfarmyear
   RETURNING id as farm_year_id
 ),
@@ -177,6 +177,24 @@ insertedfarmcrops (
   ON n4.market_crop_type_id = imc.market_crop_type_id
   RETURNING farm_year_id, id as farm_crop_id, farm_crop_type_id
 ),
+newimpacts (
+  ins_crop_id, market_crop_type_id, fsa_crop_type_id
+) AS (
+  VALUES
+  {self.get_imp_vals()}
+),
+insertedimpacts (
+  id
+) AS (
+  INSERT INTO public.main_farmyearimpact(
+  farm_year_id, crop_year, state_id, county_code,
+  ins_crop_id, market_crop_type_id, fsa_crop_type_id)
+  SELECT
+  ify.farm_year_id, nfy.crop_year, nfy.state_id, nfy.county_code,
+  n6.ins_crop_id, n6.market_crop_type_id, n6.fsa_crop_type_id
+  FROM newimpacts n6 CROSS JOIN insertedfarmyear ify CROSS JOIN newfarmyear nfy
+  RETURNING id
+),
 """
         if self.get_fbc_vals() != '':
             sql += f"""
@@ -266,6 +284,10 @@ select * FROM insertedfbcs LIMIT 1;
                     vals.append('(' + ', '.join(str(v) for v in d['values']) + ')')
         return ',\n'.join(vals)
 
+    def get_imp_vals(self):
+        return ',\n'.join('(' + ', '.join(str(v) for v in keys) + ')'
+                           for keys in self.fy_dict['impacts'])
+
     def get_fbc_vals(self):
         vals = []
         for d0 in self.fy_dict['fsa_crops']:
@@ -291,7 +313,8 @@ def get_fy_dict(fy, user_id):
             fy.other_nongrain_income, dstr(fy.manual_model_run_date),
             fy.basis_increment, fy.est_sequest_frac, dstr(fy.first_date)
         ],
-        'fsa_crops': []
+        'fsa_crops': [],
+        'impacts': fy.impact_keys()
     }
     for fa in fy.fsa_crops.all():
         fa_dict = {
@@ -0,0 +1,122 @@
+"""
+Module sens_history
+
+Keeps a bounded history of sensitivity data snapshots for a farm year.
+The newest snapshot is the farm year's sensitivity_data.  Older snapshots are
+stored as deltas against it, so the diff of the newest data against any
+retained snapshot is just its negated delta.  A snapshot can be named as a
+checkpoint.  Checkpoints outlive unnamed snapshots, but only the newest
+NAMED of them are kept.
+"""
+from datetime import datetime
+
+import numpy as np
+
+
+class SensHistory(object):
+    SIZE = 10  # the number of unnamed snapshots retained
+    NAMED = 5  # the number of checkpoints retained, including the newest data's
+
+    def __init__(self, farm_year):
+        self.farm_year = farm_year
+        history = farm_year.sensitivity_history or {}
+        # when the newest snapshot was taken and its checkpoint name (if any)
+        self.taken = history.get('taken')
+        self.label = history.get('label')
+        # older snapshots, newest first: dicts with keys taken, label, delta
+        self.snapshots = history.get('snapshots', [])
+
+    def push(self, alldata):
+        """
+        Make alldata the newest snapshot, rebasing the retained deltas on it.
+        If alldata is unchanged from the newest snapshot, nothing is written
+        and False is returned.
+        """
+        current = self.farm_year.sensitivity_data
+        new = [np.array(v) for v in alldata]
+        if current is not None:
+            prev = [np.array(v) for v in current]
+            if any(p.shape != n.shape for p, n in zip(prev, new)):
+                # crops were added or removed so older deltas are meaningless
+                self.snapshots, self.label = [], None
+            else:
+                step = [p - n for p, n in zip(prev, new)]
+                if all(not np.any(s) for s in step):
+                    return False
+                for snap in self.snapshots:
+                    snap['delta'] = rebase(snap['delta'], step)
+                self.snapshots.insert(0, {'taken': self.taken, 'label': self.label,
+                                          'delta': rebase(None, step)})
+                self.label = None
+                self.evict()
+        self.taken = datetime.now().isoformat(timespec='seconds')
+        self.farm_year.sensitivity_data = alldata
+        self.save()
+        return True
+
+    def evict(self):
+        """ Drop the oldest unnamed snapshots and checkpoints beyond their limits """
+        unnamed = [s for s in self.snapshots if s['label'] is None]
+        named = [s for s in self.snapshots if s['label'] is not None]
+        keep = self.NAMED - (self.label is not None)
+        dropped = {id(s) for s in unnamed[self.SIZE:] + named[keep:]}
+        self.snapshots = [s for s in self.snapshots if id(s) not in dropped]
+
+    def checkpoint(self, label):
+        """ Name the newest snapshot, moving the name from any older one """
+        for snap in self.snapshots:
+            if snap['label'] == label:
+                snap['label'] = None
+        self.label = label
+        self.evict()
+        self.save()
+
+    def find(self, base):
+        """
+        base is the zero-based index of a retained snapshot (newest first)
+        or the name of a checkpoint.  Returns the snapshot dict or None.
+        """
+        if isinstance(base, str):
+            return next((s for s in self.snapshots if s['label'] == base), None)
+        return self.snapshots[base] if 0 <= base < len(self.snapshots) else None
+
+    def diff(self, base=0):
+        """
+        Return the newest data minus the data of the given snapshot as nested
+        lists in the format of sensitivity_data, or None if there is no such
+        snapshot.  Diffing against the newest data's own checkpoint gives zeros.
+        """
+        current = self.farm_year.sensitivity_data
+        if current is None:
+            return None
+        if isinstance(base, str) and base == self.label:
+            return [np.zeros_like(np.array(v)).tolist() for v in current]
+        snap = self.find(base)
+        if snap is None:
+            return None
+        if snap['delta'] is None:
+            return [np.zeros_like(np.array(v)).tolist() for v in current]
+        return [(-np.array(d)).tolist() for d in snap['delta']]
+
+    def choices(self):
+        """ (index, description) pairs for populating a drop-down """
+        return [(i, (s['taken'] or 'earlier').replace('T', ' ') +
+                 ('' if s['label'] is None else f" ({s['label']})"))
+                for i, s in enumerate(self.snapshots)]
+
+    def save(self):
+        self.farm_year.sensitivity_history = {
+            'taken': self.taken, 'label': self.label, 'snapshots': self.snapshots}
+
+
+def rebase(delta, step):
+    """
+    Given a snapshot's delta against the old newest data and the step from the
+    new newest data to the old, return its delta against the new newest data.
+    A delta of None means no difference.
+    """
+    rebased = (step if delta is None else
+               [np.array(d) + s for d, s in zip(delta, step)])
+    if all(not np.any(r) for r in rebased):
+        return None
+    return [r.tolist() for r in rebased]
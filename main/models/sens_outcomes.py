@@ -0,0 +1,201 @@
+"""
+Module sens_outcomes
+
+Attaches a probability to each (price factor, yield factor) cell of the
+sensitivity grid and summarizes the stored sensitivity data as distributions:
+expected value, standard deviation, downside quantiles, the mean of the worst
+outcomes and the probability of a loss, for the farm and each crop.
+
+Price factors are lognormal with mean one and the price volatility factor RMA
+uses in rating (as in Premium.simulate_losses), scaled down for the part of the
+season already past, and fixed once the harvest price is final.  Yield factors
+follow the distribution configured in settings.  Price and yield are joined by
+a Gaussian copula with the configured correlation, evaluated on a fine grid of
+standard normal points and binned into the cells, each cell taking the factors
+nearer to its own than to any other.
+"""
+import numpy as np
+from django.conf import settings
+
+from .sens_table import SensTableGroup
+from .util import lower_tail_mean
+
+NZ = 201  # points per axis of the standard normal grid
+ZMAX = 5
+DEFAULT_YIELD_CV = .15
+QUANTILES = [.05, .1, .25]
+TBLTYPES = ['revenue', 'title', 'indem', 'cost', 'cashflow']
+
+
+def cell_edges(factors):
+    return (factors[1:] + factors[:-1]) / 2
+
+
+def price_factors(z, price_vol):
+    """ Lognormal price factors with mean one for standard normal z """
+    return np.exp(price_vol * z - price_vol**2 / 2)
+
+
+def yield_factors(z, yield_cv, distribution='normal'):
+    """
+    Yield factors with mean one and coefficient of variation yield_cv for
+    standard normal z, either 'normal' (truncated at zero) or 'lognormal'
+    """
+    if distribution not in ('normal', 'lognormal'):
+        raise ValueError(f'Unexpected yield distribution {distribution}')
+    return (np.maximum(0, 1 + yield_cv * z) if distribution == 'normal' else
+            np.exp(yield_cv * z - yield_cv**2 / 2))
+
+
+def get_crop_params(fc):
+    """ (price volatility, yield cv, expected revenue) of a farm crop """
+    data = fc.indem_price_yield_data()
+    vol = 0 if data['hp'][1] else data['pv'][0] * remaining_season(fc)
+    cv = (0 if fc.farmbudgetcrop.is_farm_yield_final else
+          settings.SENS_YIELD_CV.get(fc.farm_crop_type_id, DEFAULT_YIELD_CV))
+    revenue = fc.planted_acres * fc.sens_farm_expected_yield() * fc.harvest_price()
+    return vol, cv, revenue
+
+
+def remaining_season(fc):
+    """
+    Scaling for the price volatility by the square root of the fraction of
+    the season from projected to harvest price discovery still to come
+    """
+    start, end = fc.proj_price_disc_end, fc.harv_price_disc_end
+    if start is None or end is None or end <= start:
+        return 1
+    mrd = fc.farm_year.get_model_run_date()
+    left = (end - max(mrd, start)).days / (end - start).days
+    return np.sqrt(min(max(left, 0), 1))
+
+
+def grid_weights(pfrange, yfrange, price_vol, yield_cv, correlation=0,
+                 distribution='normal'):
+    """
+    Probabilities array(np, ny) of the grid cells for price factors with
+    volatility price_vol and yield factors with coefficient of variation
+    yield_cv and the given distribution.
+    """
+    rho = min(max(correlation, -.99), .99)
+    z = np.linspace(-ZMAX, ZMAX, NZ)
+    zp, zy = np.meshgrid(z, z, indexing='ij')
+    density = np.exp(-(zp**2 - 2 * rho * zp * zy + zy**2) / (2 * (1 - rho**2)))
+    pf = price_factors(zp, price_vol)
+    yf = yield_factors(zy, yield_cv, distribution)
+    cells = (np.searchsorted(cell_edges(pfrange), pf) * len(yfrange) +
+             np.searchsorted(cell_edges(yfrange), yf))
+    weights = np.bincount(cells.ravel(), weights=density.ravel(),
+                          minlength=len(pfrange) * len(yfrange))
+    return (weights / weights.sum()).reshape(len(pfrange), len(yfrange))
+
+
+def weighted_quantiles(values, weights, quantiles):
+    """
+    array(nq, n) quantiles of values array(ncells, n) with weights of the same
+    shape summing to one along the first axis
+    """
+    order = np.argsort(values, axis=0)
+    values = np.take_along_axis(values, order, axis=0)
+    cumulative = np.cumsum(np.take_along_axis(weights, order, axis=0), axis=0)
+    columns = np.arange(values.shape[1])
+    return np.array([values[np.argmax(cumulative >= q - 1e-12, axis=0), columns]
+                     for q in quantiles])
+
+
+class GridWeights(object):
+    """
+    Cell probabilities for the farm crops of a sensitivity table group.  The
+    distribution for several crops, e.g. the farm, uses their volatilities and
+    yield variations weighted by expected revenue.
+    """
+    def __init__(self, grp):
+        self.grp = grp
+        self.correlation = settings.SENS_PRICE_YIELD_CORRELATION
+        self.distribution = settings.SENS_YIELD_DISTRIBUTION
+        self.params = {fc.pk: get_crop_params(fc) for fc in grp.farm_crops}
+        self.weights_mem = {}
+
+    def for_crops(self, crops):
+        params = np.array([self.params[fc.pk] for fc in crops])
+        revenue = params[:, 2]
+        share = (revenue / revenue.sum() if revenue.sum() > 0 else
+                 np.full(len(crops), 1 / len(crops)))
+        vol, cv = share @ params[:, :2]
+        key = (round(vol, 6), round(cv, 6))
+        if key not in self.weights_mem:
+            self.weights_mem[key] = grid_weights(
+                self.grp.pfrange, self.grp.yfrange, vol, cv, self.correlation,
+                self.distribution)
+        return self.weights_mem[key]
+
+    def get_block_weights(self):
+        """
+        array(nblocks, np, ny) weights for the blocks of the sensitivity data:
+        each crop, the farm and possibly wheat/dc beans
+        """
+        crops = self.grp.farm_crops
+        blocks = [[fc] for fc in crops] + [crops]
+        if self.grp.wheatdc:
+            blocks.append([crops[i] for i in self.grp.wheatdcixs])
+        return np.array([self.for_crops(block) for block in blocks])
+
+
+class SensOutcomes(object):
+    """ Probability weighted statistics of the sensitivity data """
+    def __init__(self, farm_year):
+        self.farm_year = farm_year
+        self.grp = SensTableGroup(farm_year)
+        self.weights = None
+
+    def get_data(self):
+        """
+        The stored data by table type, array(nblocks, np, ny) in $000, with no
+        change in basis.  Computed without saving if nothing is stored.
+        """
+        alldata = self.farm_year.sensitivity_data
+        if alldata is None or len(alldata[4]) != self.grp.nfcs + (
+                2 if self.grp.wheatdc else 1):
+            alldata = self.grp.compute_current_data()
+        result = {}
+        for tbltype, values in zip(TBLTYPES, alldata):
+            values = np.array(values)
+            result[tbltype] = (values[..., self.grp.nst] if values.ndim == 4 else
+                               values)
+        return result
+
+    def get_stats(self, alpha=.1):
+        """
+        For each table type and crop tag, the mean, standard deviation,
+        quantiles, mean of the worst alpha fraction of outcomes and
+        probability of a negative value, in $000
+        """
+        if len(self.grp.farm_crops) == 0:
+            return {}
+        gw = GridWeights(self.grp)
+        self.weights = gw.get_block_weights()
+        weights = self.weights.reshape(len(self.weights), -1).T  # (ncells, nblocks)
+        tags = self.grp.get_crop_tags()[0]
+        result = {}
+        for tbltype, data in self.get_data().items():
+            values = data.reshape(len(data), -1).T
+            mean = (weights * values).sum(axis=0)
+            std = np.sqrt((weights * (values - mean)**2).sum(axis=0))
+            quantiles = weighted_quantiles(values, weights, QUANTILES)
+            shortfall = lower_tail_mean(values, weights, alpha)
+            prob_loss = (weights * (values < 0)).sum(axis=0)
+            result[tbltype] = {}
+            for tag in tags:
+                ix = self.grp.get_crop_idx(tag)
+                stats = {'mean': mean[ix], 'std': std[ix],
+                         'shortfall': shortfall[ix], 'prob_loss': prob_loss[ix]}
+                stats.update({f'q{round(100 * q):02d}': value[ix]
+                              for q, value in zip(QUANTILES, quantiles)})
+                result[tbltype][tag] = {k: round(float(v), 3)
+                                        for k, v in stats.items()}
+        return result
+
+    def get_weights(self, crop='farm'):
+        """ The cell probabilities for a crop tag as nested lists """
+        ix = self.grp.get_crop_idx(crop)
+        return self.weights[ix].round(5).tolist()
@@ -1,5 +1,6 @@
 import io
 from datetime import datetime
+from types import SimpleNamespace
 # from time import perf_counter
 
 import numpy as np
@@ -7,7 +8,7 @@ from reportlab.lib import colors
 from reportlab.lib.colors import Color
 from reportlab.lib.units import inch
 from reportlab.platypus.doctemplate import SimpleDocTemplate
-from reportlab.platypus.flowables import Spacer
+from reportlab.platypus.flowables import Flowable, PageBreak, Spacer
 from reportlab.platypus.tables import Table
 
 # Global constants
@@ -214,3 +215,63 @@ class SensPdf(object):
             canvas.drawString(50, 25, footer)
             canvas.restoreState()
         return make_header
+
+
+def render_sens_pdf(farm_name, crop_year, sensitivity_text, isdiff):
+    """
+    Render a sensitivity table from plain data, so it can run in a worker
+    process without Django.  Returns the PDF bytes.
+    """
+    farm_year = SimpleNamespace(farm_name=farm_name, crop_year=crop_year,
+                                sensitivity_text=sensitivity_text)
+    return SensPdf(farm_year, isdiff).create().getvalue()
+
+
+class TableStart(Flowable):
+    """ A zero-size marker placed where a table's pages begin """
+    def __init__(self, header):
+        super().__init__()
+        self.header = header
+
+    def wrap(self, availWidth, availHeight):
+        return 0, 0
+
+    def draw(self):
+        pass
+
+
+class BundleDocTemplate(SimpleDocTemplate):
+    """
+    Draws the header of the table being laid out on each page.  Headers are
+    drawn at the end of the page, since the table isn't known when it begins.
+    """
+    header = None
+
+    def afterFlowable(self, flowable):
+        if isinstance(flowable, TableStart):
+            self.header = flowable.header
+
+    def afterPage(self):
+        if self.header is not None:
+            self.header(self.canv, self)
+
+
+def render_sens_bundle_pdf(farm_name, crop_year, tables):
+    """
+    Render several sensitivity tables into one PDF, each starting a page.
+    tables is a list of (sensitivity_text, isdiff) pairs.  Returns the PDF bytes.
+    """
+    objects_to_draw = []
+    for text, isdiff in tables:
+        pdf = SensPdf(SimpleNamespace(farm_name=farm_name, crop_year=crop_year,
+                                      sensitivity_text=text), isdiff)
+        objects_to_draw += [TableStart(pdf.first_page_header()),
+                            Spacer(1*inch, 1*inch), pdf.get_table(), PageBreak()]
+    buffer = io.BytesIO()
+    doc_template = BundleDocTemplate(
+        buffer, pagesize=(11*inch, 8.5*inch),
+        leftMargin=0.25*inch, rightMargin=0.25*inch,
+        topMargin=0.325*inch, bottomMargin=0.25*inch,
+        title='Sensitivity Tables', author='IFBT')
+    doc_template.build(objects_to_draw[:-1])
+    return buffer.getvalue()
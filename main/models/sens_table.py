@@ -11,6 +11,9 @@ from numpy import array, zeros
 
 from main.models.farm_crop import FarmCrop
 from main.models.market_crop import MarketCrop
+from main.models.sens_history import SensHistory
+from main.models.spans import span
+from main.models.util import single_flight
 
 
 class SensTableGroup(object):
@@ -24,8 +27,12 @@ class SensTableGroup(object):
         self.farm_year = farm_year
         # farm crop related info
         self.farm_crops = [fc for fc in
-                           FarmCrop.objects.filter(farm_year=farm_year)
+                           farm_year.farm_crops.select_related(
+                               'farm_crop_type', 'market_crop')
                            if fc.planted_acres > 0 and fc.has_budget()]
+        FarmCrop.prefetch_reference_data(farm_year, self.farm_crops)
+        MarketCrop.prefetch_contract_stats(
+            farm_year, [fc.market_crop for fc in self.farm_crops])
         self.croptypes = [fc.farm_crop_type for fc in self.farm_crops]
         self.croptypeids = [ct.pk for ct in self.croptypes]
         self.croptypenames = [str(fc.farm_crop_type)
@@ -102,6 +109,8 @@ class SensTableGroup(object):
                                     for fc in self.fsa_crops])
 
         self.has_diffs = None
+        self.history = None
+        self.snapshot_choices = []
         self.info = None
 
     def get_farm_crop_idx(self, crop):
@@ -119,45 +128,73 @@ class SensTableGroup(object):
         It computes current data and diff and stores both in the database.
         It also generates the cashflow table, stores its text
         in the database for sens_pdf and returns its text.
+        Concurrent calls for a farm year with the same inputs compute it once.
         """
         if len(self.farm_crops) == 0:
             return None
+        text, self.has_diffs, self.snapshot_choices = single_flight(
+            'sens', self.farm_year, self.compute_cashflow_farm,
+            kinds=['sensitivity_history'])
+        return self.get_html_table(text, 'cashflow', 'farm')
+
+    def compute_cashflow_farm(self):
+        """
+        Compute and store all data, returning the cashflow table text together
+        with the state get_info needs, so a concurrent request can share them.
+        """
         self.set_all_data()
-        return self.get_selected_table(
+        text = self.get_selected_text(
             'cashflow', 'farm', (None if self.basis_incr == 0 else self.nst))
+        return text, self.has_diffs, self.snapshot_choices
+
+    def get_selected_table(self, tbltype, crop, tblnum, isdiff=False, base=None):
+        """
+        Generate a specific table by the user's selections for html, saving its
+        sensitivity text (see get_selected_text).
+        """
+        return self.get_html_table(
+            self.get_selected_text(tbltype, crop, tblnum, isdiff, base),
+            tbltype, crop)
+
+    def get_html_table(self, table, tbltype, crop):
+        """ Save a table's text for sens_pdf, then adapt the table for html """
+        self.save_sens_text(table)
+
+        # delete spanned columns for html, but not for pdf
+        cs = self.get_class(tbltype, crop.replace('_', ''))
+        cs(self).delete_spanned_cols(table)
 
-    def get_selected_table(self, tbltype, crop, tblnum, isdiff=False):
+        return table
+
+    @span('table_format')
+    def get_selected_text(self, tbltype, crop, tblnum, isdiff=False, base=None):
         """
-        Generate a specific table by the user's selections.
+        Generate the text of a specific table by the user's selections.
 
         tbltype is in {'cashflow', 'revenue', 'title', 'indem', 'cost'},
         isdiff is a boolean
         crop is enumerated in self.croptype_tag and is
           in {'farm', 'corn', 'fsbeans', 'dcbeans', 'wwheat', 'swheat','wheatdcbeans'}
         tblnum is None or a zero based integer 0..nincr
+        base is None or the snapshot index or checkpoint name to diff against
 
-        It computes no data.  If it's a diff table, it uses the stored diff data.
-        Otherwise it uses the stored current data.
-
-        It saves its sensitivity text for sens_pdf
+        It computes no data.  If it's a diff table, it uses the stored diff data,
+        or the diff against base if given.  Otherwise it uses the stored current data.
+        The text keeps its spanned columns, as sens_pdf needs.
         """
         crop = crop.replace('_', '')
+        diffdata = None
+        if isdiff and base is not None:
+            diffdata = SensHistory(self.farm_year).diff(base)
+        if isdiff and diffdata is None:
+            diffdata = self.farm_year.sensitivity_diff
         revenue, title, indem, cost, cashflow = (
             np.array(v) for v in (
-                self.farm_year.sensitivity_diff if isdiff else
-                self.farm_year.sensitivity_data))
+                diffdata if isdiff else self.farm_year.sensitivity_data))
         data = (revenue if tbltype == 'revenue' else cost if tbltype == 'cost' else
                 title if tbltype == 'title' else indem if tbltype == 'indem' else
                 cashflow)
-        table = self.get_table(data, tbltype, crop, tblnum, isdiff)
-
-        self.save_sens_text(table)
-
-        # delete spanned columns for html, but not for pdf
-        cs = self.get_class(tbltype, crop)
-        cs(self).delete_spanned_cols(table)
-
-        return table
+        return self.get_table(data, tbltype, crop, tblnum, isdiff)
 
     def get_class(self, tbltype, crop):
         return (SensTableTitle if tbltype == 'title' else
@@ -205,30 +242,66 @@ class SensTableGroup(object):
         if len(self.farm_crops) == 0:
             return {'farmyear': self.farm_year.pk}
         if self.info is None:
-            names = (['Farm'] + self.croptypenames[:] +
-                     (['Wheat/DC Beans'] if self.wheatdc else []))
-            tags = [n.lower().replace(' ', '').replace('/', '') for n in names]
+            tags, names = self.get_crop_tags()
             self.info = {'farmyear': self.farm_year.pk,
                          'crops': zip(tags, names),
                          'hasdiff': self.has_diffs,
+                         'snapshots': self.snapshot_choices,
                          }
             self.info['nincr'] = 0 if self.bfrange is None else self.nincr
             self.info['basis_incr'] = 0 if self.bfrange is None else self.basis_incr
         return self.info
 
+    def get_crop_tags(self):
+        """ The crop tags and names available for selection """
+        names = (['Farm'] + self.croptypenames[:] +
+                 (['Wheat/DC Beans'] if self.wheatdc else []))
+        tags = [n.lower().replace(' ', '').replace('/', '') for n in names]
+        return tags, names
+
+    def get_all_tables(self):
+        """
+        Generate the text of every table a user could select, from the stored
+        data.  Computes no data and saves nothing.
+        Returns a list of ((tbltype, crop, tblnum, isdiff), table) pairs.
+        """
+        if len(self.farm_crops) == 0 or self.farm_year.sensitivity_data is None:
+            return []
+        stored = [(False, self.farm_year.sensitivity_data)]
+        if self.farm_year.sensitivity_diff is not None:
+            stored.append((True, self.farm_year.sensitivity_diff))
+        tags, names = self.get_crop_tags()
+        result = []
+        for isdiff, alldata in stored:
+            revenue, title, indem, cost, cashflow = (np.array(v) for v in alldata)
+            for tbltype, data in [('cashflow', cashflow), ('revenue', revenue),
+                                  ('title', title), ('indem', indem),
+                                  ('cost', cost)]:
+                tblnums = ([None] if self.bfrange is None or
+                           tbltype not in ['revenue', 'cashflow'] else
+                           range(self.nincr))
+                for crop in tags:
+                    for tblnum in tblnums:
+                        table = self.get_table(data, tbltype, crop, tblnum, isdiff)
+                        result.append(((tbltype, crop, tblnum, isdiff), table))
+        return result
+
     # ----------------
     # DATA COMPUTATION
     # ----------------
     def set_all_data(self):
         """
         Compute current data and diffs if possible, saving both current data and
-        diff data to the database.
+        diff data to the database.  The previous data is kept in the history
+        unless the current data is unchanged, in which case nothing is saved.
         """
         alldata = self.compute_current_data()
-        if self.farm_year.sensitivity_data is not None:
+        self.history = SensHistory(self.farm_year)
+        if self.history.push(alldata):
             self.farm_year.sensitivity_diff = self.compute_diff_data()
-        self.farm_year.sensitivity_data = alldata
-        self.farm_year.save()
+        else:
+            self.has_diffs = len(self.history.snapshots) > 0
+        self.snapshot_choices = self.history.choices()
 
     def compute_current_data(self, save=False):
         """
@@ -246,33 +319,20 @@ class SensTableGroup(object):
                     self.cost_values, self.cashflow_values]]
         if save:
             self.farm_year.sensitivity_data = alldata
-            self.farm_year.save()
         return alldata
 
-    def compute_diff_data(self):
+    def compute_diff_data(self, base=0):
         """
-        Collect all the diffs
+        Collect all the diffs against a retained snapshot (by default the most
+        recent one) or a named checkpoint, see SensHistory.diff
         """
-        revenue_p, title_p, indem_p, cost_p, cashflow_p = (
-            np.array(v) for v in self.farm_year.sensitivity_data)
-
-        if revenue_p.shape == self.revenue_values.shape:
-            self.has_diffs = True
-            revenue_d = self.revenue_values - revenue_p
-            title_d = self.title_values - title_p
-            indem_d = self.indem_values - indem_p
-            cost_d = self.cost_values - cost_p
-            cashflow_d = self.cashflow_values - cashflow_p
-            return [ar.tolist() for ar in
-                    [revenue_d, title_d, indem_d, cost_d, cashflow_d]]
-        else:
-            self.has_diffs = False
-            return None
+        diff = self.history.diff(base)
+        self.has_diffs = diff is not None
+        return diff
 
     def save_sens_text(self, rslt):
         """ Save the the currently selected text table to the database """
         self.farm_year.sensitivity_text = rslt
-        self.farm_year.save()
 
     def set_gov_pmts(self):
         """ set apportioned gov pmt in dollars (optimization)
@@ -0,0 +1,112 @@
+"""
+Module spans
+
+Always-on timing of the named stages of the budget and sensitivity pipelines
+(premium, indemnity, gov_payment, price_lookup, table_format, json and
+artifact_save).  Each span is counted in a histogram per (stage, view),
+where the view is the url name of the request being served, and logged as a
+JSON line to the 'main.spans' logger if it is enabled at DEBUG level.  Each
+process periodically copies its histograms to the shared cache, where the
+metrics view merges them.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import monotonic, perf_counter
+
+from django.core.cache import cache
+
+# upper bounds in seconds of the histogram buckets; the last bucket is +Inf
+BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+FLUSH_SECS = 10
+TIMEOUT = 60*60*24
+WORKERS_KEY = 'spans:workers'
+
+logger = logging.getLogger('main.spans')
+current_view = ContextVar('current_view', default='')
+
+lock = threading.Lock()
+# (stage, view) -> [bucket counts..., +Inf count, sum of seconds]
+histograms = {}
+last_flush = monotonic()
+
+
+@contextmanager
+def span(stage):
+    """ Time a stage; usable as a context manager or a method decorator """
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, perf_counter() - start)
+
+
+def record(stage, secs):
+    global last_flush
+    view = current_view.get()
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(json.dumps({'event': 'span', 'stage': stage, 'view': view,
+                                 'ms': round(1000 * secs, 3),
+                                 'pid': os.getpid()}))
+    with lock:
+        hist = histograms.setdefault((stage, view), [0] * (len(BUCKETS) + 2))
+        hist[bisect_left(BUCKETS, secs)] += 1
+        hist[-1] += secs
+        flush = monotonic() - last_flush > FLUSH_SECS
+        if flush:
+            last_flush = monotonic()
+    if flush:
+        flush_histograms()
+
+
+def worker_key():
+    return f'spans:{socket.gethostname()}:{os.getpid()}'
+
+
+def flush_histograms():
+    """ Copy this process's histograms to the cache and register the process """
+    key = worker_key()
+    with lock:
+        snapshot = [[stage, view, hist[:]]
+                    for (stage, view), hist in histograms.items()]
+    cache.set(key, snapshot, TIMEOUT)
+    workers = cache.get(WORKERS_KEY, [])
+    if key not in workers:
+        cache.set(WORKERS_KEY, workers + [key], TIMEOUT)
+
+
+def collect_histograms():
+    """ Merge the histograms of all processes which have flushed recently """
+    flush_histograms()
+    merged = {}
+    workers = cache.get(WORKERS_KEY, [])
+    snapshots = cache.get_many(workers)
+    for stage, view, hist in (row for rows in snapshots.values() for row in rows):
+        total = merged.setdefault((stage, view), [0] * len(hist))
+        for i, value in enumerate(hist):
+            total[i] += value
+    # forget the processes which have exited
+    if len(snapshots) < len(workers):
+        cache.set(WORKERS_KEY, list(snapshots), TIMEOUT)
+    return merged
+
+
+def render_metrics(merged):
+    """ The histograms in the Prometheus text exposition format """
+    lines = ['# HELP ifbt_span_seconds Time spent in a pipeline stage',
+             '# TYPE ifbt_span_seconds histogram']
+    for (stage, view), hist in sorted(merged.items()):
+        labels = f'stage="{stage}",view="{view}"'
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), hist[:-1]):
+            cumulative += count
+            lines.append(f'ifbt_span_seconds_bucket{{{labels},le="{bound}"}} '
+                         f'{cumulative}')
+        lines.append(f'ifbt_span_seconds_sum{{{labels}}} {hist[-1]:.6f}')
+        lines.append(f'ifbt_span_seconds_count{{{labels}}} {cumulative}')
+    return '\n'.join(lines) + '\n'
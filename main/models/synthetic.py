@@ -0,0 +1,207 @@
+"""
+Module synthetic
+
+Generates populations of synthetic farm years for scale and load testing.
+Farm years are created through FarmYear.save (which adds the insurable farm,
+market and fsa crops for the county) and FarmCrop.add_farm_budget_crop, then
+given randomized acres, yields, insurance choices, FSA base acres and contracts
+with bulk updates.  A seeded generator makes a population reproducible.
+Synthetic users are named prefix-n and given an email address in a reserved
+domain, so deleting a population can't remove real accounts.
+"""
+from datetime import date, timedelta
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.db import transaction
+from ext.models import InsurableCropsForCty, InsuranceDates
+from .farm_crop import FarmCrop
+from .farm_year import FarmYear
+from .fsa_crop import FsaCrop
+from .market_crop import Contract
+
+FARMS_PER_USER = 10
+# reserved (RFC 2606) domain marking synthetic users
+EMAIL_DOMAIN = 'synthetic.invalid'
+# fallback yields by farm crop type when a farm crop has no budget
+TYPICAL_YIELD = {1: 190, 2: 58, 3: 75, 4: 55, 5: 40}
+
+
+def get_counties(crop_year, state_ids):
+    """ (state_id, county_code) pairs with insurable crops and insurance dates """
+    insurable = set(InsurableCropsForCty.objects
+                    .filter(state_id__in=state_ids)
+                    .values_list('state_id', 'county_code').distinct())
+    dated = set(InsuranceDates.objects
+                .filter(crop_year=crop_year, state_id__in=state_ids)
+                .values_list('state_id', 'county_code').distinct())
+    return sorted(insurable & dated)
+
+
+def synthetic_users(prefix):
+    return User.objects.filter(username__startswith=f'{prefix}-',
+                               email__endswith=f'@{EMAIL_DOMAIN}')
+
+
+def next_user_number(prefix):
+    """ One more than the largest n of any username prefix-n """
+    names = (User.objects.filter(username__startswith=f'{prefix}-')
+             .values_list('username', flat=True))
+    numbers = [int(name[len(prefix) + 1:]) for name in names
+               if name[len(prefix) + 1:].isdigit()]
+    return max(numbers, default=-1) + 1
+
+
+def delete_population(prefix):
+    """ Delete the synthetic users with the prefix and their farm years """
+    return synthetic_users(prefix).delete()[0]
+
+
+class FarmYearGenerator(object):
+    """
+    Creates farm years spread uniformly over the given counties.  The scale of
+    each farm is lognormal around mean_acres.
+    """
+    def __init__(self, crop_year, state_ids, seed=None, prefix='synth',
+                 mean_acres=1500, contract_frac=0.3):
+        self.crop_year = crop_year
+        self.counties = get_counties(crop_year, state_ids)
+        if len(self.counties) == 0:
+            raise ValueError(f'No insurable counties for {crop_year} in {state_ids}')
+        self.rng = np.random.default_rng(seed)
+        self.prefix = prefix
+        self.mean_acres = mean_acres
+        self.contract_frac = contract_frac
+        self.model_run_date = min(date.today(), date(crop_year, 10, 1))
+
+    def generate(self, count):
+        """
+        Create count farm years, yielding (farm_year_id, error) for each, where
+        error is None on success.  Each farm year is created in its own
+        transaction, so a county with incomplete data doesn't stop the run.
+        """
+        start = next_user_number(self.prefix)
+        names = [f'{self.prefix}-{start + i}'
+                 for i in range((count + FARMS_PER_USER - 1) // FARMS_PER_USER)]
+        users = User.objects.bulk_create(
+            [User(username=name, email=f'{name}@{EMAIL_DOMAIN}', password='!')
+             for name in names])
+        for i in range(count):
+            state_id, county_code = self.counties[
+                self.rng.integers(len(self.counties))]
+            try:
+                with transaction.atomic():
+                    farm_year = self.make_farm_year(
+                        users[i // FARMS_PER_USER], f'Synthetic farm {i}',
+                        state_id, county_code)
+                yield farm_year.pk, None
+            except Exception as ex:
+                yield None, f'{state_id}-{county_code}: {type(ex).__name__}: {ex}'
+
+    def make_farm_year(self, user, farm_name, state_id, county_code):
+        rng = self.rng
+        farm_year = FarmYear.objects.create(
+            user=user, farm_name=farm_name, state_id=state_id,
+            county_code=county_code, crop_year=self.crop_year)
+        total = round(self.mean_acres * rng.lognormal(0, 0.5))
+        owned, cash, var = (total * rng.dirichlet([2, 3, 1])).round()
+        FarmYear.objects.filter(pk=farm_year.pk).update(
+            cropland_acres_owned=owned, cash_rented_acres=cash,
+            variable_rented_acres=var, manual_model_run_date=self.model_run_date,
+            is_model_run_date_manual=self.model_run_date != date.today(),
+            var_rent_cap_floor_frac=rng.choice([0, .1, .2]) if var else 0,
+            annual_land_int_expense=round(owned * rng.uniform(0, 80)),
+            annual_land_principal_pmt=round(owned * rng.uniform(0, 200)),
+            property_taxes=round(owned * rng.uniform(20, 60)),
+            land_repairs=round(owned * rng.uniform(0, 20)),
+            eligible_persons_for_cap=int(rng.integers(1, 4)),
+            other_nongrain_income=round(total * rng.uniform(0, 50)),
+            other_nongrain_expense=round(total * rng.uniform(0, 50)))
+        farm_year = FarmYear.objects.get(pk=farm_year.pk)
+        farm_crops = self.set_farm_crops(farm_year, owned + cash + var)
+        self.set_fsa_crops(farm_year, farm_crops)
+        self.add_contracts(farm_year, farm_crops)
+        return farm_year
+
+    def set_farm_crops(self, farm_year, total):
+        """ Split the acres among the crops, then add budgets and yields """
+        rng = self.rng
+        wheat = rng.uniform(.05, .15) if rng.random() < .4 else 0
+        corn = rng.uniform(.35, .6) * (1 - wheat)
+        acres = {1: corn, 2: 1 - corn - wheat, 3: wheat,
+                 5: wheat * rng.uniform(.5, 1)}
+        farm_crops = list(farm_year.farm_crops.select_related('farm_year',
+                                                              'market_crop'))
+        for fc in farm_crops:
+            fc.planted_acres = round(total * acres.get(fc.farm_crop_type_id, 0))
+            if fc.planted_acres == 0:
+                continue
+            budgets = [bc for bc, descr in fc.get_budget_crops()]
+            budgets = ([bc for bc in budgets if bc.state_id == farm_year.state_id]
+                       or budgets)
+            expected = TYPICAL_YIELD.get(fc.farm_crop_type_id, 100)
+            if budgets:
+                budget = budgets[rng.integers(len(budgets))]
+                FarmCrop.add_farm_budget_crop(fc.pk, budget.pk)
+                expected = budget.farm_yield or expected
+            fc.appr_yield = round(expected * rng.uniform(.85, 1.05))
+            fc.adj_yield = fc.rate_yield = round(fc.appr_yield * rng.uniform(.93, 1))
+            fc.ye, fc.ta = bool(rng.random() < .5), bool(rng.random() < .7)
+            fc.coverage_type, fc.product_type = 1, 0
+            fc.base_coverage_level = rng.choice([.7, .75, .8, .85])
+        # bulk_update bypasses update_related_crop_ins_settings, so give
+        # fs and dc beans the settings of the one with more acres
+        beans = [fc for fc in farm_crops if fc.is_beans()]
+        if beans:
+            main = max(beans, key=lambda fc: fc.planted_acres)
+            for fc in beans:
+                fc.coverage_type, fc.product_type, fc.base_coverage_level = (
+                    main.coverage_type, main.product_type,
+                    main.base_coverage_level)
+        FarmCrop.objects.bulk_update(
+            farm_crops, ['planted_acres', 'appr_yield', 'adj_yield', 'rate_yield',
+                         'ye', 'ta', 'coverage_type', 'product_type',
+                         'base_coverage_level'])
+        return farm_crops
+
+    def set_fsa_crops(self, farm_year, farm_crops):
+        """ Base acres near the planted acres, split between PLC and ARC-CO """
+        rng = self.rng
+        fsa_crops = list(farm_year.fsa_crops.all())
+        for fsa in fsa_crops:
+            crops = [fc for fc in farm_crops
+                     if fc.market_crop.fsa_crop_id == fsa.pk and fc.planted_acres]
+            base = round(sum(fc.planted_acres for fc in crops) * rng.uniform(.7, 1))
+            fsa.plc_base_acres = round(base * rng.choice([0, .5, 1]))
+            fsa.arcco_base_acres = base - fsa.plc_base_acres
+            fsa.plc_yield = (round(max(fc.appr_yield for fc in crops) *
+                                   rng.uniform(.7, .9)) if crops else 0)
+        FsaCrop.objects.bulk_update(
+            fsa_crops, ['plc_base_acres', 'arcco_base_acres', 'plc_yield'])
+
+    def add_contracts(self, farm_year, farm_crops):
+        """ A few futures and basis contracts for part of the expected bushels """
+        rng = self.rng
+        start = date(self.crop_year - 1, 9, 1)
+        days = (self.model_run_date - start).days
+        contracts = []
+        for market_crop in farm_year.market_crops.all():
+            bushels = sum(fc.appr_yield * fc.planted_acres for fc in farm_crops
+                          if fc.market_crop_id == market_crop.pk)
+            if bushels == 0:
+                continue
+            price = market_crop.harvest_price()
+            for i in range(rng.integers(0, 4)):
+                contract_date = start + timedelta(days=int(rng.integers(days)))
+                size = min(max(round(bushels * self.contract_frac *
+                                     rng.uniform(.1, .4), -2), 100), 999999)
+                if rng.random() < .6:
+                    contracts.append(Contract(
+                        market_crop=market_crop, contract_date=contract_date,
+                        bushels=size,
+                        futures_price=round(price * rng.uniform(.9, 1.1), 2)))
+                else:
+                    contracts.append(Contract(
+                        market_crop=market_crop, contract_date=contract_date,
+                        bushels=size, basis_price=round(rng.uniform(-.4, .2), 2)))
+        Contract.objects.bulk_create(contracts)
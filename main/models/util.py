@@ -1,7 +1,13 @@
 """ Module util -- utility functions for main model """
 import numbers
+import time
+import zlib
 from collections import defaultdict
+from contextlib import contextmanager
+from copy import deepcopy
 import numpy as np
+from django.core.cache import cache
+from django.db import connection
 
 
 def scal(factor):
@@ -16,14 +22,151 @@ def scal(factor):
 def any_changed(instance, *fields):
     """
     Check an instance to see if the values of any of the listed fields changed.
+    Uses the values remembered by ChangeTrackingMixin when available, and otherwise
+    compares with a fresh copy of the row.
     """
     if not instance.pk:
         return False
+    loaded = getattr(instance, 'loaded_values', None)
+    if loaded is not None and all(field in loaded for field in fields):
+        return any((loaded[field] != getattr(instance, field) for field in fields))
     dbinst = instance.__class__._default_manager.get(pk=instance.pk)
     return any((getattr(dbinst, field) != getattr(instance, field)
                 for field in fields))
 
 
+class ChangeTrackingMixin:
+    """
+    Model mixin which remembers the field values of an instance as loaded from the
+    database, so changed fields can be found without another query.  Saving a
+    loaded instance writes only its changed columns unless update_fields is given.
+    """
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.set_loaded_values(field_names, values)
+        return instance
+
+    def set_loaded_values(self, attnames, values):
+        # copy containers so in-place changes to JSON or array values are detected
+        self.loaded_values = {
+            attname: deepcopy(value) if isinstance(value, (list, dict)) else value
+            for attname, value in zip(attnames, values)}
+
+    def changed_fields(self):
+        """
+        Names of the loaded fields whose values differ from the loaded values,
+        or None if the instance was not loaded from the database.
+        """
+        loaded = getattr(self, 'loaded_values', None)
+        if loaded is None:
+            return None
+        return [f.name for f in self._meta.concrete_fields
+                if f.attname in loaded and
+                getattr(self, f.attname) != loaded[f.attname]]
+
+    def save(self, *args, **kwargs):
+        changed = self.changed_fields()
+        pkname = self._meta.pk.attname
+        if (changed is not None and not args and 'update_fields' not in kwargs and
+                not kwargs.get('force_insert') and not self._state.adding and
+                self.pk is not None and self.pk == self.loaded_values.get(pkname)):
+            kwargs['update_fields'] = changed
+        super().save(*args, **kwargs)
+        attnames = [f.attname for f in self._meta.concrete_fields
+                    if f.attname in self.__dict__]
+        self.set_loaded_values(attnames, [getattr(self, a) for a in attnames])
+
+
+@contextmanager
+def advisory_lock(name, farm_year_id):
+    """
+    Hold a Postgres session-level advisory lock on (name, farm year id).
+    The lock is shared by all processes using the database.
+    """
+    namespace = zlib.crc32(name.encode()) & 0x7fffffff
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_lock(%s, %s)', [namespace, farm_year_id])
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(%s, %s)',
+                           [namespace, farm_year_id])
+
+
+def single_flight(name, farm_year, compute, kinds=(), timeout=30):
+    """
+    Run compute() for a farm year at most once at a time across processes.
+    Callers arriving while it runs for the same inputs (see version_token, with
+    the listed artifact kinds) wait for it and share its result, which must be
+    picklable.  Side effects of compute() on the caller's objects happen only in
+    the caller which ran it, so callers apply any they need from the result.
+    Results are shared through the default cache, so callers in other processes
+    share them only if it's a shared cache (see CACHES in settings); otherwise
+    they wait for the lock and compute again.
+    """
+    key = f'flight:{name}:{farm_year.pk}:{farm_year.version_token(*kinds)}'
+    result = cache.get(key)
+    if result is None:
+        with advisory_lock(name, farm_year.pk):
+            result = cache.get(key)
+            if result is None:
+                result = compute()
+                cache.set(key, result, timeout)
+                return result
+    # another request computed and stored it
+    farm_year.artifacts_mem.clear()
+    return result
+
+
+def get_data_version():
+    """
+    A value which changes whenever shared reference data or prices are loaded.
+    It is kept in a database sequence, so a bump by a management command is seen
+    at once by every web worker process.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT last_value, is_called FROM main_data_version')
+        version, is_called = cursor.fetchone()
+    return version if is_called else 0
+
+
+def bump_data_version():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT nextval('main_data_version')")
+
+
+def dependent_materialized_views(table):
+    """ Names of the materialized views which select directly from a table """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """SELECT DISTINCT v.relname FROM pg_depend d
+               JOIN pg_rewrite r ON r.oid = d.objid
+               JOIN pg_class v ON v.oid = r.ev_class
+               WHERE d.refobjid = %s::regclass AND v.relkind = 'm'
+               AND v.oid <> d.refobjid ORDER BY v.relname""", [table])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def refresh_materialized_view(name):
+    """
+    Refresh a materialized view, concurrently if it has a unique index so that
+    reads aren't blocked.  Returns (seconds, whether it was concurrent).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """SELECT EXISTS (SELECT 1 FROM pg_index
+               WHERE indrelid = %s::regclass AND indisunique
+               AND indpred IS NULL)""", [name])
+        concurrently = cursor.fetchone()[0]
+        start = time.perf_counter()
+        cursor.execute(f'REFRESH MATERIALIZED VIEW '
+                       f'{"CONCURRENTLY " if concurrently else ""}'
+                       f'{connection.ops.quote_name(name)}')
+    return time.perf_counter() - start, concurrently
+
+
 def has_farm_years(user):
     from .farm_year import FarmYear
     if not isinstance(user, int):
@@ -87,3 +230,19 @@ def one_like(var):
 
 def zero_like(var):
     return 0 if scal(var) else np.zeros_like(var)
+
+
+def lower_tail_mean(values, weights, alpha):
+    """
+    Weighted mean of the lowest alpha fraction (by weight) of values
+    array(ncells, n) along the first axis, for each of the n columns.
+    weights is array(ncells) or array(ncells, n), summing to one along the
+    first axis.
+    """
+    order = np.argsort(values, axis=0)
+    values = np.take_along_axis(values, order, axis=0)
+    weights = (weights[order] if np.ndim(weights) == 1 else
+               np.take_along_axis(weights, order, axis=0))
+    below = np.cumsum(weights, axis=0) - weights
+    in_tail = np.clip(alpha - below, 0, weights)
+    return (values * in_tail).sum(axis=0) / alpha
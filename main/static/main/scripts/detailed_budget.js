@@ -23,6 +23,83 @@ function updateBudget() {
   }
 }
 
+// Poll until a stale budget is recomputed in the background, then update the
+// page in place.  If the layout changed (e.g. a crop was added), reload to
+// render the new stored budget.
+let refreshPolls = 0
+
+function refreshBudget() {
+  const rxhr = new XMLHttpRequest();
+  rxhr.onreadystatechange = () => {
+    if (rxhr.readyState === XMLHttpRequest.DONE) {
+      if (rxhr.status === 200) {
+        const response = JSON.parse(rxhr.responseText)
+        if (response.pending) {
+          if (++refreshPolls < 120) {
+            setTimeout(refreshBudget, 1000)
+          } else {
+            alert("Failed to refresh the budget.");
+          }
+          return
+        }
+        const data = response.data
+        if (sameLayout(data)) {
+          updateTables(data)
+          updateKeyData(data.keydata)
+          document.querySelector("#refreshing").remove()
+        } else {
+          location.reload()
+        }
+      } else {
+        alert("Failed to refresh the budget.");
+      }
+    }
+  }
+  rxhr.open("GET", "table/?bdgtype=cur&refresh=1");
+  rxhr.send();
+}
+
+// The rows and the cells in the last row must match what was rendered
+function sameLayout(data) {
+  const checks = [[data.rev, "#revcalctable tbody tr", true],
+                  [data.tables.kd, "#kdtable tbody tr", true],
+                  [data.tables.pa, "#patable tbody tr", false],
+                  [data.tables.pb, "#pbtable tbody tr", false]]
+  if (data.tables.wheatdc) {
+    checks.push([data.tables.wheatdc, "#wheatdctable tbody tr", false])
+  }
+  const sameTable = ([rows, sel, rowhead]) => {
+    const trs = document.querySelectorAll(sel)
+    if (trs.length !== rows[0].length + rows[1].length) {
+      return false
+    }
+    const last = rows[1][rows[1].length - 1]
+    const ncells = rowhead ? last[1].length + 1 : last.length
+    return trs.length === 0 || trs[trs.length - 1].children.length === ncells
+  }
+  if (!checks.every(sameTable)) {
+    return false
+  }
+  return Object.entries(data.keydata).every(([key, kd]) => {
+    const trs = document.querySelectorAll(`table[data-keydata="${key}"] tbody tr`)
+    return trs.length === kd.rows.length
+  })
+}
+
+function updateKeyData(keydata) {
+  Object.entries(keydata).forEach(([key, kd]) => {
+    const trs = document.querySelectorAll(`table[data-keydata="${key}"] tbody tr`)
+    kd.rows.forEach((row, i) => {
+      let td = trs[i].firstElementChild
+      td.innerHTML = row[0]
+      row[1].forEach((val) => {
+        td = td.nextElementSibling
+        if (td) td.innerHTML = val
+      })
+    })
+  })
+}
+
 function updateTables(data) {
   updateRowsWithRowHead(data.rev, "#revcalctable tbody tr")
   updateBudgetTables(data.tables)
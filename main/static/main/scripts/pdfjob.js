@@ -0,0 +1,35 @@
+// Start rendering a PDF in the background, poll the job and download when done.
+// The url is a download view url with a query string, e.g. downloadbudget/23/?b=cur
+function downloadPdf(url) {
+  const xhr = new XMLHttpRequest();
+  xhr.onreadystatechange = () => {
+    if (xhr.readyState === XMLHttpRequest.DONE) {
+      if (xhr.status === 200) {
+        pollPdfJob(JSON.parse(xhr.responseText).job)
+      } else {
+        alert("Failed to start creating the PDF.");
+      }
+    }
+  }
+  xhr.open("GET", url + "&job=1");
+  xhr.send();
+}
+
+function pollPdfJob(job) {
+  const xhr = new XMLHttpRequest();
+  xhr.onreadystatechange = () => {
+    if (xhr.readyState === XMLHttpRequest.DONE) {
+      const status = (xhr.status === 200 ? JSON.parse(xhr.responseText).status
+                      : 'failed')
+      if (status === 'done') {
+        location.href = `/pdfjob/${job}/download/`
+      } else if (status === 'pending') {
+        setTimeout(() => pollPdfJob(job), 500)
+      } else {
+        alert("Failed to create the PDF.");
+      }
+    }
+  }
+  xhr.open("GET", `/pdfjob/${job}/`);
+  xhr.send();
+}
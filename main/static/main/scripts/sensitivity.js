@@ -67,6 +67,8 @@ function manageButtonbarVisibility(basis_incr) {
 function getTblInfo(basis_incr) {
   diffcb = document.querySelector("#diff")
   let diff = (diffcb ? document.querySelector("#diff").checked : false)
+  let basesel = document.querySelector("#base-sel")
+  let base = (basesel ? basesel.value : '')
   let type = document.querySelector("#type-sel").value
   let crop = document.querySelector("#crop-sel").value
   let basistype = ['revenue', 'cashflow'].includes(type)
@@ -75,7 +77,8 @@ function getTblInfo(basis_incr) {
     let btnSel = document.querySelectorAll('#btnBar .selected')
     tblnum = btnSel[0].id[3]
   }
-  return {'tbltype': type, 'crop': crop, 'tblnum': tblnum, 'isdiff': diff}
+  return {'tbltype': type, 'crop': crop, 'tblnum': tblnum, 'isdiff': diff,
+          'base': base}
 }
 
 function makeRequest(farmyear, basis_incr) {
@@ -88,7 +91,8 @@ function makeRequest(farmyear, basis_incr) {
   }
   xhr.onreadystatechange = replaceTable;
   const url = `sens_table/` +
-    `?tbltype=${ti.tbltype}&crop=${ti.crop}&tblnum=${ti.tblnum}&isdiff=${ti.isdiff}`
+    `?tbltype=${ti.tbltype}&crop=${ti.crop}&tblnum=${ti.tblnum}&isdiff=${ti.isdiff}` +
+    `&base=${ti.base}`
 
   xhr.open("GET", url);
   xhr.send();
@@ -1,21 +1,59 @@
+from concurrent.futures import Future
 from datetime import datetime
+import io
 import pprint
 import sys
 
 import numpy as np
+from reportlab.lib.units import inch
+from reportlab.platypus.flowables import PageBreak, Spacer
 
 from django.contrib.auth.models import User
-from django.test import TestCase, Client
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test import (TestCase, TransactionTestCase, Client, RequestFactory,
+                         override_settings)
 from django.urls import reverse
 
-from .models.farm_year import FarmYear
+from .models.farm_year import FarmYear, FarmYearImpact
 from .models.farm_crop import FarmCrop
+from .models.market_crop import MarketCrop, Contract, get_farm_year_contracts
 from .models.fsa_crop import cty_expected_yield_helper
 from .models.budget_table import BudgetManager
+from .models.util import single_flight, bump_data_version, lower_tail_mean
 from .models.sens_table import SensTableGroup
+from .models.sens_history import SensHistory
+from .models import batch, pdf_jobs
+from .models import spans
+from .models.querycount import QueryCounter, fingerprint
+from .models.benchmark import measure
+from .models.synthetic import FarmYearGenerator, delete_population
+from .models.loadtest import crop_form_data
+from .forms import FarmCropUpdateForm
+from .views import get_float_param
+from .management.commands import refresh_insurance_views
+from .models.coverage import CoverageOptimizer
+from .models.sens_outcomes import SensOutcomes, grid_weights
+from .models.montecarlo import FarmSimulation, StreamingSummary
+from .models.backtest import BudgetBacktest
+from .models.allocation import AcreageOptimizer, compositions
+from .models.batch import (get_active_farm_year_ids, recompute_farm_year,
+                           recompute_farm_years)
+from .models.budget_pdf import render_budget_pdf
+from .models.replicate_farmyear import Replicate
+from .models.sens_pdf import render_sens_pdf, BundleDocTemplate, TableStart
 
 np.set_printoptions(threshold=sys.maxsize)
 
+
+class InlineExecutor:
+    """ Runs submitted calls at once in this thread, inside the test transaction """
+    def submit(self, func, *args):
+        future = Future()
+        future.set_result(func(*args))
+        return future
+
 class CtyExpectedYieldHelper(TestCase):
     def setUp(self):
         self.vec_yf = np.array([.5, .6, .7, .8, .9, .95, 1.0, 1.05, 1.1])
@@ -68,6 +106,447 @@ class FarmYearTestCase(TestCase):
         for fc in self.farm_year.farm_crops.all():
             self.assertIn(fc.farm_crop_type_id, (1, 2, 3, 5))
 
+    def test_load_test_crop_form_data(self):
+        fc = self.farm_year.farm_crops.get(farm_crop_type_id=1)
+        form = FarmCropUpdateForm(data=crop_form_data(fc), instance=fc)
+        self.assertTrue(form.is_valid(), form.errors)
+
+    def test_impact_index(self):
+        year = self.farm_year.crop_year
+        self.assertEqual(self.farm_year.impacts.count(), 4)
+        self.assertEqual(FarmYearImpact.affected(year, 5, 1), [self.farm_year.pk])
+        self.assertIn(self.farm_year.pk,
+                      FarmYearImpact.affected(year, market_crop_type_id=1))
+        self.assertEqual(FarmYearImpact.affected(year, 5, 2), [])
+        self.assertEqual(FarmYearImpact.affected(year - 1, 5, 1), [])
+
+    def test_impact_index_follows_location(self):
+        year = self.farm_year.crop_year
+        farm_year = FarmYear.objects.get(pk=self.farm_year.pk)
+        farm_year.county_code = 3
+        farm_year.save()
+        self.assertEqual(farm_year.impacts.count(), 4)
+        self.assertEqual(FarmYearImpact.affected(year, 5, 1), [])
+        self.assertEqual(FarmYearImpact.affected(year, 5, 3), [farm_year.pk])
+
+
+class PrefetchReferenceDataTestCase(TestCase):
+    def setUp(self):
+        joe = User.objects.create(username='joe125', password='verrysekrit')
+        self.farm_year = FarmYear.objects.create(user=joe, farm_name="Joey's farm",
+                                                 state_id=17, county_code=119)
+
+    def test_prefetched_rows_match_lookups(self):
+        farm_crops = list(self.farm_year.farm_crops.all())
+        FarmCrop.prefetch_reference_data(self.farm_year, farm_crops)
+        with self.assertNumQueries(0):
+            prefetched = [(fc.price_yield(), fc.area_plans()) for fc in farm_crops]
+        for fc, (py, plans) in zip(self.farm_year.farm_crops.all(), prefetched):
+            self.assertEqual(fc.price_yield().pk, py.pk)
+            self.assertEqual(fc.area_plans(), plans)
+
+
+class FarmCropChangeTrackingTestCase(TestCase):
+    def setUp(self):
+        joe = User.objects.create(username='joe127', password='verrysekrit')
+        self.farm_year = FarmYear.objects.create(user=joe, farm_name="Joey's farm",
+                                                 state_id=17, county_code=119)
+
+    def test_changed_fields(self):
+        fc = self.farm_year.farm_crops.get(farm_crop_type_id=1)
+        self.assertEqual(fc.changed_fields(), [])
+        fc.planted_acres = 500
+        self.assertEqual(fc.changed_fields(), ['planted_acres'])
+        # update the changed column, then bump the farm year's inputs_updated_on
+        with self.assertNumQueries(2):
+            fc.save(no_check=True)
+        self.assertEqual(fc.changed_fields(), [])
+        self.assertEqual(FarmCrop.objects.get(pk=fc.pk).planted_acres, 500)
+
+    def test_bean_settings_follow_without_refetch(self):
+        fsbeans = self.farm_year.farm_crops.get(farm_crop_type_id=2)
+        fsbeans.coverage_type = 1
+        fsbeans.save()
+        dcbeans = self.farm_year.farm_crops.get(farm_crop_type_id=5)
+        self.assertEqual(dcbeans.coverage_type, 1)
+
+
+class ContractStatsTestCase(TestCase):
+    def setUp(self):
+        joe = User.objects.create(username='joe126', password='verrysekrit')
+        self.farm_year = FarmYear.objects.create(
+            user=joe, farm_name="Joey's farm", state_id=17, county_code=119,
+            is_model_run_date_manual=True, manual_model_run_date=datetime(2026, 7, 9))
+        self.corn = self.farm_year.market_crops.get(market_crop_type_id=1)
+        for dt, bu, fp, bp in [(datetime(2026, 3, 1), 1000, 4.50, None),
+                               (datetime(2026, 4, 1), 3000, 4.70, 0.10),
+                               (datetime(2026, 5, 1), 2000, None, 0.20),
+                               (datetime(2026, 9, 1), 500, 5.00, None)]:
+            Contract.objects.create(market_crop=self.corn, contract_date=dt,
+                                    bushels=bu, futures_price=fp, basis_price=bp)
+
+    def test_contract_stats(self):
+        self.assertEqual(self.corn.futures_contracted_bu(), 4000)
+        self.assertEqual(self.corn.basis_contracted_bu(), 5000)
+        self.assertAlmostEqual(self.corn.avg_futures_contract_price(), 4.65)
+        self.assertAlmostEqual(self.corn.avg_basis_contract_price(), 0.14)
+        stats = self.corn.contract_stats()
+        self.assertEqual(stats['planned_futures_bu'], 500)
+        self.assertEqual(stats['planned_basis_bu'], 0)
+        self.assertAlmostEqual(stats['planned_avg_futures_price'], 5.00)
+
+    def test_prefetch_contract_stats(self):
+        market_crops = list(self.farm_year.market_crops.all())
+        with self.assertNumQueries(1):
+            MarketCrop.prefetch_contract_stats(self.farm_year, market_crops)
+        with self.assertNumQueries(0):
+            stats = [mc.avg_futures_contract_price() for mc in market_crops]
+        self.assertAlmostEqual(stats[0], 4.65)
+
+    def test_farm_year_contracts(self):
+        self.assertEqual(list(get_farm_year_contracts(self.farm_year)), [])
+        self.farm_year.farm_crops.filter(farm_crop_type_id=1).update(
+            planted_acres=1000)
+        with self.assertNumQueries(1):
+            rows = [(str(c.market_crop), c.bushels)
+                    for c in get_farm_year_contracts(self.farm_year)]
+        self.assertEqual(rows, [('Corn', 1000), ('Corn', 3000), ('Corn', 2000)])
+
+
+class FarmYearArtifactTestCase(TestCase):
+    def setUp(self):
+        joe = User.objects.create(username='joe128', password='verrysekrit')
+        self.farm_year = FarmYear.objects.create(user=joe, farm_name="Joey's farm",
+                                                 state_id=17, county_code=119)
+
+    def test_narrow_write(self):
+        self.assertFalse(self.farm_year.has_budget())
+        with self.assertNumQueries(1):
+            self.farm_year.current_budget_data = {'revenue': {}, 'budget': {}}
+        self.farm_year.budget_text = {'tables': None}
+        self.farm_year.current_budget_data = {'revenue': {'a': [1]}, 'budget': {}}
+        self.assertEqual(self.farm_year.artifacts.count(), 2)
+        fy = FarmYear.objects.get(pk=self.farm_year.pk)
+        self.assertTrue(fy.has_budget())
+        self.assertFalse(fy.has_baseline_budget())
+        self.assertEqual(fy.current_budget_data['revenue'], {'a': [1]})
+
+    def test_update_baseline(self):
+        self.farm_year.current_budget_data = {'revenue': {}, 'budget': {'b': [2]}}
+        self.farm_year.update_baseline()
+        fy = FarmYear.objects.get(pk=self.farm_year.pk)
+        with self.assertNumQueries(1):
+            fy.prefetch_artifacts('current_budget_data', 'baseline_budget_data')
+        self.assertEqual(fy.baseline_budget_data, fy.current_budget_data)
+
+
+class VersionTokenTestCase(TestCase):
+    def setUp(self):
+        joe = User.objects.create(username='joe130', password='verrysekrit')
+        self.farm_year = FarmYear.objects.create(user=joe, farm_name="Joey's farm",
+                                                 state_id=17, county_code=119)
+
+    def get_token(self, *kinds):
+        return FarmYear.objects.get(pk=self.farm_year.pk).version_token(*kinds)
+
+    def test_token_follows_inputs_and_artifacts(self):
+        token = self.get_token('sensitivity_data')
+        self.assertEqual(token, self.get_token('sensitivity_data'))
+        self.farm_year.budget_text = {'tables': None}
+        self.assertEqual(token, self.get_token('sensitivity_data'))
+        self.farm_year.sensitivity_data = [[1]]
+        token1 = self.get_token('sensitivity_data')
+        self.assertNotEqual(token, token1)
+        corn = self.farm_year.market_crops.get(market_crop_type_id=1)
+        Contract.objects.create(market_crop=corn, bushels=1000, futures_price=4.5)
+        self.assertNotEqual(token1, self.get_token('sensitivity_data'))
+
+    def test_token_follows_data_version(self):
+        token = self.get_token('sensitivity_data')
+        bump_data_version()
+        self.assertNotEqual(token, self.get_token('sensitivity_data'))
+
+    def test_single_flight_shares_result(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return {'n': len(calls)}
+        self.assertEqual(single_flight('test', self.farm_year, compute), {'n': 1})
+        self.assertEqual(single_flight('test', self.farm_year, compute), {'n': 1})
+        FarmYear.touch(self.farm_year.pk)
+        farm_year = FarmYear.objects.get(pk=self.farm_year.pk)
+        self.assertEqual(single_flight('test', farm_year, compute), {'n': 2})
+
+    def test_stored_budget_goes_stale(self):
+        self.assertEqual(self.farm_year.get_stored_current_budget(), (None, False))
+        self.farm_year.current_budget_text = {
+            'info': {'version': self.get_token('baseline_budget_data')}}
+        farm_year = FarmYear.objects.get(pk=self.farm_year.pk)
+        self.assertTrue(farm_year.get_stored_current_budget()[1])
+        FarmYear.touch(self.farm_year.pk)
+        farm_year = FarmYear.objects.get(pk=self.farm_year.pk)
+        budget, fresh = farm_year.get_stored_current_budget()
+        self.assertIsNotNone(budget)
+        self.assertFalse(fresh)
+
+    def test_sens_table_not_modified(self):
+        etag = self.get_token('sensitivity_data', 'sensitivity_diff',
+                              'sensitivity_history')
+        response = Client().get(
+            reverse('sens_table', args=[self.farm_year.pk]) +
+            '?tbltype=cashflow&crop=farm', HTTP_IF_NONE_MATCH=f'"{etag}"')
+        self.assertEqual(response.status_code, 304)
+
+
+class SensHistoryTestCase(TestCase):
+    def setUp(self):
+        joe = User.objects.create(username='joe129', password='verrysekrit')
+        self.farm_year = FarmYear.objects.create(user=joe, farm_name="Joey's farm",
+                                                 state_id=17, county_code=119)
+
+    def data(self, v):
+        return [[[v, v + 1]], [[v * 2]]]
+
+    def test_diff_against_any_snapshot(self):
+        for v in (1, 2, 2, 5):
+            SensHistory(self.farm_year).push(self.data(v))
+        history = SensHistory(self.farm_year)
+        self.assertEqual(len(history.snapshots), 2)
+        self.assertEqual(history.diff(0), [[[3, 3]], [[6]]])
+        self.assertEqual(history.diff(1), [[[4, 4]], [[8]]])
+        self.assertIsNone(history.diff(2))
+
+    def test_checkpoint_survives_eviction(self):
+        history = SensHistory(self.farm_year)
+        history.push(self.data(0))
+        history.checkpoint('start')
+        for v in range(1, SensHistory.SIZE + 3):
+            SensHistory(self.farm_year).push(self.data(v))
+        history = SensHistory(self.farm_year)
+        self.assertEqual(len(history.snapshots), SensHistory.SIZE + 1)
+        top = SensHistory.SIZE + 2
+        self.assertEqual(history.diff('start'), [[[top, top]], [[2 * top]]])
+        self.assertIsNone(history.find('nope'))
+
+    def test_oldest_checkpoints_evicted(self):
+        for v in range(SensHistory.NAMED + 2):
+            history = SensHistory(self.farm_year)
+            history.push(self.data(v))
+            history.checkpoint(f'cp{v}')
+        history = SensHistory(self.farm_year)
+        labels = [s['label'] for s in history.snapshots]
+        self.assertEqual(len(labels), SensHistory.NAMED - 1)
+        self.assertEqual(labels[-1], 'cp2')
+        self.assertIsNone(history.find('cp1'))
+        self.assertIsNotNone(history.diff('cp2'))
+
+    def test_shape_change_clears_history(self):
+        SensHistory(self.farm_year).push(self.data(1))
+        SensHistory(self.farm_year).push(self.data(2))
+        SensHistory(self.farm_year).push([[[1, 2, 3]], [[4]]])
+        self.assertEqual(SensHistory(self.farm_year).snapshots, [])
+
+
+class PdfJobKeyTestCase(TestCase):
+    def test_key_depends_on_text_only(self):
+        args = ("Joey's farm", 2026, {'tables': [[1, 2]]}, 'cur')
+        key = pdf_jobs.get_pdf_key(render_budget_pdf, args)
+        self.assertEqual(key, pdf_jobs.get_pdf_key(render_budget_pdf, args))
+        changed = ("Joey's farm", 2026, {'tables': [[1, 3]]}, 'cur')
+        self.assertNotEqual(key, pdf_jobs.get_pdf_key(render_budget_pdf, changed))
+        self.assertNotEqual(key, pdf_jobs.get_pdf_key(render_sens_pdf, args))
+
+
+class SensBundlePdfTestCase(TestCase):
+    def test_header_follows_table(self):
+        headers = []
+        flowables = [TableStart(lambda canvas, doc: headers.append(('a', doc.page))),
+                     Spacer(inch, 5*inch), Spacer(inch, 5*inch), PageBreak(),
+                     TableStart(lambda canvas, doc: headers.append(('b', doc.page))),
+                     Spacer(inch, inch)]
+        BundleDocTemplate(io.BytesIO(), pagesize=(11*inch, 8.5*inch)).build(flowables)
+        self.assertEqual(headers, [('a', 1), ('a', 2), ('b', 3)])
+
+
+class RefreshInsuranceViewsTestCase(TestCase):
+    def test_refresh(self):
+        out = io.StringIO()
+        call_command('refresh_insurance_views', stdout=out)
+        self.assertIn('Refreshed 3 views', out.getvalue())
+        for model in refresh_insurance_views.VIEWS:
+            self.assertIn(f'Refreshed {model._meta.db_table} concurrently',
+                          out.getvalue())
+
+    def test_duplicate_keys(self):
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE MATERIALIZED VIEW test_dup_view AS '
+                           'SELECT 1 AS id UNION ALL SELECT 1')
+        with self.assertRaisesMessage(CommandError, 'duplicate id values'):
+            with transaction.atomic():
+                refresh_insurance_views.Command().ensure_unique_index(
+                    'test_dup_view', 'id')
+
+
+class FloatParamTestCase(TestCase):
+    def test_get_float_param(self):
+        factory = RequestFactory()
+        for query, expected in [('', .2), ('alpha=.5', .5), ('alpha=5', 1),
+                                ('alpha=x', .2), ('alpha=nan', .2),
+                                ('alpha=-inf', .2)]:
+            request = factory.get('/?' + query)
+            self.assertEqual(get_float_param(request, 'alpha', .2, .01, 1),
+                             expected, query)
+
+
+class SpansTestCase(TestCase):
+    def test_span_histogram(self):
+        with spans.span('test_stage'):
+            pass
+        hist = spans.histograms[('test_stage', '')]
+        self.assertEqual(hist[0], 1)
+        text = spans.render_metrics({('test_stage', ''): hist})
+        self.assertIn('ifbt_span_seconds_count{stage="test_stage",view=""} 1',
+                      text)
+        self.assertIn('le="+Inf"} 1', text)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_metrics_view_access(self):
+        url = reverse('metrics')
+        # being behind a proxy on the same host grants nothing
+        self.assertEqual(Client().get(url, REMOTE_ADDR='127.0.0.1').status_code,
+                         404)
+        self.assertEqual(Client().get(
+            url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 404)
+        self.assertEqual(Client().get(
+            url, HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+        staff = User.objects.create_user(username='joe134', password='verrysekrit',
+                                         is_staff=True)
+        client = Client()
+        client.force_login(staff)
+        self.assertEqual(client.get(url).status_code, 200)
+
+
+class BenchmarkMeasureTestCase(TestCase):
+    def test_measure(self):
+        result = measure(lambda: FarmYear.objects.count(), repeat=2)
+        self.assertEqual(result['queries'], 1)
+        self.assertLessEqual(result['min'], result['median'])
+
+
+class FarmYearGeneratorTestCase(TestCase):
+    def test_generate(self):
+        generator = FarmYearGenerator(2026, [17], seed=1, prefix='joe13')
+        results = list(generator.generate(3))
+        self.assertEqual([error for fyid, error in results], [None] * 3)
+        for fyid, error in results:
+            farm_year = FarmYear.objects.get(pk=fyid)
+            self.assertGreater(farm_year.total_farm_acres(), 0)
+            self.assertTrue(farm_year.farm_crops.filter(
+                planted_acres__gt=0, farmbudgetcrop__isnull=False).exists())
+            beans = farm_year.farm_crops.filter(farm_crop_type_id__in=[2, 5])
+            self.assertEqual(len({(fc.coverage_type, fc.product_type,
+                                   fc.base_coverage_level) for fc in beans}), 1)
+
+    def test_delete_population(self):
+        # real accounts sharing the prefix, one named like a synthetic user
+        User.objects.create(username='joe133', password='verrysekrit')
+        User.objects.create(username='joe13-0', password='verrysekrit')
+        generator = FarmYearGenerator(2026, [17], seed=1, prefix='joe13')
+        results = list(generator.generate(1))
+        self.assertIsNone(results[0][1])
+        self.assertEqual(FarmYear.objects.get(pk=results[0][0]).user.username,
+                         'joe13-1')
+        delete_population('joe13')
+        self.assertFalse(FarmYear.objects.filter(pk=results[0][0]).exists())
+        self.assertEqual(
+            set(User.objects.filter(username__startswith='joe13')
+                .values_list('username', flat=True)), {'joe133', 'joe13-0'})
+
+
+class QueryCountTestCase(TestCase):
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE a = 'x''y' AND b IN (1, 2, 3)"),
+            'SELECT * FROM t WHERE a = ? AND b IN (...)')
+        self.assertEqual(fingerprint('SELECT 1 WHERE id IN (%s, %s)'),
+                         fingerprint('SELECT 2 WHERE id IN (%s, %s, %s, %s)'))
+
+    def test_repeats(self):
+        counter = QueryCounter()
+        for i in range(3):
+            counter(lambda *args: None, f'SELECT * FROM t WHERE id = {i}',
+                    None, False, None)
+        counter(lambda *args: None, 'SELECT 1', None, False, None)
+        self.assertEqual(counter.total, 4)
+        self.assertEqual(counter.repeats(3),
+                         [('SELECT * FROM t WHERE id = ?', 3)])
+
+
+@override_settings(QUERY_BUDGET_ENFORCE=True)
+class QueryBudgetTestCase(TestCase):
+    """ The views serving a farm year's pages stay within their query budgets """
+    def setUp(self):
+        self.user = User.objects.create_user(username='joe131', password='12345')
+        self.farm_year = FarmYear.objects.create(
+            user=self.user, farm_name="Madison Farm", state_id=17, county_code=119)
+        self.farm_year.farm_crops.filter(farm_crop_type_id=1).update(
+            planted_acres=1000, appr_yield=195, adj_yield=195, rate_yield=195)
+        self.client.login(username='joe131', password='12345')
+
+    def test_views_within_budget(self):
+        for name in ['farmyears', 'dashboard', 'farmyear_detail', 'farmcrop_list',
+                     'marketcrop_list', 'fsacrop_list']:
+            args = [] if name == 'farmyears' else [self.farm_year.pk]
+            response = self.client.get(reverse(name, args=args))
+            self.assertEqual(response.status_code, 200, name)
+            self.assertIn('X-Query-Count', response)
+
+    @override_settings(QUERY_BUDGET_ENFORCE=False)
+    def test_count_not_sent(self):
+        response = self.client.get(reverse('farmyears'))
+        self.assertNotIn('X-Query-Count', response)
+
+
+class StreamingSummaryTestCase(TestCase):
+    def test_summary_matches_batch(self):
+        rng = np.random.default_rng(1)
+        values = rng.normal(100, 20, 10000)
+        summary = StreamingSummary()
+        # the second chunk widens the histogram range
+        for chunk in (values[:50] / 10, values[50:]):
+            summary.add(chunk)
+        allvalues = np.concatenate([values[:50] / 10, values[50:]])
+        self.assertAlmostEqual(summary.mean, allvalues.mean())
+        self.assertAlmostEqual(np.sqrt(summary.m2 / summary.n), allvalues.std())
+        self.assertEqual(summary.counts.sum(), len(allvalues))
+        self.assertAlmostEqual(summary.quantiles([.5])[0],
+                               np.median(allvalues), delta=2 * summary.width)
+        result = summary.summary()
+        self.assertEqual(result['min'], round(allvalues.min(), 2))
+        self.assertLessEqual(result['shortfall'], result['q10'])
+
+
+class RecomputeFarmYearsTestCase(TransactionTestCase):
+    """ Spawned workers see the committed farm years in the test database """
+    def setUp(self):
+        user = User.objects.create_user(username='joe132', password='12345')
+        self.farm_year = FarmYear.objects.create(
+            user=user, farm_name="Madison Farm", state_id=17, county_code=119)
+        self.farm_year.farm_crops.filter(farm_crop_type_id=1).update(
+            planted_acres=1000, appr_yield=195, adj_yield=195, rate_yield=195)
+        corn = self.farm_year.farm_crops.get(farm_crop_type_id=1)
+        FarmCrop.add_farm_budget_crop(corn.pk, 69)
+
+    def test_recompute_through_pool(self):
+        results = list(recompute_farm_years([self.farm_year.pk, 0], workers=2,
+                                            chunksize=1))
+        self.assertEqual([r[0] for r in results], [self.farm_year.pk, 0])
+        self.assertIsNone(results[0][2])
+        self.assertIsNotNone(results[1][2])
+        farm_year = FarmYear.objects.get(pk=self.farm_year.pk)
+        self.assertTrue(farm_year.get_stored_current_budget()[1])
+
 
 class Madison2026FarmYearTestCase(TestCase):
     def setUp(self):
@@ -4622,6 +5101,253 @@ class Madison2026FarmYearTestCase(TestCase):
 
         self.assertTrue(np.all(abs(data - expected)) < 0.01)
 
+    def test_all_sens_tables(self):
+        sgrp = SensTableGroup(self.farm_year)
+        sgrp.compute_current_data(save=True)
+        keys = [key for key, table in sgrp.get_all_tables()]
+        ntags = len(sgrp.get_crop_tags()[0])
+        self.assertEqual(len(keys), ntags * (2 * sgrp.nincr + 3))
+        self.assertEqual(len(set(keys)), len(keys))
+        self.assertIn(('cashflow', 'farm', 2, False), keys)
+
+    def test_budget_not_modified(self):
+        url = reverse('ajaxbudget', args=[self.farm_year.pk])
+        BudgetManager(self.farm_year).calc_current_budget()
+        response = Client().get(url)
+        self.assertEqual(response.status_code, 200)
+        # computing premiums again saves them without touching the inputs
+        BudgetManager(FarmYear.objects.get(pk=self.farm_year.pk)).calc_current_budget()
+        response = Client().get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_shared_budget_sets_budget_text(self):
+        budget = BudgetManager(self.farm_year).calc_current_budget()
+        # another request stores a different budget text meanwhile
+        FarmYear.objects.get(pk=self.farm_year.pk).budget_text = {'tables': None}
+        farm_year = FarmYear.objects.get(pk=self.farm_year.pk)
+        self.assertEqual(BudgetManager(farm_year).calc_current_budget(), budget)
+        self.assertEqual(farm_year.budget_text, budget)
+
+    def test_stale_budget_refreshed_in_background(self):
+        BudgetManager(self.farm_year).calc_current_budget()
+        FarmYear.touch(self.farm_year.pk)
+        client = Client()
+        client.force_login(self.farm_year.user)
+        # recompute in this process rather than in the spawned pool
+        batch.refresh_executor = InlineExecutor()
+        try:
+            response = client.get(reverse('detailedbudget', args=[self.farm_year.pk]))
+            self.assertTrue(response.context['refreshing'])
+            response = client.get(reverse('ajaxbudget', args=[self.farm_year.pk]) +
+                                  '?bdgtype=cur&refresh=1')
+        finally:
+            batch.refresh_executor = None
+        self.assertIn('keydata', response.json()['data'])
+
+    def test_budget_pdf_job(self):
+        BudgetManager(self.farm_year).calc_current_budget()
+        client = Client()
+        client.force_login(self.farm_year.user)
+        # render in this process rather than in the spawned pool
+        pdf_jobs.executor = InlineExecutor()
+        try:
+            response = client.get(
+                reverse('downloadbudget', args=[self.farm_year.pk]) + '?b=cur&job=1')
+        finally:
+            pdf_jobs.executor = None
+        job = response.json()['job']
+        response = client.get(reverse('pdfjob_status', args=[job]))
+        self.assertEqual(response.json(), {'status': 'done'})
+        response = client.get(reverse('pdfjob_download', args=[job]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        self.assertEqual(Client().get(reverse('pdfjob_status', args=[job]))
+                         .status_code, 302)
+        self.assertEqual(client.get(reverse('pdfjob_status', args=['nosuchjob']))
+                         .status_code, 403)
+
+    def test_sens_bundle_pdf_job(self):
+        SensTableGroup(self.farm_year).compute_current_data(save=True)
+        client = Client()
+        client.force_login(self.farm_year.user)
+        pdf_jobs.executor = InlineExecutor()
+        try:
+            response = client.get(
+                reverse('downloadsens_all', args=[self.farm_year.pk]) +
+                '?format=pdf&job=1')
+        finally:
+            pdf_jobs.executor = None
+        job = response.json()['job']
+        response = client.get(reverse('pdfjob_download', args=[job]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+
+    @override_settings(QUERY_BUDGET_ENFORCE=True)
+    def test_heavy_views_within_budget(self):
+        client = Client()
+        client.force_login(self.farm_year.user)
+        pk = self.farm_year.pk
+        # in the order a user visits them, so the first view computes the budget
+        for name, query in [('detailedbudget', ''), ('ajaxbudget', '?bdgtype=cur'),
+                            ('sensitivity', ''),
+                            ('sens_table', '?tbltype=cashflow&crop=farm')]:
+            response = client.get(reverse(name, args=[pk]) + query)
+            self.assertEqual(response.status_code, 200, name)
+            self.assertIn('X-Query-Count', response)
+
+    def test_sens_pdf_uses_selections(self):
+        SensTableGroup(self.farm_year).compute_current_data(save=True)
+        # the stored text is that of the last table sent, here the indemnity table
+        SensTableGroup(self.farm_year).get_selected_table('indem', 'corn', None)
+        selections = ('cost', 'corn', None, False, None)
+        func, args = pdf_jobs.get_render_args('sens', self.farm_year, selections)
+        self.assertEqual(args[2], SensTableGroup(self.farm_year).get_selected_text(
+            *selections))
+        self.assertNotEqual(args[2], self.farm_year.sensitivity_text)
+
+    def test_replicate(self):
+        joe = User.objects.create(username='joe135', password='verrysekrit')
+        with connection.cursor() as cursor:
+            cursor.execute(Replicate(self.farm_year, joe.pk).replicate())
+        copy = FarmYear.objects.get(user=joe)
+        self.assertIsNotNone(copy.inputs_updated_on)
+        self.assertEqual(copy.farm_crops.count(), self.farm_year.farm_crops.count())
+        self.assertEqual(Contract.objects.filter(market_crop__farm_year=copy).count(),
+                         7)
+        self.assertEqual(
+            copy.farm_crops.filter(farmbudgetcrop__isnull=False).count(), 4)
+        self.assertEqual(copy.impacts.count(), self.farm_year.impacts.count())
+        self.assertEqual(FarmYearImpact.affected(2026, 17, 119),
+                         [self.farm_year.pk, copy.pk])
+
+    def test_recompute_farm_year(self):
+        self.assertIn(self.farm_year.pk,
+                      get_active_farm_year_ids(self.farm_year.crop_year))
+        farm_year_id, seconds, error = recompute_farm_year(self.farm_year.pk)
+        self.assertIsNone(error)
+        farm_year = FarmYear.objects.get(pk=farm_year_id)
+        self.assertTrue(farm_year.get_stored_current_budget()[1])
+        self.assertIsNotNone(farm_year.sensitivity_data)
+        self.assertIsNotNone(recompute_farm_year(0)[2])
+
+    def test_sens_outcomes(self):
+        pfrange, yfrange = np.array([.8, 1, 1.2]), np.array([.9, 1, 1.1])
+        weights = grid_weights(pfrange, yfrange, 0, 0)
+        self.assertAlmostEqual(weights[1, 1], 1)
+        weights = grid_weights(pfrange, yfrange, .2, .1, correlation=-.3)
+        self.assertAlmostEqual(weights.sum(), 1)
+        self.assertGreater(weights[0, 2], weights[2, 2])
+        outcomes = SensOutcomes(self.farm_year)
+        stats = outcomes.get_stats()
+        farm = stats['cashflow']['farm']
+        self.assertLessEqual(farm['q05'], farm['q10'])
+        self.assertLessEqual(farm['q10'], farm['q25'])
+        self.assertLessEqual(farm['shortfall'], farm['mean'])
+        self.assertTrue(0 <= farm['prob_loss'] <= 1)
+        # expectation is linear in the table types
+        means = {tbltype: stats[tbltype]['corn']['mean'] for tbltype in stats}
+        self.assertAlmostEqual(
+            means['cashflow'], means['revenue'] + means['title'] +
+            means['indem'] - means['cost'], delta=.01)
+        self.assertAlmostEqual(np.sum(outcomes.get_weights('corn')), 1, places=3)
+
+    def test_farm_simulation(self):
+        simulation = FarmSimulation(self.farm_year, seed=1)
+        result = simulation.run(200, chunk=64)
+        farm = result['farm']
+        self.assertEqual(farm['cashflow']['n'], 200)
+        self.assertLessEqual(farm['cashflow']['q05'], farm['cashflow']['q50'])
+        self.assertAlmostEqual(
+            farm['cashflow']['mean'],
+            farm['revenue']['mean'] + farm['title']['mean'] +
+            farm['indem']['mean'] - farm['cost']['mean'], delta=.1)
+        self.assertEqual(len(result['crops']), len(simulation.farm_crops))
+        # with no dispersion every draw is the center of the sensitivity grid
+        result = FarmSimulation(self.farm_year, dispersion=0).run(10)
+        grp = SensTableGroup(self.farm_year)
+        cashflow = np.array(grp.compute_current_data()[4])[grp.nfcs]
+        if cashflow.ndim == 3:
+            cashflow = cashflow[..., grp.nst]
+        self.assertAlmostEqual(result['farm']['cashflow']['mean'],
+                               cashflow[6, 6] * 1000, delta=1)
+        self.assertAlmostEqual(result['farm']['cashflow']['std'], 0)
+
+    def test_budget_backtest(self):
+        end = datetime(2026, 7, 9).date()
+        backtest = BudgetBacktest(self.farm_year, start=datetime(2026, 6, 25).date(),
+                                  end=end)
+        rows = backtest.run()
+        self.assertGreater(len(rows), 5)
+        self.assertEqual(rows[-1]['date'], end.isoformat())
+        # the contracts are dated at the end, so their statistics change once
+        self.assertEqual(backtest.computed['contracts'], 2)
+        self.assertLessEqual(backtest.computed['premium'],
+                             len(rows) * len(backtest.farm_crops))
+        self.assertTrue(self.farm_year.is_model_run_date_manual)
+        self.assertEqual(self.farm_year.get_model_run_date(), end)
+        # the last day is the stored model run date's budget
+        BudgetManager(self.farm_year).build_current_budget()
+        budget = self.farm_year.current_budget_data['budget']
+        for line in ['crop_revenue', 'gov_pmt', 'crop_ins_prems', 'cash_flow']:
+            self.assertAlmostEqual(rows[-1][line], sum(budget[line]), delta=1)
+
+    @override_settings(BACKTEST_MAX_DAYS=7)
+    def test_budget_backtest_view_range(self):
+        client = Client()
+        client.force_login(self.farm_year.user)
+        response = client.get(
+            reverse('budget_backtest', args=[self.farm_year.pk]) +
+            '?start=2026-01-01&end=2026-07-09')
+        self.assertEqual(response.json()['start'], '2026-07-02')
+        self.assertLessEqual(len(response.json()['rows']), 6)
+
+    def test_acreage_options(self):
+        self.assertEqual(len(list(compositions(4, 3))), 15)
+        optimizer = AcreageOptimizer(self.farm_year, step=.1)
+        result = optimizer.optimize()
+        frontier = result['frontier']
+        self.assertGreater(len(frontier), 0)
+        expected = [opt['expected'] for opt in frontier]
+        downside = [opt['downside'] for opt in frontier]
+        self.assertEqual(expected, sorted(expected, reverse=True))
+        self.assertEqual(downside, sorted(downside))
+        for opt in frontier:
+            # corn, fs beans, winter wheat, dc beans
+            acres = list(opt['acres'].values())
+            self.assertAlmostEqual(sum(acres[:3]), 5400, delta=3)
+            self.assertLessEqual(acres[3], acres[2] + 1)
+        # moving acres within premium size classes matches a recomputation
+        acres = optimizer.acres.copy()
+        acres[:2] += [-100, 100]
+        predicted = optimizer.cashflows(acres[np.newaxis])[0].reshape(15, 9)
+        self.farm_year.farm_crops.filter(farm_crop_type_id=1).update(planted_acres=2400)
+        self.farm_year.farm_crops.filter(farm_crop_type_id=2).update(planted_acres=2600)
+        grp = SensTableGroup(self.farm_year)
+        cashflow = np.array(grp.compute_current_data()[4])[grp.nfcs]
+        if cashflow.ndim == 3:
+            cashflow = cashflow[..., grp.nst]
+        self.assertAlmostEqual(predicted[6, 6], cashflow[6, 6] * 1000,
+                               delta=abs(predicted[6, 6]) * .001 + 100)
+
+    def test_coverage_options(self):
+        self.assertAlmostEqual(lower_tail_mean(np.array([[3.], [1.], [2.], [4.]]),
+                                               np.full(4, .25), .5)[0], 1.5)
+        groups = CoverageOptimizer(self.farm_year).rank('expected')
+        self.assertEqual(len(groups), 3)
+        for group in groups:
+            expected = [opt['expected'] for opt in group['options']]
+            self.assertEqual(expected, sorted(expected, reverse=True))
+        groups = CoverageOptimizer(self.farm_year).rank('downside', top=None)
+        for group in groups:
+            downside = [opt['downside'] for opt in group['options']]
+            self.assertEqual(downside, sorted(downside, reverse=True))
+            # the current selection computed along with all the others
+            selected = [opt for opt in group['options'] if opt['selected']]
+            self.assertEqual(len(selected), 1)
+            for stat in ('expected', 'downside', 'worst'):
+                self.assertAlmostEqual(selected[0][stat], group['current'][stat],
+                                       delta=1)
+
 
 # ----------
 # VIEW TESTS
@@ -11,12 +11,14 @@ from .views import (
     FarmBudgetCropUpdateView,
     FarmCropAddBudgetView, FarmCropDeleteBudgetView,
     FarmYearUpdateBaselineView, FarmYearConfirmBaselineUpdate,
-    DetailedBudgetView, GetAjaxBudgetView, BudgetPdfView,
-    SensitivityTableView, GetSensTableView, SensitivityPdfView,
+    DetailedBudgetView, GetAjaxBudgetView, BudgetPdfView, BudgetBacktestView,
+    SensitivityTableView, GetSensTableView, SensitivityPdfView, SensCheckpointView,
+    SensitivityBundleView, CoverageOptionsView, SensOutcomesView, AcreageOptionsView,
     ContractCreateView, ContractUpdateView, ContractDeleteView,
     MarketCropContractListView,
     ContractPdfView, ContractCsvView, PrivacyView, TermsView, StatusView, AboutView,
-    BudgetSourcesView, ReplicateView)
+    BudgetSourcesView, ReplicateView, PdfJobStatusView, PdfJobDownloadView,
+    MetricsView)
 
 urlpatterns = [
     path('', IndexView.as_view(), name='index'),
@@ -32,6 +34,7 @@ urlpatterns = [
          name='budgetsources'),
     path('replicate/<int:farmyear>/<int:user>/', ReplicateView.as_view(),
          name='replicate'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 
     # farm year related urls
     path('farmyears/', FarmYearsView.as_view(), name='farmyears'),
@@ -92,6 +95,8 @@ urlpatterns = [
          DetailedBudgetView.as_view(), name='detailedbudget'),
     path('detailedbudget/<int:farmyear>/table/',
          GetAjaxBudgetView.as_view(), name='ajaxbudget'),
+    path('detailedbudget/<int:farmyear>/backtest/',
+         BudgetBacktestView.as_view(), name='budget_backtest'),
     path('downloadbudget/<int:farmyear>/',
          BudgetPdfView.as_view(), name='downloadbudget'),
     path('updatebaseline/',
@@ -105,8 +110,24 @@ urlpatterns = [
          SensitivityTableView.as_view(), name='sensitivity'),
     path('sensitivity/<int:farmyear>/sens_table/',
          GetSensTableView.as_view(), name='sens_table'),
+    path('sensitivity/<int:farmyear>/checkpoint/',
+         SensCheckpointView.as_view(), name='sens_checkpoint'),
+    path('sensitivity/<int:farmyear>/coverage/',
+         CoverageOptionsView.as_view(), name='coverage_options'),
+    path('sensitivity/<int:farmyear>/outcomes/',
+         SensOutcomesView.as_view(), name='sens_outcomes'),
+    path('sensitivity/<int:farmyear>/acreage/',
+         AcreageOptionsView.as_view(), name='acreage_options'),
     path('downloadsens/<int:farmyear>/',
          SensitivityPdfView.as_view(), name='downloadsens'),
+    path('downloadsens/<int:farmyear>/all/',
+         SensitivityBundleView.as_view(), name='downloadsens_all'),
+
+    # background pdf rendering
+    path('pdfjob/<str:job>/',
+         PdfJobStatusView.as_view(), name='pdfjob_status'),
+    path('pdfjob/<str:job>/download/',
+         PdfJobDownloadView.as_view(), name='pdfjob_download'),
 
     # contract report related views
     path('downloadcontracts/<int:farmyear>/',
@@ -3,23 +3,37 @@ Note: Views for which the 'Dashboard' link should appear in the top nav must ens
 that farmyear_id is in the context.
 """
 import datetime
+import io
+import hmac
+import math
 import json
 import csv
+from itertools import chain
+from django.conf import settings
 from django.contrib.auth.mixins import UserPassesTestMixin, LoginRequiredMixin
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse, HttpResponse, FileResponse
+from django.http import (JsonResponse, HttpResponse, FileResponse, Http404,
+                         StreamingHttpResponse)
 from django.views.generic.edit import CreateView, DeleteView, UpdateView
 from django.views.generic import DetailView, ListView, TemplateView
 from django.views import View
 from django.urls import reverse, reverse_lazy
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from .models.farm_year import FarmYear
 from .models.farm_crop import FarmCrop, FarmBudgetCrop
-from .models.market_crop import MarketCrop, Contract
+from .models.market_crop import MarketCrop, Contract, get_farm_year_contracts
 from .models.fsa_crop import FsaCrop
 from .models.budget_table import BudgetManager
-from .models.budget_pdf import BudgetPdf
 from .models.sens_table import SensTableGroup
-from .models.sens_pdf import SensPdf
+from .models.sens_history import SensHistory
+from .models.coverage import CoverageOptimizer, RANKINGS
+from .models.sens_outcomes import SensOutcomes
+from .models.backtest import BudgetBacktest
+from .models.allocation import AcreageOptimizer
+from .models import batch, pdf_jobs
+from .models.spans import span, collect_histograms, render_metrics
 from .models.contract_pdf import ContractPdf
 from .models.replicate_farmyear import Replicate
 from ext.models import County, Budget
@@ -485,8 +499,18 @@ class DetailedBudgetView(UserPassesTestMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         farm_year = get_object_or_404(FarmYear, pk=kwargs.get('farmyear'))
-        bm = BudgetManager(farm_year)
-        budget = bm.calc_current_budget()
+        budget, fresh = farm_year.get_stored_current_budget()
+        if budget is not None and (fresh or settings.BUDGET_STALE_WHILE_REVALIDATE):
+            # the print button renders budget_text, so make sure it's current
+            if farm_year.budget_text != budget:
+                farm_year.budget_text = budget
+        else:
+            budget = BudgetManager(farm_year).calc_current_budget()
+            fresh = True
+        if not fresh:
+            # the page polls GetAjaxBudgetView until the recomputed budget is stored
+            batch.submit_budget_refresh(farm_year.pk)
+        context['refreshing'] = not fresh
         context['rev'] = budget['rev']
         context['revfmt'] = budget['revfmt']
         context['info'] = budget['info']
@@ -497,22 +521,50 @@ class DetailedBudgetView(UserPassesTestMixin, TemplateView):
         return context
 
 
+def budget_etag(request, *args, **kwargs):
+    if request.GET.get('refresh') == '1':
+        # the token doesn't change when a refreshed budget is stored
+        return None
+    farm_year = get_object_or_404(FarmYear, pk=kwargs.get('farmyear'))
+    return farm_year.version_token('baseline_budget_data')
+
+
+def sens_table_etag(request, *args, **kwargs):
+    farm_year = get_object_or_404(FarmYear, pk=kwargs.get('farmyear'))
+    return farm_year.version_token('sensitivity_data', 'sensitivity_diff',
+                                   'sensitivity_history')
+
+
 class GetAjaxBudgetView(View):
+    @method_decorator(cache_control(private=True, no_cache=True))
+    @method_decorator(condition(etag_func=budget_etag))
     def get(self, request, *args, **kwargs):
         farm_year = get_object_or_404(FarmYear, pk=kwargs.get('farmyear'))
-        bm = BudgetManager(farm_year)
         bdgtype = request.GET.get('bdgtype')
+        if request.GET.get('refresh') == '1':
+            # the stale current budget shown by DetailedBudgetView, once recomputed
+            budget, fresh = farm_year.get_stored_current_budget()
+            if not fresh:
+                # in case the inputs changed again since the refresh began
+                batch.submit_budget_refresh(farm_year.pk)
+                return JsonResponse({'pending': True})
+            with span('json'):
+                return JsonResponse({'data': {'rev': budget['rev'],
+                                              'tables': budget['tables'],
+                                              'keydata': budget['keydata']}})
+        bm = BudgetManager(farm_year)
         budget = (bm.get_baseline_budget() if bdgtype == 'base' else
                   bm.get_variance_budget() if bdgtype == 'var' else
                   bm.get_current_budget())
-        return JsonResponse({'data': {'rev': budget['rev'],
-                                      'tables': budget['tables']}})
+        with span('json'):
+            return JsonResponse({'data': {'rev': budget['rev'],
+                                          'tables': budget['tables']}})
 
 
 class BudgetPdfView(UserPassesTestMixin, View):
     """
-    Expect URL of the form: downloadbudget/23/?b=1
-    (b=0: current budget, b=1: baseline, b=2: variance)
+    Expect URL of the form: downloadbudget/23/?b=base
+    (b=cur: current budget, b=base: baseline, b=var: variance)
     """
     def test_func(self):
         farm_year = get_object_or_404(FarmYear, pk=self.kwargs.get('farmyear'))
@@ -520,9 +572,13 @@ class BudgetPdfView(UserPassesTestMixin, View):
 
     def get(self, request, *args, **kwargs):
         farm_year = get_object_or_404(FarmYear, pk=kwargs.get('farmyear'))
-        budgettype = request.GET.get('b', 0)
-        buffer = BudgetPdf(farm_year, budgettype).create()
-        return FileResponse(buffer, as_attachment=True, filename="Budget.pdf")
+        budgettype = request.GET.get('b', 'cur')
+        filename = "Budget.pdf"
+        if request.GET.get('job') == '1':
+            job_id = pdf_jobs.submit_pdf('budget', farm_year, budgettype, filename)
+            return JsonResponse({'job': job_id})
+        buffer = io.BytesIO(pdf_jobs.get_pdf('budget', farm_year, budgettype))
+        return FileResponse(buffer, as_attachment=True, filename=filename)
 
 
 class FarmYearConfirmBaselineUpdate(UserPassesTestMixin, View):
@@ -569,6 +625,8 @@ class SensitivityTableView(UserPassesTestMixin, TemplateView):
 
 
 class GetSensTableView(View):
+    @method_decorator(cache_control(private=True, no_cache=True))
+    @method_decorator(condition(etag_func=sens_table_etag))
     def get(self, request, *args, **kwargs):
         farm_year = get_object_or_404(FarmYear, pk=kwargs.get('farmyear'))
         st = SensTableGroup(farm_year)
@@ -577,13 +635,143 @@ class GetSensTableView(View):
         tblnum = request.GET.get('tblnum', '')
         tblnum = None if tblnum == '' else int(tblnum)
         isdiff = True if request.GET.get('isdiff', 'false') == 'true' else False
-        table = st.get_selected_table(tbltype, crop, tblnum, isdiff)
-        return JsonResponse({'data': table})
+        base = request.GET.get('base', '')
+        base = None if base == '' else int(base) if base.isdigit() else base
+        table = st.get_selected_table(tbltype, crop, tblnum, isdiff, base)
+        with span('json'):
+            return JsonResponse({'data': table})
+
+
+class SensCheckpointView(UserPassesTestMixin, View):
+    """ Name the current sensitivity data so later runs can be compared to it """
+    def test_func(self):
+        farm_year = get_object_or_404(FarmYear, pk=self.kwargs.get('farmyear'))
+        return self.request.user == farm_year.user
+
+    def post(self, request, *args, **kwargs):
+        farm_year = get_object_or_404(FarmYear, pk=kwargs.get('farmyear'))
+        label = request.POST.get('label', '').strip()[:40]
+        if label and farm_year.sensitivity_data is not None:
+            SensHistory(farm_year).checkpoint(label)
+        return redirect(reverse('sensitivity', args=[farm_year.pk]))
+
+
+def get_float_param(request, name, default, low, high):
+    """
+    A GET parameter as a float limited to [low, high], or the default if it's
+    missing, malformed or not finite (float() accepts 'nan' and 'inf')
+    """
+    try:
+        value = float(request.GET.get(name, default))
+    except ValueError:
+        return default
+    return min(max(value, low), high) if math.isfinite(value) else default
+
+
+class CoverageOptionsView(UserPassesTestMixin, View):
+    """
+    Expect URL of the form: sensitivity/23/coverage/?rank=downside&top=10
+    Ranks the crop insurance selections for each crop over the sensitivity grid,
+    with the grid cells weighted by probability if weighted=true.
+    """
+    def test_func(self):
+        farm_year = get_object_or_404(FarmYear, pk=self.kwargs.get('farmyear'))
+        return self.request.user == farm_year.user
+
+    def get(self, request, *args, **kwargs):
+        farm_year = get_object_or_404(FarmYear, pk=kwargs.get('farmyear'))
+        rank = request.GET.get('rank', 'expected')
+        if rank not in RANKINGS:
+            rank = 'expected'
+        try:
+            top = int(request.GET.get('top', 10))
+        except ValueError:
+            top = 10
+        alpha = get_float_param(request, 'alpha', .2, .01, 1)
+        weighted = request.GET.get('weighted', 'false') == 'true'
+        groups = CoverageOptimizer(farm_year, weighted).rank(rank, alpha, top)
+        with span('json'):
+            return JsonResponse({'rank': rank, 'alpha': alpha, 'groups': groups})
+
+
+class AcreageOptionsView(UserPassesTestMixin, View):
+    """
+    Expect URL of the form: sensitivity/23/acreage/?alpha=.2&step=.05
+    The efficient frontier of acre allocations by expected and downside cash
+    flow over the sensitivity grid, weighted by probability if weighted=true.
+    """
+    def test_func(self):
+        farm_year = get_object_or_404(FarmYear, pk=self.kwargs.get('farmyear'))
+        return self.request.user == farm_year.user
+
+    def get(self, request, *args, **kwargs):
+        farm_year = get_object_or_404(FarmYear, pk=kwargs.get('farmyear'))
+        alpha = get_float_param(request, 'alpha', .2, .01, 1)
+        step = get_float_param(request, 'step', .05, .02, .5)
+        weighted = request.GET.get('weighted', 'false') == 'true'
+        result = AcreageOptimizer(farm_year, weighted, step).optimize(alpha)
+        with span('json'):
+            return JsonResponse({'alpha': alpha, 'step': step, **result})
+
+
+class SensOutcomesView(UserPassesTestMixin, View):
+    """
+    Expect URL of the form: sensitivity/23/outcomes/?crop=corn&alpha=.1
+    Probability weighted statistics of the sensitivity data for every crop,
+    with the cell probabilities for the given crop.
+    """
+    def test_func(self):
+        farm_year = get_object_or_404(FarmYear, pk=self.kwargs.get('farmyear'))
+        return self.request.user == farm_year.user
+
+    def get(self, request, *args, **kwargs):
+        farm_year = get_object_or_404(FarmYear, pk=kwargs.get('farmyear'))
+        alpha = get_float_param(request, 'alpha', .1, .01, 1)
+        outcomes = SensOutcomes(farm_year)
+        stats = outcomes.get_stats(alpha)
+        crop = request.GET.get('crop', 'farm')
+        if crop not in outcomes.grp.get_crop_tags()[0]:
+            crop = 'farm'
+        weights = outcomes.get_weights(crop) if stats else None
+        with span('json'):
+            return JsonResponse({'alpha': alpha, 'stats': stats, 'crop': crop,
+                                 'pfrange': outcomes.grp.pfrange.tolist(),
+                                 'yfrange': outcomes.grp.yfrange.tolist(),
+                                 'weights': weights})
+
+
+class BudgetBacktestView(UserPassesTestMixin, View):
+    """
+    Expect URL of the form: detailedbudget/23/backtest/?start=2026-03-01
+    The key budget lines for each trading day from start (default the farm
+    year's first date) to end (default today), as if it were the model run date.
+    The range is limited to BACKTEST_MAX_DAYS before the end.
+    """
+    def test_func(self):
+        farm_year = get_object_or_404(FarmYear, pk=self.kwargs.get('farmyear'))
+        return self.request.user == farm_year.user
+
+    def get(self, request, *args, **kwargs):
+        farm_year = get_object_or_404(FarmYear, pk=kwargs.get('farmyear'))
+        dates = {}
+        for name in ('start', 'end'):
+            try:
+                dates[name] = datetime.date.fromisoformat(request.GET[name])
+            except (KeyError, ValueError):
+                dates[name] = None
+        backtest = BudgetBacktest(farm_year, max_days=settings.BACKTEST_MAX_DAYS,
+                                  **dates)
+        rows = backtest.run()
+        with span('json'):
+            return JsonResponse({'start': backtest.start.isoformat(),
+                                 'end': backtest.end.isoformat(), 'rows': rows})
 
 
 class SensitivityPdfView(UserPassesTestMixin, View):
     """
-    Expect URL of the form: downloadsens/23/?tag=revenue_diff_corn
+    Expect URL of the form:
+    downloadsens/23/?tbltype=revenue&crop=corn&tblnum=&isdiff=true&base=0
+    with the selections of GetSensTableView.
     """
     def test_func(self):
         farm_year = get_object_or_404(FarmYear, pk=self.kwargs.get('farmyear'))
@@ -593,18 +781,91 @@ class SensitivityPdfView(UserPassesTestMixin, View):
         tbltype = request.GET.get('tbltype')
         crop = request.GET.get('crop')
         try:
-            tblnum = int(request.GET.get('tblnum', 0))
+            tblnum = int(request.GET.get('tblnum', ''))
         except ValueError:
-            tblnum = 0
+            tblnum = None
         isdiff = True if request.GET.get('isdiff', 'false') == 'true' else False
+        base = request.GET.get('base', '')
+        base = None if base == '' else int(base) if base.isdigit() else base
         nincr = int(request.GET.get('ni', 1))
         basis_incr = float(request.GET.get('bi', 0))
         farm_year = get_object_or_404(FarmYear, pk=kwargs.get('farmyear'))
-        buffer = SensPdf(farm_year, isdiff).create()
-        filename = get_sens_filename(tbltype, crop, tblnum, isdiff, nincr, basis_incr)
+        filename = get_sens_filename(tbltype, crop, tblnum or 0, isdiff, nincr,
+                                     basis_incr)
+        selections = (tbltype, crop, tblnum, isdiff, base)
+        if request.GET.get('job') == '1':
+            job_id = pdf_jobs.submit_pdf('sens', farm_year, selections, filename)
+            return JsonResponse({'job': job_id})
+        buffer = io.BytesIO(pdf_jobs.get_pdf('sens', farm_year, selections))
         return FileResponse(buffer, as_attachment=True, filename=filename)
 
 
+class SensitivityBundleView(UserPassesTestMixin, View):
+    """
+    Every sensitivity table for the stored data, as a zip of PDFs or one
+    multi-page PDF.  Expect URL of the form: downloadsens/23/all/?format=zip
+    With format=pdf&job=1, the PDF is rendered in the background (see
+    PdfJobStatusView).
+    """
+    def test_func(self):
+        farm_year = get_object_or_404(FarmYear, pk=self.kwargs.get('farmyear'))
+        return self.request.user == farm_year.user
+
+    def get(self, request, *args, **kwargs):
+        farm_year = get_object_or_404(FarmYear, pk=kwargs.get('farmyear'))
+        st = SensTableGroup(farm_year)
+        tables = st.get_all_tables()
+        if len(tables) == 0:
+            raise Http404('No sensitivity tables have been computed')
+        if request.GET.get('format') == 'pdf':
+            filename = "Sensitivity_all.pdf"
+            pairs = [(table, key[3]) for key, table in tables]
+            if request.GET.get('job') == '1':
+                job_id = pdf_jobs.submit_sens_bundle(farm_year, pairs, filename)
+                return JsonResponse({'job': job_id})
+            pdf = pdf_jobs.get_sens_bundle(farm_year, pairs)
+            return FileResponse(io.BytesIO(pdf), as_attachment=True,
+                                filename=filename)
+        nincr = 1 if st.bfrange is None else st.nincr
+        entries = [(get_sens_filename(tbltype, crop, tblnum or 0, isdiff, nincr,
+                                      0 if tblnum is None else st.basis_incr),
+                    table, isdiff)
+                   for (tbltype, crop, tblnum, isdiff), table in tables]
+        return StreamingHttpResponse(
+            pdf_jobs.stream_sens_zip(farm_year, entries),
+            content_type='application/zip',
+            headers={'Content-Disposition':
+                     'attachment; filename="Sensitivity_all.zip"'})
+
+
+# --------------------------
+# Background PDF render jobs
+# --------------------------
+class PdfJobStatusView(UserPassesTestMixin, View):
+    """ Polled by the client after starting a job with ?job=1 """
+    def test_func(self):
+        job = pdf_jobs.get_job(self.kwargs.get('job'))
+        return job is not None and self.request.user.pk == job.user_id
+
+    def get(self, request, *args, **kwargs):
+        job = pdf_jobs.get_job(kwargs.get('job'))
+        return JsonResponse({'status': job.status})
+
+
+class PdfJobDownloadView(UserPassesTestMixin, View):
+    def test_func(self):
+        job = pdf_jobs.get_job(self.kwargs.get('job'))
+        return job is not None and self.request.user.pk == job.user_id
+
+    def get(self, request, *args, **kwargs):
+        job = pdf_jobs.get_job(kwargs.get('job'))
+        pdf = pdf_jobs.get_job_pdf(job) if job.status == 'done' else None
+        if pdf is None:
+            raise Http404('The PDF is not available')
+        return FileResponse(io.BytesIO(pdf), as_attachment=True,
+                            filename=job.filename)
+
+
 # ---------------------
 # Contract report views
 # ---------------------
@@ -627,23 +888,26 @@ class ContractCsvView(UserPassesTestMixin, View):
 
     def get(self, request, *args, **kwargs):
         farm_year = get_object_or_404(FarmYear, pk=kwargs.get('farmyear'))
-        response = HttpResponse(
+        writer = csv.writer(EchoBuffer())
+        header = ['Crop', 'Contract Date', 'Bushels', 'Futures Price',
+                  'Basis Price', 'Terminal', 'Contract #',
+                  'Delivery Start', 'Delivery End']
+        rows = ([c.market_crop, c.contract_date, c.bushels, c.futures_price,
+                 c.basis_price, c.terminal, c.contract_number,
+                 c.delivery_start_date, c.delivery_end_date]
+                for c in get_farm_year_contracts(farm_year).iterator(chunk_size=2000))
+        return StreamingHttpResponse(
+            (writer.writerow(row) for row in chain([header], rows)),
             content_type='text/csv',
             headers={'Content-Disposition':
                      'attachment; filename="GrainContracts.csv"'},
         )
-        writer = csv.writer(response)
-        writer.writerow(['Crop', 'Contract Date', 'Bushels', 'Futures Price',
-                         'Basis Price', 'Terminal', 'Contract #',
-                         'Delivery Start', 'Delivery End'])
-        for mc in farm_year.market_crops.all():
-            if mc.planted_acres() > 0:
-                for c in mc.get_contracts():
-                    writer.writerow(
-                        [mc, c.contract_date, c.bushels, c.futures_price, c.basis_price,
-                         c.terminal, c.contract_number, c.delivery_start_date,
-                         c.delivery_end_date])
-        return response
+
+
+class EchoBuffer(object):
+    """ A file-like object for csv.writer, returning each row instead of storing it """
+    def write(self, value):
+        return value
 
 
 class ReplicateView(UserPassesTestMixin, View):
@@ -672,3 +936,22 @@ def get_sens_filename(tbltype, crop, tblnum, isdiff, nincr, basis_incr):
                       f'basis_increment_{tot_basis_incr:.2f}_')
     info = (f'{tbltype}_' + ('diff_' if isdiff else '') + basis_incr_str + crop)
     return f"Sensitivity_{info}.pdf"
+
+
+class MetricsView(View):
+    """
+    Pipeline stage timing histograms for a Prometheus scraper sending the
+    METRICS_TOKEN as a bearer token, or for staff users
+    """
+    def has_access(self, request):
+        if request.user.is_staff:
+            return True
+        token = settings.METRICS_TOKEN
+        return bool(token) and hmac.compare_digest(
+            request.headers.get('Authorization', ''), f'Bearer {token}')
+
+    def get(self, request, *args, **kwargs):
+        if not self.has_access(request):
+            raise Http404
+        return HttpResponse(render_metrics(collect_histograms()),
+                            content_type='text/plain; version=0.0.4')
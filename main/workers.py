@@ -0,0 +1,48 @@
+"""
+Module workers
+
+Tasks run in the spawned worker processes of main.models.batch.  A spawned
+worker imports this module to unpickle its initializer and tasks before Django
+is set up, so nothing here imports models at the top level: the initializer
+sets up Django and the tasks import models when they run.
+"""
+import os
+from time import perf_counter
+
+
+def init_worker(settings_module, db_name):
+    """
+    Set up Django in a worker, connecting to the parent's database (which is
+    the test database under the test runner)
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+    from django.db import connections
+    connections['default'].settings_dict['NAME'] = db_name
+
+
+def recompute_budget(farm_year_id):
+    """ Compute and store the current budget for a farm year """
+    from main.models.budget_table import BudgetManager
+    from main.models.farm_year import FarmYear
+    BudgetManager(FarmYear.objects.get(pk=farm_year_id)).calc_current_budget()
+
+
+def recompute_farm_year(farm_year_id):
+    """
+    Compute and store the current budget and sensitivity data for a farm year.
+    Returns (farm_year_id, seconds, error), where error is None on success.
+    """
+    from main.models.budget_table import BudgetManager
+    from main.models.farm_year import FarmYear
+    from main.models.sens_table import SensTableGroup
+    start = perf_counter()
+    try:
+        farm_year = FarmYear.objects.get(pk=farm_year_id)
+        BudgetManager(farm_year).calc_current_budget()
+        SensTableGroup(farm_year).get_cashflow_farm()
+        error = None
+    except Exception as ex:
+        error = f'{type(ex).__name__}: {ex}'
+    return farm_year_id, perf_counter() - start, error